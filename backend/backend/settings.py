@@ -9,9 +9,11 @@ https://docs.djangoproject.com/en/4.1/topics/settings/
 For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.1/ref/settings/
 """
-
+import os
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -19,11 +21,24 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/4.1/howto/deployment/checklist/
 
+# "development" for `manage.py runserver`, "production" for `run.sh` under
+# uvicorn with several workers.
+PROFILE = os.environ.get("BACKEND_PROFILE", "development")
+
+PRODUCTION = PROFILE == "production"
+
 # SECURITY WARNING: keep the secret key used in production secret!
-SECRET_KEY = "django-insecure-k+tuhy#779c*jd@30_$9_e&is(lq%n%xx3w5o)#k=-no_qs3jx"
+SECRET_KEY = os.environ.get(
+    "DJANGO_SECRET_KEY",
+    "django-insecure-k+tuhy#779c*jd@30_$9_e&is(lq%n%xx3w5o)#k=-no_qs3jx",
+)
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+# Debug mode also records every SQL query of a request in memory.
+DEBUG = not PRODUCTION
+
+# Route the hot endpoints to their `async_views` versions, for ASGI servers.
+ASYNC_VIEWS = PRODUCTION
 
 # https://developer.android.com/studio/run/emulator-networking#networkaddresses
 # Allow physical device which could be from anywhere.
@@ -45,6 +60,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "telemetry.middleware.request_metrics",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -78,12 +94,52 @@ WSGI_APPLICATION = "backend.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/4.1/ref/settings/#databases
 
-DATABASES = {
-    "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
+# "sqlite" or "postgres". Check the configured database with
+# `python3 manage.py checkdb`.
+DATABASE_ENGINE = os.environ.get("DATABASE_ENGINE", "sqlite")
+
+if DATABASE_ENGINE == "postgres":
+    # Needs `psycopg`, and `psycopg[pool]` with `POSTGRES_POOL_SIZE`.
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.postgresql",
+            "NAME": os.environ.get("POSTGRES_DB", "backend"),
+            "USER": os.environ.get("POSTGRES_USER", "postgres"),
+            "PASSWORD": os.environ.get("POSTGRES_PASSWORD", ""),
+            "HOST": os.environ.get("POSTGRES_HOST", "localhost"),
+            "PORT": os.environ.get("POSTGRES_PORT", "5432"),
+            "CONN_HEALTH_CHECKS": True,
+        }
     }
-}
+    POSTGRES_POOL_SIZE = int(os.environ.get("POSTGRES_POOL_SIZE", 0))
+    if POSTGRES_POOL_SIZE:
+        # Django's psycopg pool does not support persistent connections.
+        DATABASES["default"]["OPTIONS"] = {
+            "pool": {"min_size": 1, "max_size": POSTGRES_POOL_SIZE, "timeout": 10}
+        }
+    else:
+        DATABASES["default"]["CONN_MAX_AGE"] = int(
+            os.environ.get("POSTGRES_CONN_MAX_AGE", 600)
+        )
+elif DATABASE_ENGINE == "sqlite":
+    # WAL lets telemetry reads and the parameter saver proceed while another
+    # connection writes; writers wait up to `timeout` seconds for the lock
+    # instead of failing with "database is locked". IMMEDIATE transactions
+    # take the write lock up front, so they cannot deadlock upgrading.
+    # synchronous=NORMAL is durable across crashes of the process in WAL mode.
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": os.environ.get("SQLITE_PATH", BASE_DIR / "db.sqlite3"),
+            "OPTIONS": {
+                "timeout": float(os.environ.get("SQLITE_TIMEOUT", 20)),
+                "transaction_mode": "IMMEDIATE",
+                "init_command": "PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL;",
+            },
+        }
+    }
+else:
+    raise ImproperlyConfigured(f"Unknown DATABASE_ENGINE `{DATABASE_ENGINE}`.")
 
 
 # Password validation
@@ -120,11 +176,55 @@ USE_TZ = False
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/4.1/howto/static-files/
 
-STATIC_URL = "static/"
+# `static/` itself is for model files served by `train.views.model_file`.
+STATIC_URL = "static/django/"
 
-STATICFILES_DIRS = [
-    BASE_DIR / "static",
-]
+# TFLite model files, `TFLiteModel.file_path` is `/static/<name>`.
+MODEL_FILES_DIR = BASE_DIR / "static"
+
+# Partially received chunked uploads of model files.
+UPLOADS_DIR = BASE_DIR / "uploads"
+
+# Seconds to cache the model advertised for each data type.
+ADVERTISED_CACHE_TIMEOUT = 60
+
+# Shared by all backend workers on this host, so that a model upload clears the
+# advertised model of every worker. Point `CACHE_DIR` at a shared volume, or use
+# a networked cache backend, if workers run on several hosts.
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": os.environ.get("CACHE_DIR", BASE_DIR / "cache"),
+    }
+}
+
+# Write-behind buffer for single telemetry records, see `telemetry.buffer`.
+# Records are inserted in bulk once `TELEMETRY_FLUSH_SIZE` are queued or
+# `TELEMETRY_FLUSH_INTERVAL` seconds passed. With the buffer at
+# `TELEMETRY_BUFFER_SIZE`, requests wait `TELEMETRY_PUT_TIMEOUT` seconds
+# and then get 503.
+TELEMETRY_WRITE_BEHIND = True
+
+TELEMETRY_BUFFER_SIZE = 10000
+
+TELEMETRY_FLUSH_SIZE = 500
+
+TELEMETRY_FLUSH_INTERVAL = 1.0
+
+TELEMETRY_PUT_TIMEOUT = 0.1
+
+# Model parameter snapshots stored by `train.store`.
+PARAMS_STORE_DIR = Path(os.environ.get("PARAMS_STORE_DIR", BASE_DIR / "params"))
+
+# Checkpoint encoding of model parameter history, see `train.checkpoint`.
+# A full snapshot is stored every `PARAMS_BASE_EVERY` rounds and deltas in
+# `PARAMS_DELTA_ENCODING` in between; 1 stores only full snapshots.
+# Deltas off by more than `PARAMS_DELTA_TOLERANCE` are stored in full instead.
+PARAMS_BASE_EVERY = 1
+
+PARAMS_DELTA_ENCODING = "xor"
+
+PARAMS_DELTA_TOLERANCE = 1e-4
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.1/ref/settings/#default-auto-field
@@ -138,3 +238,55 @@ REST_FRAMEWORK = {
         "rest_framework.permissions.DjangoModelPermissionsOrAnonReadOnly",
     ]
 }
+
+# Flower servers spawned by `train.scheduler`.
+# At most `FLOWER_SERVER_CAPACITY` servers run concurrently, one per model,
+# each listening on a free port from `FLOWER_PORTS`.
+FLOWER_SERVER_CAPACITY = 4
+
+FLOWER_PORTS = range(8080, 8090)
+
+# Running servers are shared by all backend workers as `train.models.ServerLease`
+# rows. The worker running a server renews its lease for this many seconds;
+# leases of dead workers expire and free their model and port.
+FLOWER_LEASE_SECONDS = 30
+
+# Flower server processes are started with this `multiprocessing` start method.
+# "forkserver" forks them from a clean process with flwr imported, unlike
+# "fork", which copies the threads and connections of the backend worker.
+FLOWER_START_METHOD = os.environ.get("FLOWER_START_METHOD", "forkserver")
+
+# Idle Flower server processes each backend worker keeps started, so that a new
+# session only hands its model over, see `train.scheduler.WarmPool`.
+FLOWER_WARM_SERVERS = int(os.environ.get("FLOWER_WARM_SERVERS", 1))
+
+# `train/server` answers for a new server once its port accepts connections,
+# or after this many seconds.
+FLOWER_READY_TIMEOUT = 10.0
+
+# Each Flower server reports the clients connected to it every
+# `FLOWER_HEARTBEAT_INTERVAL` seconds. `train.scheduler.Server` saves the latest
+# params and stops a server once no client was connected for
+# `FLOWER_IDLE_TIMEOUT` seconds, no round finished for `FLOWER_ROUND_TIMEOUT`
+# seconds, or its session, resumed or not, started `FLOWER_MAX_SESSION_SECONDS`
+# ago, freeing its slot and port.
+FLOWER_HEARTBEAT_INTERVAL = 5.0
+
+FLOWER_IDLE_TIMEOUT = float(os.environ.get("FLOWER_IDLE_TIMEOUT", 10 * 60))
+
+FLOWER_ROUND_TIMEOUT = float(os.environ.get("FLOWER_ROUND_TIMEOUT", 60 * 60))
+
+FLOWER_MAX_SESSION_SECONDS = float(
+    os.environ.get("FLOWER_MAX_SESSION_SECONDS", 12 * 60 * 60)
+)
+
+# Each backend worker writes its Prometheus metrics to its own file here,
+# summed over all files by `telemetry.metrics.render`. Clear it before
+# starting the server, as `run.sh` does.
+METRICS_DIR = Path(os.environ.get("METRICS_DIR", BASE_DIR / "metrics"))
+
+METRICS_WRITE_INTERVAL = 1.0
+
+# Threads each Flower server aggregates layers on, see `train.aggregate`.
+# Results do not depend on it.
+AGGREGATION_WORKERS = int(os.environ.get("AGGREGATION_WORKERS", os.cpu_count() or 1))
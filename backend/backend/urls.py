@@ -16,6 +16,8 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import include, path
 from rest_framework import routers
+from telemetry.views import metrics_text
+from train.views import model_file
 
 router = routers.DefaultRouter()
 
@@ -25,4 +27,6 @@ urlpatterns = [
     path("api-auth/", include("rest_framework.urls", namespace="rest_framework")),
     path("train/", include("train.urls")),
     path("telemetry/", include("telemetry.urls")),
+    path("static/<path:name>", model_file),
+    path("metrics", metrics_text),
 ]
@@ -6,11 +6,18 @@ It exposes the WSGI callable as a module-level variable named ``application``.
 For more information on this file, see
 https://docs.djangoproject.com/en/4.1/howto/deployment/wsgi/
 """
-
 import os
+from threading import Thread
 
 from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
 
 application = get_wsgi_application()
+
+from train.scheduler import pool  # noqa: E402
+
+# Start warm Flower server processes before the first session asks for one.
+pool.warm.refill()
+# Resume sessions left by the previous workers, see `ServerPool.resume`.
+Thread(target=pool.watch, daemon=True).start()
@@ -0,0 +1,103 @@
+"""Benchmark layer-parallel aggregation in `train.aggregate` against workers.
+
+Run from `backend/`:
+
+```sh
+python3 -m benchmarks.aggregate
+```
+
+Times `weighted_average`, `running_average`, as `train.run` averages, and
+`coordinate_median` on random client weights,
+for several client counts and models, with 1 worker and up to one per CPU,
+and checks that every worker count gives bit-for-bit the same result."""
+import os
+from timeit import repeat
+
+import numpy as np
+from flwr.common import NDArrays
+from train.aggregate import (
+    LayerPool,
+    RunningWeightedAverage,
+    coordinate_median,
+    weighted_average,
+)
+
+from benchmarks.params import CIFAR10_SIZES
+
+# Trainable weights of `gen_tflite/fed_mcrnn_eg` in bytes: three Conv1D and
+# BatchNormalization blocks, a Dense, three LSTM and the output Dense.
+FED_MCRNN_SIZES = [
+    *[672, 28, 28, 28],
+    *[588, 28, 28, 28] * 2,
+    *[1568, 224],
+    *[6272, 784, 112],
+    *[784, 784, 112] * 2,
+    *[196, 4],
+]
+
+# Many large layers, where sharding pays off most.
+DEEP_SIZES = [1 << 19] * 16
+
+MODELS = {"FedMCRNN": FED_MCRNN_SIZES, "CIFAR10": CIFAR10_SIZES, "deep": DEEP_SIZES}
+CLIENTS = [4, 16, 64]
+REPEAT = 3
+
+
+def random_results(sizes: list[int], n_clients: int) -> list[tuple[NDArrays, int]]:
+    rng = np.random.default_rng(0)
+    return [
+        (
+            [rng.standard_normal(size // 4, dtype=np.float32) for size in sizes],
+            int(rng.integers(1, 1000)),
+        )
+        for _ in range(n_clients)
+    ]
+
+
+def running_average(results: list[tuple[NDArrays, int]], pool: LayerPool) -> NDArrays:
+    """`weighted_average` adding one client at a time."""
+    average = RunningWeightedAverage(pool)
+    for weights, num_examples in results:
+        average.add(weights, num_examples)
+    return average.result()
+
+
+def best_ms(fn) -> float:
+    return min(repeat(fn, repeat=REPEAT, number=1)) * 1e3
+
+
+def same(a: NDArrays, b: NDArrays) -> bool:
+    return all(x.tobytes() == y.tobytes() for x, y in zip(a, b, strict=True))
+
+
+def main():
+    cpus = os.cpu_count() or 1
+    workers = sorted({1, 2, cpus})
+    pools = {count: LayerPool(count) for count in workers}
+    print(f"{cpus} CPUs, workers {workers}.")
+    for aggregate in (weighted_average, running_average, coordinate_median):
+        for name, sizes in MODELS.items():
+            for n_clients in CLIENTS:
+                if aggregate is coordinate_median and name == "deep" and n_clients > 16:
+                    continue
+                results = random_results(sizes, n_clients)
+                serial = aggregate(results, pool=pools[1])
+                if aggregate is running_average:
+                    assert same(serial, weighted_average(results))
+                times = []
+                for count, pool in pools.items():
+                    assert same(aggregate(results, pool=pool), serial), count
+                    times.append(best_ms(lambda: aggregate(results, pool=pool)))
+                speedups = ", ".join(
+                    f"{count}: {times[0] / time:.2f}x"
+                    for count, time in zip(workers[1:], times[1:])
+                )
+                print(
+                    f"{aggregate.__name__} {name} ({len(sizes)} layers), "
+                    f"{n_clients} clients: {times[0]:.1f} ms serial; {speedups}."
+                )
+    for pool in pools.values():
+        pool.shutdown()
+
+
+main() if __name__ == "__main__" else None
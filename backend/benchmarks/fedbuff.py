@@ -0,0 +1,80 @@
+"""Compare synchronous rounds with asynchronous buffered aggregation.
+
+Run from `backend/`:
+
+```sh
+python3 -m benchmarks.fedbuff
+```
+
+Simulated in-process clients, see `train.simulation`, with heterogeneous
+latencies train the CIFAR10 layers sizes for the same number of updates
+to the global weights, without evaluation, under `flwr.server.Server` and `train.fedbuff.AsyncServer`.
+"""
+from logging import WARNING, getLogger
+
+from flwr.server import Server
+from train.data import TrainingConfig
+from train.fedbuff import AsyncServer
+from train.run import FedAvgAndroidSave
+from train.simulation import simulated_clients
+
+from benchmarks.params import CIFAR10_SIZES
+
+# One straggler among fast phones.
+LATENCIES = [0.05, 0.05, 0.1, 0.1, 0.15, 0.2, 0.3, 1.0]
+BUFFER_SIZE = 3
+NUM_ROUNDS = 6
+
+
+class FedAvgNoSave(FedAvgAndroidSave):
+    def signal_save_params(self, params, server_round: int):
+        pass
+
+
+def strategy() -> FedAvgNoSave:
+    return FedAvgNoSave(
+        fraction_evaluate=0.0,
+        min_fit_clients=len(LATENCIES),
+        min_evaluate_clients=len(LATENCIES),
+        min_available_clients=len(LATENCIES),
+        on_fit_config_fn=TrainingConfig().fit_config,
+        session_id=0,
+        max_norm_ratio=None,
+    )
+
+
+def final_loss(server: Server) -> float:
+    """Evaluate on all clients, outside of the timed `fit`."""
+    server.strategy.fraction_evaluate = 1.0  # type: ignore
+    loss, _, _ = server.evaluate_round(NUM_ROUNDS, timeout=None)  # type: ignore
+    return loss
+
+
+def main():
+    getLogger("flwr").setLevel(WARNING)
+    sync = Server(
+        client_manager=simulated_clients(CIFAR10_SIZES, LATENCIES),
+        strategy=strategy(),
+    )
+    _, sync_elapsed = sync.fit(NUM_ROUNDS, timeout=None)
+    sync_loss = final_loss(sync)
+    print(
+        f"sync: {NUM_ROUNDS} rounds in {sync_elapsed:.2f}s, "
+        f"{sync_elapsed / NUM_ROUNDS:.3f}s per round, loss {sync_loss:.4f}."
+    )
+    asynchronous = AsyncServer(
+        client_manager=simulated_clients(CIFAR10_SIZES, LATENCIES),
+        strategy=strategy(),
+        buffer_size=BUFFER_SIZE,
+    )
+    history, async_elapsed = asynchronous.fit(NUM_ROUNDS, timeout=None)
+    async_loss = final_loss(asynchronous)
+    staleness = [metrics[1] for metrics in history.metrics_distributed_fit["staleness"]]
+    print(
+        f"async, buffer {BUFFER_SIZE}: {NUM_ROUNDS} versions in {async_elapsed:.2f}s, "
+        f"{async_elapsed / NUM_ROUNDS:.3f}s per version, loss {async_loss:.4f}, "
+        f"staleness per version {[round(value, 2) for value in staleness]}."
+    )
+
+
+main() if __name__ == "__main__" else None
@@ -0,0 +1,152 @@
+"""Requests per second of the hot endpoints, development against production
+serving, on the loopback.
+
+Run from `backend/`:
+
+```sh
+python3 -m benchmarks.load
+```
+
+Each server runs on a fresh migrated SQLite database seeded by `seed.py`,
+in a temporary directory. `CONCURRENCY` threads, each with its own
+keep-alive connection, send `advertised` and `fit_ins` requests for
+`DURATION` seconds per endpoint.
+"""
+import http.client
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from statistics import quantiles
+from tempfile import TemporaryDirectory
+
+HOST = "127.0.0.1"
+PORT = 8765
+CONCURRENCY = 32
+DURATION = 5.0
+WORKERS = os.cpu_count() or 1
+
+ENDPOINTS = {
+    "advertised": ("/train/advertised", {"data_type": "CIFAR10_32x32x3"}),
+    "fit_ins": (
+        "/telemetry/fit_ins",
+        {"device_id": 1, "session_id": 1, "start": 1000, "end": 2000},
+    ),
+}
+
+SERVERS = {
+    "runserver": (
+        [sys.executable, "manage.py", "runserver", "--noreload", f"{HOST}:{PORT}"],
+        {"BACKEND_PROFILE": "development"},
+    ),
+    f"uvicorn x{WORKERS}": (
+        [sys.executable, "-m", "uvicorn", "backend.asgi:application"]
+        + ["--host", HOST, "--port", str(PORT), "--workers", str(WORKERS)]
+        + ["--log-level", "warning", "--no-access-log"],
+        {"BACKEND_PROFILE": "production"},
+    ),
+}
+
+SESSION = """
+from telemetry.models import TrainingSession
+from train.models import TFLiteModel
+TrainingSession.objects.create(tflite_model=TFLiteModel.objects.get(pk=1))
+"""
+
+
+def prepare_database(env: dict[str, str]):
+    manage = [sys.executable, "manage.py"]
+    quiet = {"stdout": subprocess.DEVNULL, "check": True, "env": env}
+    subprocess.run(manage + ["migrate"], **quiet)
+    with open("seed.py", "rb") as seed:
+        subprocess.run(manage + ["shell"], stdin=seed, **quiet)
+    subprocess.run(manage + ["shell", "-c", SESSION], **quiet)
+
+
+def wait_until_up(timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            http.client.HTTPConnection(HOST, PORT, timeout=1).connect()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise TimeoutError(f"Server on port {PORT} did not start.")
+
+
+def hammer(path: str, body: bytes, until: float) -> tuple[list[float], int]:
+    """Send requests on one connection until `until`, reconnecting after
+    connection errors. Return latencies and the number of errors."""
+    connection = http.client.HTTPConnection(HOST, PORT, timeout=30)
+    headers = {"Content-Type": "application/json"}
+    latencies = []
+    errors = 0
+    while time.monotonic() < until:
+        start = time.perf_counter()
+        try:
+            connection.request("POST", path, body, headers)
+            response = connection.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException):
+            errors += 1
+            connection.close()
+            continue
+        if response.status != 200:
+            raise RuntimeError(f"{path}: {response.status}")
+        latencies.append(time.perf_counter() - start)
+    connection.close()
+    return latencies, errors
+
+
+def measure(path: str, data: dict) -> tuple[float, float, float, int]:
+    """Requests per second, median and 99th percentile latency in ms,
+    and connection errors."""
+    body = json.dumps(data).encode()
+    until = time.monotonic() + DURATION
+    with ThreadPoolExecutor(CONCURRENCY) as executor:
+        futures = [
+            executor.submit(hammer, path, body, until) for _ in range(CONCURRENCY)
+        ]
+        results = [future.result() for future in futures]
+    latencies = [latency for latencies, _ in results for latency in latencies]
+    errors = sum(errors for _, errors in results)
+    percentiles = quantiles(latencies, n=100)
+    return (
+        len(latencies) / DURATION,
+        percentiles[49] * 1e3,
+        percentiles[98] * 1e3,
+        errors,
+    )
+
+
+def main():
+    print(f"{CONCURRENCY} connections, {DURATION}s per endpoint.")
+    print(
+        f"{'server':<14}{'endpoint':<12}"
+        f"{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'errors':>8}"
+    )
+    for name, (command, profile) in SERVERS.items():
+        with TemporaryDirectory() as directory:
+            env = {**os.environ, **profile}
+            env["SQLITE_PATH"] = os.path.join(directory, "db.sqlite3")
+            prepare_database(env)
+            server = subprocess.Popen(
+                command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+            )
+            try:
+                wait_until_up()
+                for endpoint, (path, data) in ENDPOINTS.items():
+                    rps, p50, p99, errors = measure(path, data)
+                    print(
+                        f"{name:<14}{endpoint:<12}"
+                        f"{rps:>10.0f}{p50:>10.2f}{p99:>10.2f}{errors:>8}"
+                    )
+            finally:
+                server.terminate()
+                server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""Benchmark the flat parameter format in `train.params` against pickle.
+
+Run from `backend/`:
+
+```sh
+python3 -m benchmarks.params
+```
+
+Both paths go from aggregated ndarrays to stored bytes and back to flwr
+`Parameters`, as `signal_save_params` and `scheduler.model_params` do."""
+import pickle
+from timeit import repeat
+
+import numpy as np
+from flwr.common import Parameters
+from train.params import decode_params, encode_params, params_to_tensors
+
+# Layer sizes in bytes of the CIFAR10 model in `seed.py`.
+CIFAR10_SIZES = [1800, 24, 9600, 64, 768000, 480, 40320, 336, 3360, 40]
+
+REPEAT = 7
+NUMBER = 200
+
+
+def pickle_path(params):
+    stored = pickle.dumps(params)
+    tensors = [param.tobytes() for param in pickle.loads(stored)]
+    return Parameters(tensors, tensor_type="numpy.ndarray")
+
+
+def flat_path(params):
+    stored = encode_params(params)
+    decode_params(stored, CIFAR10_SIZES)
+    return params_to_tensors(stored, CIFAR10_SIZES)
+
+
+def best_us(fn, params) -> float:
+    times = repeat(lambda: fn(params), repeat=REPEAT, number=NUMBER)
+    return min(times) / NUMBER * 1e6
+
+
+def main():
+    rng = np.random.default_rng(0)
+    params = [rng.random(size // 4, dtype=np.float32) for size in CIFAR10_SIZES]
+    assert pickle_path(params).tensors == flat_path(params).tensors
+    print(f"Model of {sum(CIFAR10_SIZES)} bytes in {len(CIFAR10_SIZES)} layers.")
+    print(f"pickle stored size: {len(pickle.dumps(params))} bytes.")
+    print(f"flat stored size: {len(encode_params(params))} bytes.")
+    pickled = best_us(pickle_path, params)
+    flat = best_us(flat_path, params)
+    print(f"pickle: {pickled:.1f} µs, flat: {flat:.1f} µs, {pickled / flat:.2f}x.")
+    flat_stored = encode_params(params)
+    pickle_stored = pickle.dumps(params)
+    decode = best_us(lambda stored: decode_params(stored, CIFAR10_SIZES), flat_stored)
+    loads = best_us(pickle.loads, pickle_stored)
+    print(f"decode only, pickle: {loads:.1f} µs, flat views: {decode:.1f} µs.")
+
+
+main() if __name__ == "__main__" else None
@@ -0,0 +1,197 @@
+"""Run Flower training sessions against simulated clients in subprocesses.
+
+Run from `backend/`:
+
+```sh
+python3 -m benchmarks.simulation
+python3 -m benchmarks.simulation --model FedMCRNN --clients 8 --rounds 5
+```
+
+Each scenario requests a server from `train.scheduler`, which launches
+`flwr_server` with `FedAvgAndroidSave` in its own process, as for phones.
+Every client is a `train.simulation.SimulatedClient` in its own process,
+connected over gRPC on the loopback, with synthetic weights laid out as the
+model's `layers_sizes`. The backend runs on a fresh migrated SQLite database
+and params store in a temporary directory.
+
+Reported per scenario: how long requesting the server took, until it accepted
+connections, the wall time of each round, the first including server
+start and client connections, the server's time in each
+phase of `aggregate_fit` and to save params, the clients' mean time to fit
+and evaluate, and the bytes of parameters moved down to and up from clients.
+In-process clients without gRPC are in `benchmarks.fedbuff`."""
+import argparse
+import os
+import sys
+from dataclasses import dataclass
+from logging import ERROR, getLogger
+from multiprocessing import Process, Queue
+from statistics import mean
+from tempfile import TemporaryDirectory
+from time import time
+
+from benchmarks.aggregate import FED_MCRNN_SIZES
+from benchmarks.params import CIFAR10_SIZES
+
+MODELS = {"CIFAR10": CIFAR10_SIZES, "FedMCRNN": FED_MCRNN_SIZES}
+
+
+@dataclass
+class Scenario:
+    model: str
+    clients: int
+    rounds: int = 3
+    latency: float = 0.0
+    """Seconds each simulated client takes to fit or evaluate."""
+    compression: str | None = None
+
+    def __str__(self) -> str:
+        compression = f", {self.compression}" if self.compression else ""
+        return (
+            f"{self.model}, {self.clients} clients, {self.rounds} rounds, "
+            f"latency {self.latency}s{compression}"
+        )
+
+
+SUITE = [
+    Scenario("FedMCRNN", 4),
+    Scenario("CIFAR10", 2),
+    Scenario("CIFAR10", 4),
+    Scenario("CIFAR10", 8),
+    Scenario("CIFAR10", 8, compression="int8"),
+]
+
+SESSION_TIMEOUT = 300.0
+
+
+def setup_backend(directory: str):
+    """Configure Django on a fresh database and params store in `directory`."""
+    os.environ["SQLITE_PATH"] = os.path.join(directory, "db.sqlite3")
+    os.environ["PARAMS_STORE_DIR"] = os.path.join(directory, "params")
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
+    import django
+    from django.core.management import call_command
+
+    django.setup()
+    call_command("migrate", interactive=False, verbosity=0)
+    from train.scheduler import pool
+
+    # As `backend.asgi` does for served workers.
+    pool.warm.refill()
+
+
+def run(scenario: Scenario) -> dict:
+    """Train a session of `scenario` and collect its timings and bytes."""
+    from train import scheduler
+    from train.data import TrainingConfig
+    from train.models import TFLiteModel, TrainingDataType
+    from train.simulation import run_client, simulated_proxies
+
+    sizes = MODELS[scenario.model]
+    data_type, _ = TrainingDataType.objects.get_or_create(name=scenario.model)
+    model = TFLiteModel.objects.create(
+        name=f"{scenario.model} simulation",
+        file_path="/static/simulation.tflite",
+        layers_sizes=sizes,
+        data_type=data_type,
+    )
+    config = TrainingConfig(
+        num_rounds=scenario.rounds,
+        min_fit_clients=scenario.clients,
+        min_evaluate_clients=scenario.clients,
+        min_available_clients=scenario.clients,
+        compression=scenario.compression,
+    )
+    started_at = time()
+    status = scheduler.server(model, start_fresh=True, config=config)
+    ready_at = time()
+    if status.status != "new":
+        raise RuntimeError(f"No server for the simulation: {status}.")
+    task = scheduler.pool.servers[status.session_id]  # type: ignore
+    phases_queue = Queue()
+    clients = [
+        Process(
+            target=run_client,
+            args=(f"127.0.0.1:{status.port}", proxy, phases_queue),
+        )
+        for proxy in simulated_proxies(sizes, [scenario.latency] * scenario.clients)
+    ]
+    for client in clients:
+        client.start()
+    phases = dict(phases_queue.get(timeout=SESSION_TIMEOUT) for _ in clients)
+    for client in clients:
+        client.join()
+    task.process.join(SESSION_TIMEOUT)
+    task.supervisor.join(SESSION_TIMEOUT)
+    model.delete()
+    return {
+        "started_at": started_at,
+        "ready_seconds": ready_at - started_at,
+        "rounds": task.round_timings,
+        "phases": [phase for client in phases.values() for phase in client],
+    }
+
+
+def report(scenario: Scenario, result: dict):
+    rounds = result["rounds"]
+    finished = [
+        rounds[server_round]["aggregated_at"] for server_round in sorted(rounds)
+    ]
+    walls = [
+        end - start for start, end in zip([result["started_at"], *finished], finished)
+    ]
+    print(f"{scenario}:")
+    print(f"  server accepting connections after {result['ready_seconds']:.3f}s")
+    if len(rounds) < scenario.rounds:
+        print(f"  only {len(rounds)} of {scenario.rounds} rounds finished.")
+    print(f"  round wall time (s): {', '.join(f'{wall:.3f}' for wall in walls)}")
+    if rounds:
+        server_phases = {
+            phase: mean(timings[phase] for timings in rounds.values()) * 1e3
+            for phase in next(iter(rounds.values()))
+            if phase != "aggregated_at"
+        }
+        means = ", ".join(f"{phase} {ms:.2f}" for phase, ms in server_phases.items())
+        print(f"  server mean (ms): {means}")
+    phases = result["phases"]
+    for kind in ("fit", "evaluate"):
+        seconds = [phase.seconds for phase in phases if phase.kind == kind]
+        if seconds:
+            ms = mean(seconds) * 1e3
+            print(f"  client {kind} mean (ms): {ms:.2f} over {len(seconds)}")
+    down = sum(phase.bytes_received for phase in phases)
+    up = sum(phase.bytes_sent for phase in phases)
+    print(f"  parameters moved: {down} bytes down, {up} bytes up")
+
+
+def parse_scenarios() -> list[Scenario]:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--model", choices=MODELS)
+    parser.add_argument("--clients", type=int, default=4)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--compression")
+    parser.add_argument("--repeat", type=int, default=1)
+    args = parser.parse_args()
+    scenarios = SUITE
+    if args.model is not None:
+        scenarios = [
+            Scenario(
+                args.model, args.clients, args.rounds, args.latency, args.compression
+            )
+        ]
+    return scenarios * args.repeat
+
+
+def main():
+    scenarios = parse_scenarios()
+    with TemporaryDirectory() as directory:
+        setup_backend(directory)
+        # Silence deprecation warnings of `start_server` and `start_client`.
+        getLogger("flwr").setLevel(ERROR)
+        for scenario in scenarios:
+            report(scenario, run(scenario))
+            sys.stdout.flush()
+
+
+main() if __name__ == "__main__" else None
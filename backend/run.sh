@@ -10,5 +10,13 @@ else
     echo "-- Not first container startup, skipping initialization --"
 fi
 # run the server
-echo "-- Starting development server --"
-python3 /app/manage.py runserver 0.0.0.0:8000
+# Metrics files of the previous workers, see `telemetry.metrics`.
+rm -rf "${METRICS_DIR:-/app/metrics}"
+if [ "$BACKEND_PROFILE" = "production" ]; then
+    echo "-- Starting production server with ${WEB_CONCURRENCY:-$(nproc)} workers --"
+    exec python3 -m uvicorn backend.asgi:application --app-dir /app \
+        --host 0.0.0.0 --port 8000 --workers "${WEB_CONCURRENCY:-$(nproc)}"
+else
+    echo "-- Starting development server --"
+    python3 /app/manage.py runserver 0.0.0.0:8000
+fi
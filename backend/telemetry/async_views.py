@@ -0,0 +1,85 @@
+"""Async versions of the `telemetry.views` endpoints, used when
+`ASYNC_VIEWS` is set. See `train.async_views`."""
+import json
+import logging
+from io import BytesIO
+from queue import Full
+
+from asgiref.sync import sync_to_async
+from django.http import HttpRequest
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from rest_framework.exceptions import ParseError
+from telemetry.buffer import telemetry_buffer
+from telemetry.parsers import NDJSONParser
+from telemetry.serializers import *
+from telemetry.views import save_batch
+from train.async_views import json_body, json_response
+
+from backend.settings import TELEMETRY_WRITE_BEHIND
+
+logger = logging.getLogger(__name__)
+
+
+async def save_serializer_and_respond(serializer):
+    if not serializer.is_valid():
+        logger.error(serializer.errors)
+    elif TELEMETRY_WRITE_BEHIND:
+        put = sync_to_async(telemetry_buffer.put, thread_sensitive=False)
+        try:
+            await put(serializer.Meta.model, serializer.validated_data)
+        except Full:
+            logger.error("Telemetry buffer full, rejecting record.")
+            response = json_response("Telemetry buffer full.", 503)
+            response["Retry-After"] = "1"
+            return response
+    else:
+        await sync_to_async(serializer.save)()
+    return json_response("")
+
+
+@csrf_exempt
+@require_POST
+async def fit_ins(request: HttpRequest):
+    serializer = FitInsTelemetryDataSerializer(data=json_body(request))  # type: ignore
+    return await save_serializer_and_respond(serializer)
+
+
+@csrf_exempt
+@require_POST
+async def evaluate_ins(request: HttpRequest):
+    serializer = EvaluateInsTelemetryDataSerializer(data=json_body(request))  # type: ignore
+    return await save_serializer_and_respond(serializer)
+
+
+def records_in_body(request: HttpRequest):
+    if request.content_type == NDJSONParser.media_type:
+        return NDJSONParser().parse(BytesIO(request.body))
+    return json.loads(request.body)
+
+
+async def save_batch_and_respond(serializer_class, model, request: HttpRequest):
+    try:
+        records = records_in_body(request)
+    except (ParseError, ValueError) as err:
+        return json_response(str(err), 400)
+    result = await sync_to_async(save_batch)(serializer_class, model, records)
+    if result is None:
+        return json_response("Expected a list of records.", 400)
+    return json_response(result)
+
+
+@csrf_exempt
+@require_POST
+async def fit_ins_batch(request: HttpRequest):
+    return await save_batch_and_respond(
+        FitInsTelemetryDataSerializer, FitInsTelemetryData, request
+    )
+
+
+@csrf_exempt
+@require_POST
+async def evaluate_ins_batch(request: HttpRequest):
+    return await save_batch_and_respond(
+        EvaluateInsTelemetryDataSerializer, EvaluateInsTelemetryData, request
+    )
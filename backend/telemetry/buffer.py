@@ -0,0 +1,192 @@
+"""Write-behind buffer for telemetry records.
+
+Endpoints put validated records into a bounded in-process queue and return
+without touching the database.
+A background thread inserts them in bulk, one transaction per model and flush,
+once `flush_size` records are queued or `flush_interval` seconds passed,
+and on shutdown. A failed flush is retried `FLUSH_ATTEMPTS` times before its
+records are dropped, unless the database rejects some records: then the
+batch is split in halves down to those records, which alone are dropped.
+When the queue is full, `put` waits up to `put_timeout` seconds and then
+fails, so callers can push back on clients."""
+from logging import getLogger
+from multiprocessing.util import Finalize
+from queue import Empty, Full, Queue
+from threading import Lock, Thread
+from time import monotonic, perf_counter, sleep
+
+from django.db import DataError, IntegrityError, connection, models, transaction
+from telemetry.models import TrainingSession
+from telemetry.rollup import save_records
+
+from backend.settings import (
+    TELEMETRY_BUFFER_SIZE,
+    TELEMETRY_FLUSH_INTERVAL,
+    TELEMETRY_FLUSH_SIZE,
+    TELEMETRY_PUT_TIMEOUT,
+)
+
+logger = getLogger(__name__)
+
+FLUSH_ATTEMPTS = 3
+
+FLUSH_RETRY_DELAY = 1.0
+"""Seconds before the first retry of a failed flush, growing linearly."""
+
+
+class WriteBehindBuffer:
+    def __init__(
+        self,
+        max_size: int,
+        flush_size: int,
+        flush_interval: float,
+        put_timeout: float,
+    ) -> None:
+        self.queue: Queue[tuple[type[models.Model], dict] | None] = Queue(max_size)
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self.thread: Thread | None = None
+        self.lock = Lock()
+        self.enqueued = 0
+        self.rejected = 0
+        self.written = 0
+        self.dropped = 0
+        """Records whose session does not exist or that failed to flush."""
+        self.flushes = 0
+        self.last_flush_seconds = 0.0
+        self.max_flush_seconds = 0.0
+        self.total_flush_seconds = 0.0
+
+    def put(self, model: type[models.Model], validated_data: dict):
+        """Queue a record of `model` whose `session_id` is still an id.
+        Raise `queue.Full` if the buffer stays full for `put_timeout`."""
+        self.start()
+        try:
+            self.queue.put((model, validated_data), timeout=self.put_timeout)
+        except Full:
+            self.rejected += 1
+            raise
+        self.enqueued += 1
+
+    def start(self):
+        with self.lock:
+            if self.thread is None:
+                self.thread = Thread(target=self.run, daemon=True)
+                self.thread.start()
+                # Unlike `atexit`, also at exit of multiprocessing children
+                # such as uvicorn workers.
+                Finalize(self, self.stop, exitpriority=0)
+
+    def stop(self):
+        """Flush all queued records and stop the background thread."""
+        with self.lock:
+            thread, self.thread = self.thread, None
+        if thread is not None:
+            self.queue.put(None)
+            thread.join()
+
+    def run(self):
+        stopping = False
+        while not stopping:
+            batch = []
+            deadline = monotonic() + self.flush_interval
+            while len(batch) < self.flush_size:
+                try:
+                    item = self.queue.get(timeout=max(deadline - monotonic(), 0))
+                except Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            if batch:
+                self.flush_with_retries(batch)
+        connection.close()
+
+    def flush_with_retries(self, batch: list[tuple[type[models.Model], dict]]):
+        for attempt in range(1, FLUSH_ATTEMPTS + 1):
+            try:
+                return self.flush(batch)
+            except (IntegrityError, DataError) as err:
+                return self.flush_bisected(batch, err)
+            except Exception as err:
+                if attempt == FLUSH_ATTEMPTS:
+                    logger.error(f"Dropping {len(batch)} telemetry records: {err}")
+                    self.dropped += len(batch)
+                    return
+                logger.warning(
+                    f"Flushing {len(batch)} telemetry records failed, "
+                    f"retrying: {err}"
+                )
+                # The connection may be broken.
+                connection.close()
+                sleep(FLUSH_RETRY_DELAY * attempt)
+
+    def flush_bisected(self, batch: list[tuple[type[models.Model], dict]], err):
+        """Flush halves of `batch`, which failed with `err`, separately,
+        recursing into those that fail alike, and drop single failing records."""
+        if len(batch) == 1:
+            model, data = batch[0]
+            logger.error(f"Dropping {model.__name__} {data}: {err}")
+            self.dropped += 1
+            return
+        middle = len(batch) // 2
+        for half in (batch[:middle], batch[middle:]):
+            try:
+                self.flush(half)
+            except (IntegrityError, DataError) as half_err:
+                self.flush_bisected(half, half_err)
+            except Exception as half_err:
+                logger.error(f"Dropping {len(half)} telemetry records: {half_err}")
+                self.dropped += len(half)
+
+    def flush(self, batch: list[tuple[type[models.Model], dict]]):
+        """Insert `batch` all at once or not at all."""
+        start = perf_counter()
+        session_ids = {data["session_id"] for _, data in batch}
+        sessions = TrainingSession.objects.in_bulk(session_ids)
+        by_model: dict[type[models.Model], list[models.Model]] = {}
+        missing = 0
+        for model, data in batch:
+            session = sessions.get(data["session_id"])
+            if session is None:
+                logger.error(
+                    f"Dropping {model.__name__}: no session {data['session_id']}."
+                )
+                missing += 1
+                continue
+            instance = model(**{**data, "session_id": session})
+            by_model.setdefault(model, []).append(instance)
+        with transaction.atomic():
+            for model, instances in by_model.items():
+                save_records(model, instances)
+        self.written += sum(len(instances) for instances in by_model.values())
+        self.dropped += missing
+        seconds = perf_counter() - start
+        self.flushes += 1
+        self.last_flush_seconds = seconds
+        self.max_flush_seconds = max(self.max_flush_seconds, seconds)
+        self.total_flush_seconds += seconds
+
+    def stats(self) -> dict:
+        return {
+            "depth": self.queue.qsize(),
+            "capacity": self.queue.maxsize,
+            "enqueued": self.enqueued,
+            "rejected": self.rejected,
+            "written": self.written,
+            "dropped": self.dropped,
+            "flushes": self.flushes,
+            "last_flush_seconds": self.last_flush_seconds,
+            "max_flush_seconds": self.max_flush_seconds,
+            "mean_flush_seconds": self.total_flush_seconds / max(self.flushes, 1),
+        }
+
+
+telemetry_buffer = WriteBehindBuffer(
+    TELEMETRY_BUFFER_SIZE,
+    TELEMETRY_FLUSH_SIZE,
+    TELEMETRY_FLUSH_INTERVAL,
+    TELEMETRY_PUT_TIMEOUT,
+)
@@ -0,0 +1,293 @@
+"""Process metrics in the Prometheus text exposition format, see
+https://prometheus.io/docs/instrumenting/exposition_formats/.
+
+Each backend worker process keeps its own counters and histograms, and writes
+them to its own file in `METRICS_DIR` every `METRICS_WRITE_INTERVAL` seconds
+and at exit. `render`, behind the `metrics` endpoint of any worker, sums the
+files of all workers, past and present, like the multiprocess mode of
+`prometheus_client`, so that counters do not jump between scrapes that hit
+different workers. Rounds of Flower servers are measured in their
+own process and handed over with their params, see `record_round`, which
+also persists them as `RoundMetrics` of the training session."""
+import json
+import os
+from bisect import bisect_left
+from multiprocessing.util import Finalize
+from threading import Lock, Thread
+from time import sleep, time_ns
+
+from telemetry.models import RoundMetrics
+
+from backend.settings import METRICS_DIR, METRICS_WRITE_INTERVAL
+
+LATENCY_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+"""Upper bounds in seconds, `+Inf` implied."""
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(names: tuple[str, ...], values: tuple, **extra) -> str:
+    pairs = [*zip(names, values), *extra.items()]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{escape(value)}"' for name, value in pairs) + "}"
+
+
+def format_value(value: float) -> str:
+    return repr(float(value)) if value != float("inf") else "+Inf"
+
+
+class Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.lock = Lock()
+        REGISTRY.append(self)
+
+    def key(self, labels: dict) -> tuple:
+        start_writer()
+        return tuple(labels[name] for name in self.labelnames)
+
+    def render(self, dumps: list[list]) -> list[str]:
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+            *self.samples(self.merge(dumps)),
+        ]
+
+    def dump(self) -> list:
+        """Values as JSON, `[[*label_values, value], ...]`."""
+        with self.lock:
+            return [[*key, value] for key, value in self.values.items()]
+
+    def merge(self, dumps: list[list]) -> dict:
+        raise NotImplementedError
+
+    def samples(self, values: dict) -> list[str]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.values: dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0.0) + amount
+
+    def merge(self, dumps: list[list]) -> dict[tuple, float]:
+        values: dict[tuple, float] = {}
+        width = len(self.labelnames)
+        for dump in dumps:
+            for row in dump:
+                key = tuple(row[:width])
+                values[key] = values.get(key, 0.0) + row[width]
+        return values
+
+    def samples(self, values: dict[tuple, float]) -> list[str]:
+        return [
+            f"{self.name}{format_labels(self.labelnames, key)} {format_value(value)}"
+            for key, value in sorted(values.items())
+        ]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, *args, buckets: tuple[float, ...] = LATENCY_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = buckets
+        self.values: dict[tuple, tuple[list[int], float]] = {}
+        """Non-cumulative bucket counts, the last for `+Inf`, and sum."""
+
+    def observe(self, value: float, **labels):
+        key = self.key(labels)
+        with self.lock:
+            counts, total = self.values.get(key) or ([0] * (len(self.buckets) + 1), 0)
+            counts[bisect_left(self.buckets, value)] += 1
+            self.values[key] = (counts, total + value)
+
+    def merge(self, dumps: list[list]) -> dict[tuple, tuple[list[int], float]]:
+        values: dict[tuple, tuple[list[int], float]] = {}
+        width = len(self.labelnames)
+        for dump in dumps:
+            for row in dump:
+                key = tuple(row[:width])
+                counts, total = row[width]
+                if len(counts) != len(self.buckets) + 1:
+                    # Written with other buckets.
+                    continue
+                merged, merged_total = values.get(key) or ([0] * len(counts), 0.0)
+                merged = [a + b for a, b in zip(merged, counts)]
+                values[key] = (merged, merged_total + total)
+        return values
+
+    def samples(self, values: dict[tuple, tuple[list[int], float]]) -> list[str]:
+        lines = []
+        for key, (counts, total) in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float("inf")), counts):
+                cumulative += count
+                labels = format_labels(self.labelnames, key, le=format_value(bound))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+REGISTRY: list[Metric] = []
+
+METRICS_FILE = METRICS_DIR / f"{os.getpid()}-{time_ns()}.json"
+"""Values of this process; unique even if a later process reuses the pid."""
+
+writer: Thread | None = None
+writer_lock = Lock()
+write_lock = Lock()
+"""Serialize `write` from the writer thread and `render` in request threads,
+which share one temporary file."""
+
+
+def write():
+    """Write the values of this process to `METRICS_FILE` atomically."""
+    with write_lock:
+        METRICS_DIR.mkdir(parents=True, exist_ok=True)
+        part = METRICS_FILE.with_suffix(".part")
+        values = {metric.name: metric.dump() for metric in REGISTRY}
+        part.write_text(json.dumps(values))
+        os.replace(part, METRICS_FILE)
+
+
+def write_periodically():
+    while True:
+        sleep(METRICS_WRITE_INTERVAL)
+        write()
+
+
+def start_writer():
+    """Write this process's values in the background once it has any."""
+    global writer
+    if writer is not None:
+        return
+    with writer_lock:
+        if writer is None:
+            writer = Thread(target=write_periodically, daemon=True)
+            writer.start()
+            # Unlike `atexit`, also at exit of multiprocessing children such as
+            # uvicorn workers.
+            Finalize(None, write, exitpriority=0)
+
+
+def read_all() -> dict[str, list[list]]:
+    """Dumps of each metric from the files of all processes."""
+    dumps: dict[str, list[list]] = {}
+    for path in METRICS_DIR.glob("*.json"):
+        try:
+            values = json.loads(path.read_text())
+        except (OSError, ValueError):
+            # Replaced meanwhile.
+            continue
+        for name, dump in values.items():
+            dumps.setdefault(name, []).append(dump)
+    return dumps
+
+
+def render() -> str:
+    """Metrics summed over all backend worker processes."""
+    write()
+    dumps = read_all()
+    lines = [
+        line
+        for metric in REGISTRY
+        for line in metric.render(dumps.get(metric.name, []))
+    ]
+    return "\n".join(lines) + "\n"
+
+
+request_seconds = Histogram(
+    "backend_request_seconds",
+    "Latency of `train/` and `telemetry/` requests.",
+    ("route", "method", "status"),
+)
+round_phase_seconds = Histogram(
+    "flower_round_phase_seconds",
+    "Time of each phase of a Flower server round.",
+    ("phase",),
+)
+round_clients = Counter(
+    "flower_round_clients_total",
+    "Clients of Flower server rounds by outcome.",
+    ("outcome",),
+)
+rounds = Counter("flower_rounds_total", "Aggregated Flower server rounds.")
+sessions_ended = Counter(
+    "flower_sessions_ended_total",
+    "Stopped Flower servers by `TrainingSession.end_reason`.",
+    ("reason",),
+)
+
+ROUND_PHASES = ("wait", "decode", "screen", "aggregate", "serialize", "save")
+"""Phases measured by `train.run.FedAvgAndroidSave` and, for "save",
+`train.scheduler.Server`. Always change together with `RoundMetrics`."""
+
+ROUND_OUTCOMES = ("results", "failures", "discarded")
+
+
+def record_round(
+    session_id: int,
+    server_round: int,
+    timings: dict[str, float],
+    counts: dict[str, int],
+) -> RoundMetrics:
+    """Observe a round of training session `session_id` and save it."""
+    rounds.inc()
+    for phase in ROUND_PHASES:
+        if phase in timings:
+            round_phase_seconds.observe(timings[phase], phase=phase)
+    for outcome in ROUND_OUTCOMES:
+        round_clients.inc(counts.get(outcome, 0), outcome=outcome)
+    round_metrics, _ = RoundMetrics.objects.update_or_create(
+        session_id=session_id,
+        server_round=server_round,
+        defaults={
+            **{f"{phase}_seconds": timings.get(phase) for phase in ROUND_PHASES},
+            **{outcome: counts.get(outcome, 0) for outcome in ROUND_OUTCOMES},
+        },
+    )
+    return round_metrics
+
+
+def round_summary(round_metrics: RoundMetrics) -> dict:
+    return {
+        "round": round_metrics.server_round,
+        **{
+            f"{phase}_seconds": getattr(round_metrics, f"{phase}_seconds")
+            for phase in ROUND_PHASES
+        },
+        **{outcome: getattr(round_metrics, outcome) for outcome in ROUND_OUTCOMES},
+    }
@@ -0,0 +1,45 @@
+"""Time `train/` and `telemetry/` requests into
+`telemetry.metrics.request_seconds`, for sync and async views alike."""
+from time import perf_counter
+
+from asgiref.sync import iscoroutinefunction
+from django.http import HttpRequest, HttpResponse
+from django.utils.decorators import sync_and_async_middleware
+from telemetry.metrics import request_seconds
+
+MEASURED_PREFIXES = ("/train/", "/telemetry/")
+
+
+def observe(request: HttpRequest, response: HttpResponse, start: float):
+    if not request.path.startswith(MEASURED_PREFIXES):
+        return
+    match = request.resolver_match
+    # The route pattern, not the path, keeps label values few.
+    route = match.route if match is not None else "unmatched"
+    request_seconds.observe(
+        perf_counter() - start,
+        route=route,
+        method=request.method,
+        status=response.status_code,
+    )
+
+
+@sync_and_async_middleware
+def request_metrics(get_response):
+    if iscoroutinefunction(get_response):
+
+        async def middleware(request: HttpRequest):
+            start = perf_counter()
+            response = await get_response(request)
+            observe(request, response, start)
+            return response
+
+    else:
+
+        def middleware(request: HttpRequest):
+            start = perf_counter()
+            response = get_response(request)
+            observe(request, response, start)
+            return response
+
+    return middleware
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("telemetry", "0002_alter_evaluateinstelemetrydata_device_id_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="trainingsession",
+            name="config",
+            field=models.JSONField(default=dict, editable=False),
+        ),
+    ]
@@ -0,0 +1,71 @@
+# Index telemetry by (session_id, device_id, start) and roll existing rows up
+# into `SessionRollup`.
+
+import django.db.models.deletion
+from django.db import migrations, models
+from telemetry.rollup import add_evaluations, add_fits
+
+
+def build_rollups(apps, schema_editor):
+    TrainingSession = apps.get_model("telemetry", "TrainingSession")
+    SessionRollup = apps.get_model("telemetry", "SessionRollup")
+    for session in TrainingSession.objects.iterator():
+        fits = list(session.fit_ins.all())
+        evaluations = list(session.evaluate_ins.all())
+        if not fits and not evaluations:
+            continue
+        rollup = SessionRollup(session=session)
+        add_fits(rollup, fits, len({fit.device_id for fit in fits}))
+        add_evaluations(
+            rollup, evaluations, len({record.device_id for record in evaluations})
+        )
+        rollup.save()
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("telemetry", "0003_training_session_config"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SessionRollup",
+            fields=[
+                (
+                    "session",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="rollup",
+                        serialize=False,
+                        to="telemetry.trainingsession",
+                    ),
+                ),
+                ("fit_count", models.BigIntegerField(default=0)),
+                ("fit_devices", models.BigIntegerField(default=0)),
+                ("fit_seconds", models.FloatField(default=0.0)),
+                ("fit_histogram", models.JSONField(default=list)),
+                ("evaluate_count", models.BigIntegerField(default=0)),
+                ("evaluate_devices", models.BigIntegerField(default=0)),
+                ("test_size", models.BigIntegerField(default=0)),
+                ("loss_sum", models.FloatField(default=0.0)),
+                ("accuracy_sum", models.FloatField(default=0.0)),
+                ("updated", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="evaluateinstelemetrydata",
+            index=models.Index(
+                fields=["session_id", "device_id", "start"],
+                name="telemetry_e_session_3cb6cc_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="fitinstelemetrydata",
+            index=models.Index(
+                fields=["session_id", "device_id", "start"],
+                name="telemetry_f_session_459964_idx",
+            ),
+        ),
+        migrations.RunPython(build_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:07
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("telemetry", "0004_session_rollup"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RoundMetrics",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("server_round", models.PositiveIntegerField(editable=False)),
+                ("wait_seconds", models.FloatField(editable=False, null=True)),
+                ("decode_seconds", models.FloatField(editable=False, null=True)),
+                ("screen_seconds", models.FloatField(editable=False, null=True)),
+                ("aggregate_seconds", models.FloatField(editable=False, null=True)),
+                ("serialize_seconds", models.FloatField(editable=False, null=True)),
+                ("save_seconds", models.FloatField(editable=False, null=True)),
+                ("results", models.PositiveIntegerField(default=0, editable=False)),
+                ("failures", models.PositiveIntegerField(default=0, editable=False)),
+                ("discarded", models.PositiveIntegerField(default=0, editable=False)),
+                ("recorded", models.DateTimeField(auto_now=True)),
+                (
+                    "session",
+                    models.ForeignKey(
+                        editable=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="rounds",
+                        to="telemetry.trainingsession",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["session", "server_round"],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("session", "server_round"), name="unique_session_round"
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("telemetry", "0005_round_metrics"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="trainingsession",
+            name="end_reason",
+            field=models.CharField(editable=False, max_length=16, null=True),
+        ),
+    ]
@@ -11,6 +11,11 @@ class TrainingSession(models.Model):
     )
     start_time = models.DateTimeField(auto_now_add=True)
     end_time = models.DateTimeField(auto_now=True)
+    config = models.JSONField(default=dict, editable=False)
+    """`train.data.TrainingConfig` of the session as a dict."""
+    end_reason = models.CharField(max_length=16, null=True, editable=False)
+    """Why its Flower server stopped, `None` while it runs, see
+    `train.scheduler.Server.end_reason`."""
 
     def __str__(self) -> str:
         return f"Training session {self.id} for {self.tflite_model} {self.start_time} - {self.end_time}>"
@@ -26,6 +31,9 @@ class FitInsTelemetryData(models.Model):
     start = models.DateTimeField(**cfg)
     end = models.DateTimeField(**cfg)
 
+    class Meta:
+        indexes = [models.Index(fields=["session_id", "device_id", "start"])]
+
     def __str__(self) -> str:
         return f"FitIns {self.id} on {self.device_id} {self.start} - {self.end}"
 
@@ -43,5 +51,74 @@ class EvaluateInsTelemetryData(models.Model):
     accuracy = models.FloatField(**cfg)
     test_size = models.BigIntegerField(**cfg)
 
+    class Meta:
+        indexes = [models.Index(fields=["session_id", "device_id", "start"])]
+
     def __str__(self) -> str:
         return f"EvaluateIns {self.id} on {self.device_id} {self.start} - {self.end} loss: {self.loss} accuracy: {self.accuracy} test_size: {self.test_size}"
+
+
+class SessionRollup(models.Model):
+    """Telemetry aggregates of a session, updated with each insert by
+    `telemetry.rollup.save_records`."""
+
+    session = models.OneToOneField(
+        TrainingSession,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="rollup",
+    )
+    fit_count = models.BigIntegerField(default=0)
+    fit_devices = models.BigIntegerField(default=0)
+    fit_seconds = models.FloatField(default=0.0)
+    """Sum of fit durations."""
+    fit_histogram = models.JSONField(default=list)
+    """Counts of fit durations per `telemetry.rollup.bucket`."""
+    evaluate_count = models.BigIntegerField(default=0)
+    evaluate_devices = models.BigIntegerField(default=0)
+    test_size = models.BigIntegerField(default=0)
+    """Sum of `test_size`, the weight of `loss_sum` and `accuracy_sum`."""
+    loss_sum = models.FloatField(default=0.0)
+    """Sum of `loss * test_size`."""
+    accuracy_sum = models.FloatField(default=0.0)
+    """Sum of `accuracy * test_size`."""
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self) -> str:
+        return f"Rollup of session {self.session_id}: {self.fit_count} fits, {self.evaluate_count} evaluations"
+
+
+# Always change together with `telemetry.metrics.ROUND_PHASES`.
+class RoundMetrics(models.Model):
+    """Where the time of a Flower server round went and what became of its
+    clients, see `telemetry.metrics.record_round`."""
+
+    session = models.ForeignKey(
+        TrainingSession, on_delete=models.CASCADE, related_name="rounds", **cfg
+    )
+    server_round = models.PositiveIntegerField(**cfg)
+    wait_seconds = models.FloatField(null=True, editable=False)
+    """From configuring fit to all results or failures being in."""
+    decode_seconds = models.FloatField(null=True, editable=False)
+    screen_seconds = models.FloatField(null=True, editable=False)
+    aggregate_seconds = models.FloatField(null=True, editable=False)
+    serialize_seconds = models.FloatField(null=True, editable=False)
+    """Flattening the aggregated params to hand them over."""
+    save_seconds = models.FloatField(null=True, editable=False)
+    """From aggregation to params saved by the backend."""
+    results = models.PositiveIntegerField(default=0, editable=False)
+    failures = models.PositiveIntegerField(default=0, editable=False)
+    discarded = models.PositiveIntegerField(default=0, editable=False)
+    """Results that did not decode or failed `train.aggregate.screen`."""
+    recorded = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["session", "server_round"], name="unique_session_round"
+            )
+        ]
+        ordering = ["session", "server_round"]
+
+    def __str__(self) -> str:
+        return f"Round {self.server_round} of session {self.session_id}"  # type: ignore
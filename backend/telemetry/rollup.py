@@ -0,0 +1,132 @@
+"""Per-session telemetry aggregates maintained on insert.
+
+Fit durations go into a histogram of logarithmic buckets,
+`BUCKETS_PER_DOUBLING` per doubling of milliseconds, so percentiles are
+read without the raw rows, to within one bucket width (about 19%)."""
+from math import floor, log2
+
+from django.db import models, transaction
+from telemetry.models import *
+
+BUCKETS_PER_DOUBLING = 4
+
+BUCKETS = 128
+"""Bucket `BUCKETS - 1` holds everything above about 2^32 ms."""
+
+PERCENTILES = (50, 90, 99)
+
+
+def bucket(seconds: float) -> int:
+    milliseconds = seconds * 1000
+    if milliseconds < 1:
+        return 0
+    return min(floor(log2(milliseconds) * BUCKETS_PER_DOUBLING) + 1, BUCKETS - 1)
+
+
+def bucket_upper_bound(index: int) -> float:
+    """Seconds below which all durations in bucket `index` lie."""
+    return 2 ** (index / BUCKETS_PER_DOUBLING) / 1000
+
+
+def add_to_histogram(histogram: list[int], durations: list[float]) -> list[int]:
+    histogram = histogram + [0] * (BUCKETS - len(histogram))
+    for duration in durations:
+        histogram[bucket(duration)] += 1
+    return histogram
+
+
+def percentile(histogram: list[int], q: float) -> float | None:
+    total = sum(histogram)
+    if total == 0:
+        return None
+    rank = q / 100 * total
+    seen = 0
+    for index, count in enumerate(histogram):
+        seen += count
+        if seen >= rank:
+            return bucket_upper_bound(index)
+    return bucket_upper_bound(len(histogram) - 1)
+
+
+def new_devices(model: type[models.Model], session_id: int, devices: set[int]):
+    """Number of `devices` without records of `model` in session `session_id`
+    yet, using the (session_id, device_id, start) index."""
+    known = model.objects.filter(  # type: ignore
+        session_id=session_id, device_id__in=devices
+    ).values_list("device_id", flat=True)
+    return len(devices - set(known))
+
+
+def save_records(model: type[models.Model], instances: list) -> list:
+    """Insert `instances` of `model` and update the rollups of their sessions,
+    in one transaction. The rollups are locked before devices are counted, so
+    concurrent inserts for a session count each new device once."""
+    by_session: dict[int, list] = {}
+    for instance in instances:
+        by_session.setdefault(instance.session_id_id, []).append(instance)
+    with transaction.atomic():
+        # Locked in session order so that concurrent inserts do not deadlock.
+        rollups = {
+            session_id: SessionRollup.objects.select_for_update().get_or_create(
+                session_id=session_id
+            )[0]
+            for session_id in sorted(by_session)
+        }
+        device_counts = {
+            session_id: new_devices(
+                model, session_id, {record.device_id for record in records}
+            )
+            for session_id, records in by_session.items()
+        }
+        created = model.objects.bulk_create(instances)  # type: ignore
+        for session_id, records in by_session.items():
+            rollup = rollups[session_id]
+            if model is FitInsTelemetryData:
+                add_fits(rollup, records, device_counts[session_id])
+            else:
+                add_evaluations(rollup, records, device_counts[session_id])
+            rollup.save()
+    return created
+
+
+def add_fits(rollup, records: list, devices: int):
+    durations = [(record.end - record.start).total_seconds() for record in records]
+    rollup.fit_count += len(records)
+    rollup.fit_devices += devices
+    rollup.fit_seconds += sum(durations)
+    rollup.fit_histogram = add_to_histogram(rollup.fit_histogram, durations)
+
+
+def add_evaluations(rollup, records: list, devices: int):
+    rollup.evaluate_count += len(records)
+    rollup.evaluate_devices += devices
+    for record in records:
+        rollup.test_size += record.test_size
+        rollup.loss_sum += record.loss * record.test_size
+        rollup.accuracy_sum += record.accuracy * record.test_size
+
+
+def summary(rollup: SessionRollup) -> dict:
+    weight = rollup.test_size or None
+    return {
+        "session_id": rollup.session_id,  # type: ignore
+        "fit": {
+            "count": rollup.fit_count,
+            "devices": rollup.fit_devices,
+            "mean_seconds": (
+                rollup.fit_seconds / rollup.fit_count if rollup.fit_count else None
+            ),
+            **{
+                f"p{q}_seconds": percentile(rollup.fit_histogram, q)
+                for q in PERCENTILES
+            },
+        },
+        "evaluate": {
+            "count": rollup.evaluate_count,
+            "devices": rollup.evaluate_devices,
+            "test_size": rollup.test_size,
+            "loss": rollup.loss_sum / weight if weight else None,
+            "accuracy": rollup.accuracy_sum / weight if weight else None,
+        },
+        "updated": rollup.updated,
+    }
@@ -2,6 +2,7 @@ from datetime import datetime
 
 from rest_framework import serializers
 from telemetry.models import *
+from telemetry.rollup import save_records
 
 
 class TimestampMillis(serializers.Field):
@@ -21,7 +22,9 @@ class FitInsTelemetryDataSerializer(serializers.Serializer):
     def create(self, validated_data):
         session_id = validated_data["session_id"]
         validated_data["session_id"] = TrainingSession.objects.get(id=session_id)
-        return FitInsTelemetryData.objects.create(**validated_data)
+        return save_records(
+            FitInsTelemetryData, [FitInsTelemetryData(**validated_data)]
+        )[0]
 
     class Meta:
         model = FitInsTelemetryData
@@ -40,7 +43,9 @@ class EvaluateInsTelemetryDataSerializer(serializers.Serializer):
     def create(self, validated_data):
         session_id = validated_data["session_id"]
         validated_data["session_id"] = TrainingSession.objects.get(id=session_id)
-        return EvaluateInsTelemetryData.objects.create(**validated_data)
+        return save_records(
+            EvaluateInsTelemetryData, [EvaluateInsTelemetryData(**validated_data)]
+        )[0]
 
     class Meta:
         model = EvaluateInsTelemetryData
@@ -1,3 +1,123 @@
+from datetime import datetime, timedelta
+from unittest import mock
+
+from django.db import IntegrityError
 from django.test import TestCase
+from telemetry import buffer
+from telemetry.buffer import WriteBehindBuffer
+from telemetry.models import *
+from train.models import TFLiteModel, TrainingDataType
+
+START = datetime(2026, 1, 1)
+
+
+class TelemetryTestCase(TestCase):
+    def setUp(self):
+        data_type = TrainingDataType.objects.create(name="test")
+        model = TFLiteModel.objects.create(
+            name="model",
+            file_path="/model.tflite",
+            layers_sizes=[4],
+            data_type=data_type,
+        )
+        self.session = TrainingSession.objects.create(tflite_model=model)
+
+    def fit_record(self, device_id: int, seconds: float) -> dict:
+        start = START.timestamp() * 1000
+        return {
+            "device_id": device_id,
+            "session_id": self.session.id,
+            "start": start,
+            "end": start + seconds * 1000,
+        }
+
+    def summary(self) -> dict:
+        response = self.client.get(f"/telemetry/sessions/{self.session.id}")
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+
+class BatchIngestTest(TelemetryTestCase):
+    def test_valid_records_created_invalid_reported(self):
+        records = [
+            self.fit_record(1, 1.0),
+            {"device_id": 2},
+            {**self.fit_record(3, 1.0), "session_id": self.session.id + 1},
+            self.fit_record(1, 2.0),
+        ]
+        response = self.client.post(
+            "/telemetry/fit_ins/batch", records, content_type="application/json"
+        )
+        self.assertEqual(response.status_code, 200)
+        result = response.json()
+        self.assertEqual(result["created"], 2)
+        self.assertEqual([error["index"] for error in result["errors"]], [1, 2])
+        self.assertEqual(FitInsTelemetryData.objects.count(), 2)
+
+    def test_not_a_list(self):
+        response = self.client.post(
+            "/telemetry/fit_ins/batch", {}, content_type="application/json"
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+class RollupTest(TelemetryTestCase):
+    def test_counts_across_batches(self):
+        for records in (
+            [self.fit_record(1, 1.0), self.fit_record(2, 2.0)],
+            [self.fit_record(1, 3.0), self.fit_record(3, 4.0)],
+        ):
+            self.client.post(
+                "/telemetry/fit_ins/batch", records, content_type="application/json"
+            )
+        fit = self.summary()["fit"]
+        self.assertEqual(fit["count"], 4)
+        self.assertEqual(fit["devices"], 3)
+        self.assertAlmostEqual(fit["mean_seconds"], 2.5)
+
+
+class WriteBehindBufferTest(TelemetryTestCase):
+    def validated(self, device_id: int, session_id: int) -> dict:
+        """Record as `put` by the endpoints once validated."""
+        return {
+            "device_id": device_id,
+            "session_id": session_id,
+            "start": START,
+            "end": START + timedelta(seconds=1),
+        }
+
+    def test_flush(self):
+        buffer = WriteBehindBuffer(10, 10, 1.0, 0.1)
+        buffer.flush(
+            [
+                (FitInsTelemetryData, self.validated(1, self.session.id)),
+                (FitInsTelemetryData, self.validated(2, self.session.id)),
+                (FitInsTelemetryData, self.validated(3, self.session.id + 1)),
+            ]
+        )
+        self.assertEqual(buffer.written, 2)
+        self.assertEqual(buffer.dropped, 1)
+        self.assertEqual(FitInsTelemetryData.objects.count(), 2)
+        self.assertEqual(self.summary()["fit"]["devices"], 2)
+
+    def test_flush_drops_only_rejected_records(self):
+        save_records = buffer.save_records
+
+        def reject_device_3(model, instances):
+            if any(instance.device_id == 3 for instance in instances):
+                raise IntegrityError("device 3")
+            return save_records(model, instances)
 
-# Create your tests here.
+        telemetry_buffer = WriteBehindBuffer(10, 10, 1.0, 0.1)
+        batch = [
+            (FitInsTelemetryData, self.validated(device_id, self.session.id))
+            for device_id in range(1, 6)
+        ]
+        with mock.patch("telemetry.buffer.save_records", reject_device_3):
+            telemetry_buffer.flush_with_retries(batch)
+        self.assertEqual(telemetry_buffer.written, 4)
+        self.assertEqual(telemetry_buffer.dropped, 1)
+        self.assertEqual(
+            sorted(FitInsTelemetryData.objects.values_list("device_id", flat=True)),
+            [1, 2, 4, 5],
+        )
@@ -1,4 +1,21 @@
 from django.urls import path
 from telemetry.views import *
 
-urlpatterns = [path("evaluate_ins", evaluate_ins), path("fit_ins", fit_ins)]
+from backend.settings import ASYNC_VIEWS
+
+if ASYNC_VIEWS:
+    from telemetry.async_views import (
+        evaluate_ins,
+        evaluate_ins_batch,
+        fit_ins,
+        fit_ins_batch,
+    )
+
+urlpatterns = [
+    path("evaluate_ins", evaluate_ins),
+    path("fit_ins", fit_ins),
+    path("evaluate_ins/batch", evaluate_ins_batch),
+    path("fit_ins/batch", fit_ins_batch),
+    path("buffer", buffer_stats),
+    path("sessions/<int:session_id>", session_summary),
+]
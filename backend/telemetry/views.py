@@ -1,19 +1,40 @@
 import logging
+from queue import Full
 
+from django.http import HttpRequest, HttpResponse
+from django.shortcuts import get_object_or_404
 from rest_framework import permissions
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, parser_classes, permission_classes
+from rest_framework.parsers import JSONParser
 from rest_framework.response import Response
+from rest_framework.status import HTTP_400_BAD_REQUEST, HTTP_503_SERVICE_UNAVAILABLE
 from rest_framework.views import Request
+from telemetry import metrics
+from telemetry.buffer import telemetry_buffer
+from telemetry.parsers import NDJSONParser
+from telemetry.rollup import save_records, summary
 from telemetry.serializers import *
 
+from backend.settings import TELEMETRY_WRITE_BEHIND
+
 logger = logging.getLogger(__name__)
 
 
 def save_serializer_and_respond(serializer) -> Response:
-    if serializer.is_valid():
-        serializer.save()
-    else:
+    if not serializer.is_valid():
         logger.error(serializer.errors)
+    elif TELEMETRY_WRITE_BEHIND:
+        try:
+            telemetry_buffer.put(serializer.Meta.model, serializer.validated_data)
+        except Full:
+            logger.error("Telemetry buffer full, rejecting record.")
+            return Response(
+                "Telemetry buffer full.",
+                HTTP_503_SERVICE_UNAVAILABLE,
+                headers={"Retry-After": "1"},
+            )
+    else:
+        serializer.save()
     return Response("")
 
 
@@ -29,3 +50,84 @@ def fit_ins(request: Request):
 def evaluate_ins(request: Request):
     serializer = EvaluateInsTelemetryDataSerializer(data=request.data)  # type: ignore
     return save_serializer_and_respond(serializer)
+
+
+def save_batch(serializer_class, model, records) -> dict | None:
+    """Validate `records` one by one, resolve all their sessions in one query,
+    and insert the valid ones in one transaction.
+    Return the number created and the errors of invalid records,
+    or `None` if `records` is not a list."""
+    if not isinstance(records, list):
+        return
+    valid: list[tuple[int, dict]] = []
+    errors = []
+    for index, record in enumerate(records):
+        serializer = serializer_class(data=record)
+        if serializer.is_valid():
+            valid.append((index, serializer.validated_data))
+        else:
+            errors.append({"index": index, "errors": serializer.errors})
+    session_ids = {data["session_id"] for _, data in valid}
+    sessions = TrainingSession.objects.in_bulk(session_ids)
+    instances = []
+    for index, data in valid:
+        session = sessions.get(data["session_id"])
+        if session is None:
+            errors.append({"index": index, "errors": {"session_id": ["Not found."]}})
+        else:
+            instances.append(model(**{**data, "session_id": session}))
+    save_records(model, instances)
+    errors.sort(key=lambda error: error["index"])
+    if errors:
+        logger.error(f"{len(errors)} invalid records in batch, first: {errors[0]}")
+    return {"created": len(instances), "errors": errors}
+
+
+def save_batch_and_respond(serializer_class, model, records) -> Response:
+    result = save_batch(serializer_class, model, records)
+    if result is None:
+        return Response("Expected a list of records.", HTTP_400_BAD_REQUEST)
+    return Response(result)
+
+
+@api_view(["POST"])
+@permission_classes((permissions.AllowAny,))
+@parser_classes((JSONParser, NDJSONParser))
+def fit_ins_batch(request: Request):
+    return save_batch_and_respond(
+        FitInsTelemetryDataSerializer, FitInsTelemetryData, request.data
+    )
+
+
+@api_view(["POST"])
+@permission_classes((permissions.AllowAny,))
+@parser_classes((JSONParser, NDJSONParser))
+def evaluate_ins_batch(request: Request):
+    return save_batch_and_respond(
+        EvaluateInsTelemetryDataSerializer, EvaluateInsTelemetryData, request.data
+    )
+
+
+@api_view(["GET"])
+@permission_classes((permissions.AllowAny,))
+def buffer_stats(_: Request):
+    return Response(telemetry_buffer.stats())
+
+
+@api_view(["GET"])
+@permission_classes((permissions.AllowAny,))
+def session_summary(_: Request, session_id: int):
+    """Telemetry aggregates of session `session_id` from its rollup row."""
+    rollup = SessionRollup.objects.filter(session_id=session_id).first()
+    if rollup is None:
+        session = get_object_or_404(TrainingSession, id=session_id)
+        rollup = SessionRollup(session=session)
+    rounds = RoundMetrics.objects.filter(session_id=session_id)
+    return Response(
+        {**summary(rollup), "rounds": list(map(metrics.round_summary, rounds))}
+    )
+
+
+def metrics_text(_: HttpRequest):
+    """Metrics of this worker process for Prometheus to scrape."""
+    return HttpResponse(metrics.render(), content_type=metrics.CONTENT_TYPE)
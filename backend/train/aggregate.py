@@ -0,0 +1,307 @@
+"""Aggregation of client parameters used by `train.run.FedAvgAndroidSave`.
+
+Aggregators split every layer into shards of `SHARD_SIZE` coordinates and run
+them on a `LayerPool`. NumPy releases the GIL while it computes, so shards
+run in parallel on threads. Each coordinate is reduced over clients in client
+order by exactly one shard, and shards only depend on layer sizes, so results
+are bit-for-bit the same for any number of workers."""
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable
+
+import numpy as np
+from flwr.common import NDArrays
+from numpy.typing import NDArray
+
+SHARD_SIZE = 1 << 16
+"""Coordinates of a layer aggregated by one task, large enough for NumPy to
+amortize its per-call overhead, small enough to spread a big layer over
+threads."""
+
+Shard = tuple[int, slice]
+"""Layer index and range of its flattened coordinates."""
+
+
+def shards(sizes: Iterable[int], shard_size: int = SHARD_SIZE) -> list[Shard]:
+    """Split layers of `sizes` elements into consecutive shards."""
+    return [
+        (index, slice(start, min(start + shard_size, size)))
+        for index, size in enumerate(sizes)
+        for start in range(0, max(size, 1), shard_size)
+    ]
+
+
+class LayerPool:
+    """Threads to aggregate shards of layers on, or the calling thread only
+    if `workers` is 1."""
+
+    def __init__(self, workers: int = 1) -> None:
+        if workers < 1:
+            raise ValueError(f"{workers} aggregation workers.")
+        self.workers = workers
+        self.executor = (
+            ThreadPoolExecutor(workers, thread_name_prefix="aggregate")
+            if workers > 1
+            else None
+        )
+
+    def map(self, fn: Callable, items: list) -> list:
+        """`fn` applied to each of `items`, results in order."""
+        if self.executor is None or len(items) < 2:
+            return [fn(item) for item in items]
+        return list(self.executor.map(fn, items))
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+
+
+SERIAL = LayerPool()
+
+
+def flat_layers(results: list[tuple[NDArrays, int]]) -> list[list[NDArray]]:
+    """Flattened views of each client's layers."""
+    return [[layer.reshape(-1) for layer in weights] for weights, _ in results]
+
+
+def stacked_shard(clients_layers: list[list[NDArray]], shard: Shard) -> NDArray:
+    """Coordinates of `shard` of all clients stacked into `(clients, size)`."""
+    index, coordinates = shard
+    return np.stack([layers[index][coordinates] for layers in clients_layers])
+
+
+def map_shards(
+    fn: Callable[[Shard], NDArray],
+    like: NDArrays,
+    pool: LayerPool,
+) -> NDArrays:
+    """Layers shaped like `like`, each shard filled with `fn(shard)`.
+    Models within one shard are not worth handing to threads."""
+    flat = [np.empty(layer.size, layer.dtype) for layer in like]
+    tasks = shards(layer.size for layer in like)
+    if sum(layer.size for layer in like) <= SHARD_SIZE:
+        pool = SERIAL
+
+    def fill(shard: Shard):
+        index, coordinates = shard
+        flat[index][coordinates] = fn(shard)
+
+    pool.map(fill, tasks)
+    return [layer.reshape(original.shape) for layer, original in zip(flat, like)]
+
+
+class RunningWeightedAverage:
+    """Weighted average of client parameters computed incrementally.
+
+    One `float64` running sum per layer is allocated for the first client and
+    every later client is added into it in place, shard by shard on `pool`,
+    so memory stays at the model size no matter how many clients are added.
+    The result equals flwr's `aggregate` up to floating point rounding, and
+    `weighted_average` of the same clients in the same order bit-for-bit."""
+
+    def __init__(self, pool: LayerPool = SERIAL) -> None:
+        self.pool = pool
+        self.sums: NDArrays = []
+        self.shapes: list[tuple[int, ...]] = []
+        self.dtypes: list[np.dtype] = []
+        self.tasks: list[Shard] = []
+        self.num_examples: float = 0
+        self.num_clients = 0
+
+    def add(self, weights: NDArrays, num_examples: float):
+        """Add `weights` of one client trained on `num_examples` examples,
+        or any other non-negative weight."""
+        if self.num_clients == 0:
+            self.sums = [np.zeros(layer.size, dtype=np.float64) for layer in weights]
+            self.shapes = [layer.shape for layer in weights]
+            self.dtypes = [layer.dtype for layer in weights]
+            self.tasks = shards(layer.size for layer in weights)
+        sizes = [layer.size for layer in weights]
+        if sizes != [running.size for running in self.sums]:
+            raise ValueError(f"Layers of sizes {sizes} do not match the average.")
+        layers = [layer.reshape(-1) for layer in weights]
+
+        def add_shard(shard: Shard):
+            index, coordinates = shard
+            self.sums[index][coordinates] += np.multiply(
+                layers[index][coordinates], num_examples, dtype=np.float64
+            )
+
+        pool = self.pool if sum(sizes) > SHARD_SIZE else SERIAL
+        pool.map(add_shard, self.tasks)
+        self.num_examples += num_examples
+        self.num_clients += 1
+
+    def result(self) -> NDArrays:
+        """Average of all added weights in their original shapes and dtypes."""
+        if self.num_clients == 0:
+            raise ValueError("No weights added to the running average.")
+        if self.num_examples == 0:
+            raise ZeroDivisionError("Added weights are over zero examples.")
+        return [
+            (running / self.num_examples).astype(dtype, copy=False).reshape(shape)
+            for running, shape, dtype in zip(self.sums, self.shapes, self.dtypes)
+        ]
+
+
+def weighted_average(
+    results: list[tuple[NDArrays, int]],
+    reference: NDArrays | None = None,
+    pool: LayerPool = SERIAL,
+) -> NDArrays:
+    """Weighted average by `num_examples`, bit-for-bit equal to adding
+    `results` in order to a `RunningWeightedAverage`, on `pool`.
+    Needs all clients' weights in memory at once, N times the model size for
+    N clients; prefer `RunningWeightedAverage` to add clients as they come."""
+    if not results:
+        raise ValueError("No weights to average.")
+    total = sum(num_examples for _, num_examples in results)
+    if total == 0:
+        raise ZeroDivisionError("Weights are over zero examples.")
+    clients_layers = flat_layers(results)
+
+    def average(shard: Shard) -> NDArray:
+        index, coordinates = shard
+        running = np.zeros(coordinates.stop - coordinates.start, np.float64)
+        for layers, (_, num_examples) in zip(clients_layers, results):
+            running += np.multiply(
+                layers[index][coordinates], num_examples, dtype=np.float64
+            )
+        return running / total
+
+    return map_shards(average, results[0][0], pool)
+
+
+MAX_NORM_RATIO = 10.0
+"""Default for `screen`: clients whose parameter norm exceeds this multiple of
+the median norm are outliers."""
+
+
+def squared_norms(weights: NDArrays) -> NDArray:
+    """Squared L2 norm of each layer of one client's `weights`, reduced with
+    a BLAS dot product, so NaN and Inf propagate into it."""
+    flat = [layer.reshape(-1) for layer in weights]
+    return np.array([np.dot(layer, layer) for layer in flat], dtype=np.float64)
+
+
+def screen_norms(
+    squares: NDArray, max_norm_ratio: float | None = MAX_NORM_RATIO
+) -> tuple[NDArray, list[str | None]]:
+    """`screen` from the `(clients, layers)` matrix of `squared_norms`, so
+    clients' weights need not be held in memory together to be screened."""
+    norms = np.sqrt(squares.sum(axis=1))
+    finite_layers = np.isfinite(squares)
+    finite = finite_layers.all(axis=1)
+    reasons: list[str | None] = [None] * len(squares)
+    for index in np.flatnonzero(~finite):
+        bad_layers = np.flatnonzero(~finite_layers[index]).tolist()
+        reasons[index] = f"NaN or Inf in layers {bad_layers}"
+    if max_norm_ratio is not None and finite.sum() >= 3:
+        median = np.median(norms[finite])
+        outliers = finite & (norms > max_norm_ratio * median)
+        for index in np.flatnonzero(outliers):
+            reasons[index] = (
+                f"norm {norms[index]:.4g} over {max_norm_ratio} x median {median:.4g}"
+            )
+    return norms, reasons
+
+
+def screen(
+    clients_weights: list[NDArrays], max_norm_ratio: float | None = MAX_NORM_RATIO
+) -> tuple[NDArray, list[str | None]]:
+    """Screen clients' weights for NaN, Inf and norm outliers.
+    Return every client's L2 norm and the reason to discard it or `None`.
+
+    Each layer is reduced once with a BLAS dot product into a
+    `(clients, layers)` matrix of squared norms; NaN and Inf propagate into it,
+    so every decision is then made with vectorized NumPy over all clients.
+    Norms overflowing `float32` are treated as non-finite, too.
+    Norm outliers are only judged among at least 3 finite clients."""
+    if not clients_weights:
+        raise ValueError("No weights to screen.")
+    squares = np.array([squared_norms(weights) for weights in clients_weights]).reshape(
+        len(clients_weights), -1
+    )
+    return screen_norms(squares, max_norm_ratio)
+
+
+def coordinate_median(
+    results: list[tuple[NDArrays, int]],
+    reference: NDArrays | None = None,
+    pool: LayerPool = SERIAL,
+) -> NDArrays:
+    """Coordinate-wise median over clients, ignoring `num_examples`."""
+    clients_layers = flat_layers(results)
+    return map_shards(
+        lambda shard: np.median(stacked_shard(clients_layers, shard), axis=0),
+        results[0][0],
+        pool,
+    )
+
+
+def trimmed_mean(
+    results: list[tuple[NDArrays, int]],
+    reference: NDArrays | None = None,
+    trim: float = 0.1,
+    pool: LayerPool = SERIAL,
+) -> NDArrays:
+    """Coordinate-wise mean over clients after discarding the `trim` fraction
+    of the lowest and of the highest values, ignoring `num_examples`."""
+    if not 0 <= trim < 0.5:
+        raise ValueError(f"trim {trim} not in [0, 0.5).")
+    n_clients = len(results)
+    cut = int(trim * n_clients)
+    clients_layers = flat_layers(results)
+    return map_shards(
+        lambda shard: np.sort(stacked_shard(clients_layers, shard), axis=0)[
+            cut : n_clients - cut
+        ].mean(axis=0, dtype=np.float64),
+        results[0][0],
+        pool,
+    )
+
+
+def clipped_average(
+    results: list[tuple[NDArrays, int]],
+    reference: NDArrays | None = None,
+    max_norm: float = 10.0,
+    pool: LayerPool = SERIAL,
+) -> NDArrays:
+    """Weighted average of client updates from `reference`, each clipped to
+    L2 norm `max_norm` over all layers.
+    Without `reference` there are no updates to clip, so this is
+    `weighted_average`."""
+    if reference is None:
+        return weighted_average(results, pool=pool)
+    flat_reference = [ref.reshape(-1) for ref in reference]
+    clients_layers = flat_layers(results)
+    n_examples = np.array([num_examples for _, num_examples in results], np.float64)
+
+    def update(shard: Shard) -> NDArray:
+        index, coordinates = shard
+        return stacked_shard(clients_layers, shard) - flat_reference[index][coordinates]
+
+    def squares(shard: Shard) -> NDArray:
+        shard_update = update(shard)
+        return np.einsum("ij,ij->i", shard_update, shard_update, dtype=np.float64)
+
+    tasks = shards(ref.size for ref in reference)
+    # Partial sums are added in shard order, whatever thread computed them.
+    norms = np.sqrt(np.sum(pool.map(squares, tasks), axis=0))
+    scales = np.minimum(1.0, max_norm / np.maximum(norms, np.finfo(np.float64).tiny))
+    coefficients = scales * n_examples / n_examples.sum()
+    return map_shards(
+        lambda shard: flat_reference[shard[0]][shard[1]] + coefficients @ update(shard),
+        reference,
+        pool,
+    )
+
+
+AGGREGATORS: dict[str, Callable[..., NDArrays]] = {
+    "median": coordinate_median,
+    "trimmed_mean": trimmed_mean,
+    "clip": clipped_average,
+}
+"""Robust aggregators over all clients at once, by name.
+Each takes `(results, reference, pool, **options)` where `results` are
+`(weights, num_examples)`, `reference` the current global weights and `pool`
+the `LayerPool` to run on."""
@@ -0,0 +1,94 @@
+"""Async versions of the hot `train.views`, used when `ASYNC_VIEWS` is set.
+
+Under ASGI, Django runs sync views one at a time per worker on a single
+thread, so these query with the async ORM and hand only blocking work
+to threads. They accept JSON bodies only, as sent by the Android client."""
+import json
+import logging
+from typing import OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.db import connection
+from django.http import HttpRequest, JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from train.data import ServerData, TrainingConfig
+from train.models import *
+from train.scheduler import lease_status, live_leases, server
+from train.serializers import *
+from train.views import advertised_cache_key
+
+from backend.settings import ADVERTISED_CACHE_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+
+def json_body(request: HttpRequest) -> dict | None:
+    try:
+        data = json.loads(request.body or b"{}")
+    except ValueError:
+        return
+    if isinstance(data, dict):
+        return data
+
+
+def json_response(data, status: int = 200) -> JsonResponse:
+    return JsonResponse(data, status=status, safe=False)
+
+
+@csrf_exempt
+@require_POST
+async def advertise_model(request: HttpRequest):
+    data = json_body(request)
+    if data is None:
+        return json_response("Expected a JSON object.", 400)
+    data_type = data.get("data_type")
+    if not type(data_type) == str:
+        logger.error(f"Looking up model for non-string data_type `{data_type}`.")
+        return json_response("No model corresponding to data_type", 404)
+    advertised = await cache.aget(advertised_cache_key(data_type))
+    if advertised is None:
+        model = await TFLiteModel.objects.filter(data_type__name=data_type).alast()
+        if model is None:
+            return json_response("No model corresponding to data_type", 404)
+        advertised = TFLiteModelSerializer(model).data
+        await cache.aset(
+            advertised_cache_key(data_type), advertised, ADVERTISED_CACHE_TIMEOUT
+        )
+    return json_response(advertised)
+
+
+def start_server(
+    model: TFLiteModel, start_fresh: bool, config: TrainingConfig
+) -> ServerData:
+    """`server` on a thread of its own, closing its database connection after."""
+    try:
+        return server(model, start_fresh, config)
+    finally:
+        connection.close()
+
+
+@csrf_exempt
+@require_POST
+async def request_server(request: HttpRequest):
+    serializer = PostServerDataSerializer(data=json_body(request))  # type: ignore
+    if not serializer.is_valid():
+        logger.error(serializer.errors)
+        return json_response(serializer.errors, 400)
+    data: OrderedDict = serializer.validated_data  # type: ignore
+    lease = await live_leases().filter(tflite_model_id=data["id"]).afirst()
+    if lease is not None:
+        return json_response(lease_status(lease, data["start_fresh"]).__dict__)
+    try:
+        model = await TFLiteModel.objects.aget(pk=data["id"])
+    except TFLiteModel.DoesNotExist:
+        logger.error(f"Model with id {data['id']} not found.")
+        return json_response("Model not found", 404)
+    config = TrainingConfig(**data.get("config", {}))
+    # Waits up to `FLOWER_READY_TIMEOUT` for a new server, so not on the
+    # thread shared by all thread-sensitive sync code of this worker.
+    response = await sync_to_async(start_server, thread_sensitive=False)(
+        model, data["start_fresh"], config
+    )
+    return json_response(response.__dict__)
@@ -0,0 +1,103 @@
+"""Delta encoding of consecutive `ModelParams` of the same model.
+
+A delta stores parameters relative to a reference, the previous round as
+decoded, so that quantization errors do not accumulate along the chain.
+Encodings:
+- `xor`: XOR of the `float32` bit patterns, lossless.
+- `float16`: difference cast to `float16`.
+- `int8`: difference linearly quantized per layer to `int8`.
+
+Payloads are byte-shuffled, grouping the n-th byte of every element together,
+then compressed with zlib."""
+import zlib
+
+import numpy as np
+from flwr.common import NDArrays
+
+ENCODINGS = ("xor", "float16", "int8")
+
+LOSSLESS = ("xor",)
+
+INT8_MAX = 127
+
+
+def shuffle(array: np.ndarray) -> np.ndarray:
+    return np.ascontiguousarray(array.view(np.uint8).reshape(-1, array.itemsize).T)
+
+
+def unshuffle(buffer: bytes, dtype) -> np.ndarray:
+    itemsize = np.dtype(dtype).itemsize
+    shuffled = np.frombuffer(buffer, np.uint8).reshape(itemsize, -1)
+    return np.ascontiguousarray(shuffled.T).view(dtype).reshape(-1)
+
+
+def encode_delta(params: NDArrays, reference: NDArrays, encoding: str) -> bytes:
+    """Encode `params` relative to `reference` with the same layout."""
+    if encoding == "xor":
+        layers = [
+            np.bitwise_xor(layer.view(np.uint32), ref.view(np.uint32))
+            for layer, ref in zip(params, reference, strict=True)
+        ]
+        payload = shuffle(np.concatenate(layers))
+    elif encoding == "float16":
+        layers = [
+            np.subtract(layer, ref, dtype=np.float32).astype(np.float16)
+            for layer, ref in zip(params, reference, strict=True)
+        ]
+        payload = shuffle(np.concatenate(layers))
+    elif encoding == "int8":
+        diffs = [
+            np.subtract(layer, ref, dtype=np.float32)
+            for layer, ref in zip(params, reference, strict=True)
+        ]
+        scales = np.array(
+            [np.abs(diff).max(initial=0.0) / INT8_MAX for diff in diffs],
+            dtype=np.float32,
+        )
+        quantized = [
+            np.rint(diff / scale if scale > 0 else diff).astype(np.int8)
+            for diff, scale in zip(diffs, scales)
+        ]
+        payload = scales.tobytes() + np.concatenate(quantized).tobytes()
+    else:
+        raise ValueError(f"Unknown delta encoding `{encoding}`.")
+    return zlib.compress(payload)
+
+
+def decode_delta(blob, reference: NDArrays, encoding: str) -> NDArrays:
+    """Decode `blob` from `encode_delta` against the same `reference`."""
+    payload = zlib.decompress(blob)
+    counts = [ref.size for ref in reference]
+    if encoding == "xor":
+        flat = unshuffle(payload, np.uint32)
+        layers = np.split(flat, np.cumsum(counts)[:-1])
+        return [
+            np.bitwise_xor(ref.view(np.uint32), layer).view(np.float32)
+            for ref, layer in zip(reference, layers, strict=True)
+        ]
+    if encoding == "float16":
+        flat = unshuffle(payload, np.float16)
+        layers = np.split(flat, np.cumsum(counts)[:-1])
+    elif encoding == "int8":
+        scales = np.frombuffer(payload, np.float32, count=len(reference))
+        flat = np.frombuffer(payload, np.int8, offset=scales.nbytes)
+        layers = [
+            layer * scale
+            for layer, scale in zip(np.split(flat, np.cumsum(counts)[:-1]), scales)
+        ]
+    else:
+        raise ValueError(f"Unknown delta encoding `{encoding}`.")
+    return [
+        np.add(ref, layer, dtype=np.float32)
+        for ref, layer in zip(reference, layers, strict=True)
+    ]
+
+
+def max_error(params: NDArrays, decoded: NDArrays) -> float:
+    return max(
+        (
+            float(np.abs(layer - dec).max(initial=0.0))
+            for layer, dec in zip(params, decoded)
+        ),
+        default=0.0,
+    )
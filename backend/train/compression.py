@@ -0,0 +1,126 @@
+"""Compressed client updates.
+
+`TrainingConfig.compression` offers clients an encoding through the fit
+config. A client that supports it compresses its `FitRes.parameters` and
+sets their `tensor_type` to the encoding's name; other clients keep
+sending raw float32 layers, whatever their `tensor_type` says.
+Each tensor holds one layer, little-endian:
+
+- "float16": the weights as float16.
+- "int8": float32 minimum and scale, then one uint8 code per weight,
+    weight = minimum + code * scale.
+- "topk": k int32 indices, then k float32 values, of the largest entries of
+    the update, i.e., the weights minus those the client received;
+    the other entries of the update are zero.
+
+Always change together with Android `Compression.kt`.
+"""
+import numpy as np
+from flwr.common import NDArrays, Parameters
+from numpy.typing import NDArray
+from train.params import TENSOR_TYPE
+
+COMPRESSIONS = ("float16", "int8", "topk")
+
+TOPK_RATIO = 0.01
+
+FLOAT32 = np.dtype("<f4")
+FLOAT16 = np.dtype("<f2")
+INDEX = np.dtype("<i4")
+INT8_HEADER = 2 * FLOAT32.itemsize
+
+
+def decode_layer(tensor: bytes, encoding: str, reference: NDArray | None) -> NDArray:
+    """Weights from one layer `tensor` in `encoding`. Raw float32 layers are
+    returned as views into `tensor`. `reference` is the layer the client
+    received, needed for "topk"."""
+    if encoding == "float16":
+        return np.frombuffer(tensor, FLOAT16).astype(FLOAT32)
+    if encoding == "int8":
+        minimum, scale = np.frombuffer(tensor, FLOAT32, 2)
+        codes = np.frombuffer(tensor, np.uint8, offset=INT8_HEADER)
+        return codes.astype(FLOAT32) * scale + minimum
+    if encoding == "topk":
+        if reference is None:
+            raise ValueError("topk update without reference weights.")
+        if len(tensor) % (INDEX.itemsize + FLOAT32.itemsize):
+            raise ValueError(f"topk tensor of {len(tensor)} bytes.")
+        k = len(tensor) // (INDEX.itemsize + FLOAT32.itemsize)
+        indices = np.frombuffer(tensor, INDEX, k)
+        values = np.frombuffer(tensor, FLOAT32, k, offset=k * INDEX.itemsize)
+        if k and (indices.min() < 0 or indices.max() >= reference.size):
+            raise ValueError("topk index out of range.")
+        weights = reference.astype(FLOAT32, copy=True)
+        weights[indices] += values
+        return weights
+    return np.frombuffer(tensor, FLOAT32)
+
+
+def decode(parameters: Parameters, reference: NDArrays | None) -> NDArrays:
+    """Weights from client `parameters`, encoded as their `tensor_type` says,
+    against `reference`, the weights the client received.
+    Raises `ValueError` if they do not have the layers of `reference`."""
+    encoding = parameters.tensor_type
+    if reference is None:
+        return [decode_layer(tensor, encoding, None) for tensor in parameters.tensors]
+    if len(reference) != len(parameters.tensors):
+        raise ValueError(
+            f"{len(parameters.tensors)} layers, expected {len(reference)}."
+        )
+    weights = []
+    for index, (tensor, layer) in enumerate(zip(parameters.tensors, reference)):
+        decoded = decode_layer(tensor, encoding, layer)
+        if decoded.size != layer.size:
+            raise ValueError(
+                f"layer {index} of {decoded.size} weights, expected {layer.size}."
+            )
+        weights.append(decoded)
+    return weights
+
+
+def encode_layer(
+    layer: NDArray, encoding: str, reference: NDArray | None, topk_ratio: float
+) -> bytes:
+    """Inverse of `decode_layer`, as clients compress."""
+    layer = layer.astype(FLOAT32, copy=False)
+    if encoding == "float16":
+        return layer.astype(FLOAT16).tobytes()
+    if encoding == "int8":
+        minimum, maximum = (layer.min(), layer.max()) if layer.size else (0, 0)
+        scale = FLOAT32.type((maximum - minimum) / 255)
+        codes = np.zeros(layer.shape, np.uint8)
+        if scale > 0:
+            codes = np.rint((layer - minimum) / scale).astype(np.uint8)
+        return np.array([minimum, scale], FLOAT32).tobytes() + codes.tobytes()
+    if encoding == "topk":
+        assert reference is not None
+        update = layer - reference
+        k = min(max(1, int(update.size * topk_ratio)), update.size)
+        indices = np.argpartition(np.abs(update), -k)[-k:].astype(INDEX)
+        return indices.tobytes() + update[indices].astype(FLOAT32).tobytes()
+    return layer.tobytes()
+
+
+def encode(
+    weights: NDArrays,
+    encoding: str | None,
+    reference: NDArrays | None = None,
+    topk_ratio: float = TOPK_RATIO,
+) -> Parameters:
+    """Client `weights` as `FitRes.parameters` in `encoding`,
+    or raw float32 if `None`."""
+    if encoding is None:
+        tensors = [layer.astype(FLOAT32).tobytes() for layer in weights]
+        return Parameters(tensors, TENSOR_TYPE)
+    references = reference or [None] * len(weights)
+    tensors = [
+        encode_layer(layer, encoding, ref, topk_ratio)
+        for layer, ref in zip(weights, references)
+    ]
+    return Parameters(tensors, encoding)
+
+
+def bytes_saved(parameters: Parameters, weights: NDArrays) -> int:
+    """Bytes `parameters` saved against raw float32 `weights`."""
+    raw = sum(layer.size for layer in weights) * FLOAT32.itemsize
+    return raw - sum(len(tensor) for tensor in parameters.tensors)
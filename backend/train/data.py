@@ -1,4 +1,8 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+
+from flwr.common import Scalar
+from train.aggregate import MAX_NORM_RATIO
+from train.compression import TOPK_RATIO
 
 
 # Always change together with Android `HttpClient.ServerData`.
@@ -7,3 +11,64 @@ class ServerData:
     status: str
     session_id: int | None
     port: int | None
+    params_version: str | None = None
+    """`train.params.params_version` of the parameters the session started
+    from, `None` if fresh; see `train.views.latest_params`."""
+
+
+@dataclass
+class Heartbeat:
+    """Sent by `train.run.flwr_server` on its params queue every
+    `FLOWER_HEARTBEAT_INTERVAL` seconds, see `train.scheduler.Server.supervise`."""
+
+    clients: int
+    """Clients connected to the Flower server."""
+
+
+# Always change together with `TrainingConfigSerializer` in `train.serializers`.
+@dataclass
+class TrainingConfig:
+    """Configuration of the Flower server for one training session."""
+
+    num_rounds: int = 3
+    fraction_fit: float = 1.0
+    fraction_evaluate: float = 1.0
+    min_fit_clients: int = 1
+    min_evaluate_clients: int = 1
+    min_available_clients: int = 1
+    batch_size: int = 32
+    local_epochs: int = 2
+    schedule: dict[str, list[list[int]]] = field(default_factory=dict)
+    """Per-round overrides of `batch_size` or `local_epochs`, as
+    `[first_round, value]` pairs, e.g. `{"local_epochs": [[1, 1], [3, 2]]}`
+    for one local epoch in rounds 1 and 2, and two afterwards."""
+    aggregator: str = "fedavg"
+    """See `train.run.FedAvgAndroidSave`."""
+    aggregator_options: dict = field(default_factory=dict)
+    max_norm_ratio: float | None = MAX_NORM_RATIO
+    buffer_size: int | None = None
+    """Run asynchronous buffered aggregation if set, see `train.fedbuff`,
+    which always averages, so only with the "fedavg" `aggregator`."""
+    compression: str | None = None
+    """Compression of fit results offered to clients, see `train.compression`."""
+    topk_ratio: float = TOPK_RATIO
+    """Fraction of each layer's update clients send with "topk" compression."""
+    error_feedback: bool = False
+    """Ask clients to add what compression lost to their next fit results."""
+
+    def fit_config(self, server_round: int) -> dict[str, Scalar]:
+        """Return training configuration dict for `server_round`."""
+        config: dict[str, Scalar] = {
+            "batch_size": self.batch_size,
+            "local_epochs": self.local_epochs,
+        }
+        for key, steps in self.schedule.items():
+            for first_round, value in sorted(steps):
+                if server_round >= first_round:
+                    config[key] = value
+        if self.compression is not None:
+            config["compression"] = self.compression
+            config["error_feedback"] = self.error_feedback
+            if self.compression == "topk":
+                config["topk_ratio"] = self.topk_ratio
+        return config
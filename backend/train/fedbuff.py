@@ -0,0 +1,223 @@
+"""Asynchronous buffered aggregation, as in FedBuff, for `flwr_server`.
+
+Instead of rounds that wait for the slowest client, every idle client is
+given the current global weights as soon as it is free.
+Each finished client contributes its update, the difference from the global
+weights it was given, to a buffer.
+Once the buffer holds `buffer_size` updates, their staleness-weighted average
+is applied to the global weights and the version, the "round", advances.
+Staleness is how many versions the global weights advanced while the client
+trained; an update is weighted by `num_examples * (1 + staleness) ** -exponent`."""
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from logging import getLogger
+from time import monotonic, sleep
+from timeit import default_timer
+from typing import TYPE_CHECKING
+
+import numpy as np
+from flwr.common import Code, FitIns, NDArrays
+from flwr.server import History, Server
+from flwr.server.client_manager import ClientManager
+from flwr.server.client_proxy import ClientProxy
+from flwr.server.server import fit_client
+from train.aggregate import RunningWeightedAverage, screen
+
+if TYPE_CHECKING:
+    from train.run import FedAvgAndroidSave
+
+logger = getLogger(__name__)
+
+POLL_INTERVAL = 1.0
+
+RETRY_BACKOFF = 5.0
+"""Seconds before a client whose fit failed is dispatched again,
+doubled with each further failure up to `MAX_RETRY_BACKOFF`."""
+
+MAX_RETRY_BACKOFF = 300.0
+
+
+def staleness_weight(staleness: int, exponent: float) -> float:
+    return (1 + staleness) ** -exponent
+
+
+class UpdateBuffer:
+    """Staleness-weighted average of up to `size` client updates."""
+
+    def __init__(self, size: int, exponent: float = 0.5) -> None:
+        if size < 1:
+            raise ValueError(f"Buffer size {size} is not positive.")
+        self.size = size
+        self.exponent = exponent
+        self.average = RunningWeightedAverage()
+        self.staleness: list[int] = []
+
+    def add(self, update: NDArrays, num_examples: int, staleness: int):
+        weight = num_examples * staleness_weight(staleness, self.exponent)
+        self.average.add(update, weight)
+        self.staleness.append(staleness)
+
+    def full(self) -> bool:
+        return self.average.num_clients >= self.size
+
+    def flush(self, weights: NDArrays, server_lr: float) -> NDArrays:
+        """Apply the buffered updates to `weights` and empty the buffer."""
+        update = self.average.result()
+        self.average = RunningWeightedAverage()
+        self.staleness = []
+        return [
+            (layer + server_lr * delta).astype(layer.dtype)
+            for layer, delta in zip(weights, update, strict=True)
+        ]
+
+
+class AsyncServer(Server):
+    """Flower server running FedBuff instead of synchronous rounds.
+    `num_rounds` in `fit` is the number of buffer flushes, after
+    `FedAvgAndroidSave.first_round` versions if resumed."""
+
+    def __init__(
+        self,
+        *,
+        client_manager: ClientManager,
+        strategy: "FedAvgAndroidSave",
+        buffer_size: int,
+        staleness_exponent: float = 0.5,
+        max_staleness: int | None = None,
+        server_lr: float = 1.0,
+    ) -> None:
+        super().__init__(client_manager=client_manager, strategy=strategy)
+        self.strategy: "FedAvgAndroidSave" = strategy
+        self.buffer = UpdateBuffer(buffer_size, staleness_exponent)
+        self.max_staleness = max_staleness
+        """Discard updates staler than this."""
+        self.server_lr = server_lr
+        self.failures: dict[str, tuple[int, float]] = {}
+        """Consecutive failed fits and when to dispatch again, by `cid`."""
+
+    def fit(self, num_rounds: int, timeout: float | None) -> tuple[History, float]:
+        history = History()
+        strategy = self.strategy
+        self.parameters = self._get_initial_parameters(server_round=0, timeout=timeout)
+        version = 0
+        # Global weights of each version still needed to compute updates.
+        snapshots = {version: strategy.parameters_to_ndarrays(self.parameters)}
+        in_flight: dict[Future, tuple[ClientProxy, int]] = {}
+        self._client_manager.wait_for(strategy.min_available_clients)
+        start_time = default_timer()
+        executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        try:
+            while version < num_rounds:
+                self.dispatch_idle(executor, in_flight, version, timeout)
+                if not in_flight:
+                    # No client connected or all backing off.
+                    sleep(POLL_INTERVAL)
+                    continue
+                done, _ = wait(in_flight, POLL_INTERVAL, FIRST_COMPLETED)
+                for future in done:
+                    client, base = in_flight.pop(future)
+                    finished = self.finished_weights(future, client, snapshots[base])
+                    if finished is None:
+                        self.back_off(client.cid)
+                        continue
+                    self.failures.pop(client.cid, None)
+                    weights, num_examples = finished
+                    staleness = version - base
+                    if (
+                        self.max_staleness is not None
+                        and staleness > self.max_staleness
+                    ):
+                        logger.warning(
+                            f"Discarding {client.cid}: staleness {staleness}."
+                        )
+                        continue
+                    update = [
+                        layer - reference
+                        for layer, reference in zip(
+                            weights, snapshots[base], strict=True
+                        )
+                    ]
+                    self.buffer.add(update, num_examples, staleness)
+                    if not self.buffer.full():
+                        continue
+                    mean_staleness = float(np.mean(self.buffer.staleness))
+                    aggregated = self.buffer.flush(snapshots[version], self.server_lr)
+                    version += 1
+                    snapshots[version] = aggregated
+                    self.parameters = strategy.ndarrays_to_parameters(aggregated)
+                    strategy.signal_save_params(
+                        aggregated, strategy.first_round + version
+                    )
+                    history.add_metrics_distributed_fit(
+                        server_round=version,
+                        metrics={
+                            "staleness": mean_staleness,
+                            "elapsed": default_timer() - start_time,
+                        },
+                    )
+                    logger.info(
+                        f"Version {version}, mean staleness {mean_staleness:.2f}."
+                    )
+                    if version >= num_rounds:
+                        break
+                in_use = {base for _, base in in_flight.values()} | {version}
+                for stale in snapshots.keys() - in_use:
+                    del snapshots[stale]
+        finally:
+            # Do not wait for clients still training on outdated weights.
+            executor.shutdown(wait=False, cancel_futures=True)
+        elapsed = default_timer() - start_time
+        res_fed = self.evaluate_round(server_round=version, timeout=timeout)
+        if res_fed is not None and res_fed[0] is not None:
+            history.add_loss_distributed(server_round=version, loss=res_fed[0])
+            history.add_metrics_distributed(server_round=version, metrics=res_fed[1])
+        return history, elapsed
+
+    def dispatch_idle(
+        self,
+        executor: ThreadPoolExecutor,
+        in_flight: dict[Future, tuple[ClientProxy, int]],
+        version: int,
+        timeout: float | None,
+    ):
+        """Start fitting the current global weights on every idle client
+        not backing off after a failure."""
+        at = monotonic()
+        busy = {client.cid for client, _ in in_flight.values()} | {
+            cid for cid, (_, retry_at) in self.failures.items() if retry_at > at
+        }
+        server_round = self.strategy.first_round + version + 1
+        config = {}
+        if self.strategy.on_fit_config_fn is not None:
+            config = self.strategy.on_fit_config_fn(server_round)
+        ins = FitIns(self.parameters, config)
+        for cid, client in self._client_manager.all().items():
+            if cid not in busy:
+                future = executor.submit(fit_client, client, ins, timeout, server_round)
+                in_flight[future] = (client, version)
+
+    def back_off(self, cid: str):
+        failures = self.failures.get(cid, (0, 0.0))[0] + 1
+        backoff = min(RETRY_BACKOFF * 2 ** (failures - 1), MAX_RETRY_BACKOFF)
+        self.failures[cid] = (failures, monotonic() + backoff)
+
+    def finished_weights(
+        self, future: Future, client: ClientProxy, reference: NDArrays
+    ) -> tuple[NDArrays, int] | None:
+        """Weights and number of examples from a finished `fit_client`
+        `future`, decompressed against `reference`, the weights the client
+        received, or `None` if it failed or the weights are invalid."""
+        if future.exception() is not None:
+            logger.error(f"Fit on {client.cid} failed: {future.exception()}.")
+            return
+        _, fit_res = future.result()
+        if fit_res.status.code != Code.OK:
+            logger.error(f"Fit on {client.cid} failed: {fit_res.status.message}.")
+            return
+        weights = self.strategy.decode_fit_res(client, fit_res, reference)
+        if weights is None:
+            return
+        _, (reason,) = screen([weights], max_norm_ratio=None)
+        if reason is not None:
+            logger.error(f"Discarding weights from {client.cid}: {reason}.")
+            return
+        return weights, fit_res.num_examples
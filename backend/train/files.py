@@ -0,0 +1,130 @@
+"""Serve TFLite model files with strong ETags and byte ranges.
+
+The ETag is the SHA-256 of the file content, so phones can skip downloading
+an unchanged model with `If-None-Match` and resume a partial download with
+`Range` and `If-Range`."""
+import mimetypes
+import os
+from hashlib import file_digest
+from pathlib import Path
+from threading import Lock
+
+from django.http import (
+    FileResponse,
+    HttpRequest,
+    HttpResponse,
+    HttpResponseNotModified,
+    StreamingHttpResponse,
+)
+from django.utils.http import parse_etags
+
+CHUNK_SIZE = 64 * 1024
+
+_digests: dict[Path, tuple[int, int, str]] = {}
+"""Cached `(mtime_ns, size, digest)` of served files."""
+_digests_lock = Lock()
+
+
+def etag_for(path: Path) -> str:
+    """Strong ETag of the file at `path`, hashed once per modification."""
+    stat = path.stat()
+    with _digests_lock:
+        cached = _digests.get(path)
+    if cached is not None and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+        return f'"{cached[2]}"'
+    with open(path, "rb") as file:
+        digest = file_digest(file, "sha256").hexdigest()
+    with _digests_lock:
+        _digests[path] = (stat.st_mtime_ns, stat.st_size, digest)
+    return f'"{digest}"'
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def parse_range(header: str, size: int) -> tuple[int, int] | None:
+    """Parse a single-range `Range` header into inclusive `(start, end)`.
+    Return `None` if malformed or unsupported, to ignore it and serve the
+    whole file; raise `RangeNotSatisfiable` if no byte of it is in the file."""
+    unit, _, spec = header.partition("=")
+    first, dash, last = spec.strip().partition("-")
+    if unit.strip() != "bytes" or not dash:
+        return None
+    if not all(part.isdigit() for part in (first, last) if part):
+        return None
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+        if last and int(last) < start:
+            return None
+    elif last:
+        start = max(size - int(last), 0)
+        end = size - 1
+        if int(last) == 0:
+            raise RangeNotSatisfiable(header)
+    else:
+        return None
+    if start >= size:
+        raise RangeNotSatisfiable(header)
+    return start, end
+
+
+def read_range(path: Path, start: int, length: int):
+    with open(path, "rb") as file:
+        file.seek(start)
+        while length > 0:
+            chunk = file.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                return
+            length -= len(chunk)
+            yield chunk
+
+
+def serve_file(request: HttpRequest, path: Path) -> HttpResponse:
+    """Respond with the file at `path`, honoring `If-None-Match`, `Range`
+    and `If-Range`."""
+    etag = etag_for(path)
+    if_none_match = request.headers.get("If-None-Match")
+    if if_none_match is not None:
+        etags = parse_etags(if_none_match)
+        if "*" in etags or etag in etags:
+            response = HttpResponseNotModified()
+            response.headers["ETag"] = etag
+            return response
+    size = path.stat().st_size
+    content_type = mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+    range_header = request.headers.get("Range")
+    if_range = request.headers.get("If-Range")
+    response: HttpResponse | StreamingHttpResponse | None = None
+    if range_header is not None and (if_range is None or if_range == etag):
+        try:
+            byte_range = parse_range(range_header, size)
+        except RangeNotSatisfiable:
+            byte_range = None
+            response = HttpResponse(status=416)
+            response.headers["Content-Range"] = f"bytes */{size}"
+        if byte_range is not None:
+            start, end = byte_range
+            length = end - start + 1
+            response = StreamingHttpResponse(
+                read_range(path, start, length), status=206, content_type=content_type
+            )
+            response.headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+            response.headers["Content-Length"] = str(length)
+    if response is None:
+        response = FileResponse(open(path, "rb"), content_type=content_type)
+    response.headers["ETag"] = etag
+    response.headers["Accept-Ranges"] = "bytes"
+    # Always revalidate, which costs only a 304 thanks to the ETag.
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
+def resolve(root: Path, name: str) -> Path | None:
+    """File `name` under `root`, or `None` if missing or outside `root`."""
+    root = root.resolve()
+    path = (root / name).resolve()
+    if not path.is_relative_to(root) or not os.path.isfile(path):
+        return
+    return path
@@ -0,0 +1,49 @@
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.migrations.executor import MigrationExecutor
+from train.models import TrainingDataType
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = """Apply migrations to the configured database, confirm none are left,
+    report its connection settings, and write and read back a row in a
+    rolled back transaction."""
+
+    def handle(self, *args, **options):
+        call_command("migrate", interactive=False, verbosity=0)
+        executor = MigrationExecutor(connection)
+        plan = executor.migration_plan(executor.loader.graph.leaf_nodes())
+        if plan:
+            raise CommandError(f"{len(plan)} migrations left unapplied.")
+        self.stdout.write(f"{connection.vendor}: migrations applied.")
+        for name, value in self.settings():
+            self.stdout.write(f"  {name}: {value}")
+        try:
+            with transaction.atomic():
+                TrainingDataType.objects.create(name="checkdb")
+                if not TrainingDataType.objects.filter(name="checkdb").exists():
+                    raise CommandError("Row written is not read back.")
+                raise Rollback
+        except Rollback:
+            pass
+        self.stdout.write(self.style.SUCCESS("Write and read back in a transaction."))
+
+    def settings(self) -> list[tuple[str, object]]:
+        settings = connection.settings_dict
+        if connection.vendor == "sqlite":
+            with connection.cursor() as cursor:
+                pragmas = []
+                for pragma in ("journal_mode", "synchronous", "busy_timeout"):
+                    cursor.execute(f"PRAGMA {pragma}")
+                    pragmas.append((pragma, cursor.fetchone()[0]))
+            return pragmas
+        return [
+            ("pool", settings["OPTIONS"].get("pool", False)),
+            ("conn_max_age", settings["CONN_MAX_AGE"]),
+            ("conn_health_checks", settings["CONN_HEALTH_CHECKS"]),
+        ]
@@ -0,0 +1,54 @@
+from time import time
+
+from django.core.management.base import BaseCommand
+from train.models import ModelParams
+
+from backend.settings import PARAMS_STORE_DIR
+
+MIN_AGE = 3600.0
+"""Default seconds since a snapshot was written before it may be pruned.
+`train.models.make_model_params` stores snapshots before their
+`ModelParams` row is saved."""
+
+
+class Command(BaseCommand):
+    help = """Delete snapshots in `PARAMS_STORE_DIR` that no `ModelParams` row
+    refers to anymore, such as those of deleted models or sessions, and left
+    over temporary files."""
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--min-age",
+            type=float,
+            default=MIN_AGE,
+            help="Only delete files not modified for this many seconds.",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only report the files that would be deleted.",
+        )
+
+    def handle(self, *args, min_age: float, dry_run: bool, **options):
+        if not PARAMS_STORE_DIR.is_dir():
+            self.stdout.write(f"No params store at {PARAMS_STORE_DIR}.")
+            return
+        before = time() - min_age
+        # `train.store.put` touches the files it stores, even if already there,
+        # so files of rows saved after this query are too recent to delete.
+        referenced = set(ModelParams.objects.values_list("digest", flat=True))
+        count = size = 0
+        for path in PARAMS_STORE_DIR.glob("*/*"):
+            if not path.is_file() or path.name in referenced:
+                continue
+            stat = path.stat()
+            if stat.st_mtime > before:
+                continue
+            if not dry_run:
+                path.unlink(missing_ok=True)
+            count += 1
+            size += stat.st_size
+        verb = "Would delete" if dry_run else "Deleted"
+        self.stdout.write(
+            self.style.SUCCESS(f"{verb} {count} orphaned files, {size} bytes.")
+        )
@@ -0,0 +1,35 @@
+# Convert pickled `ModelParams.params` to the flat format in `train.params`.
+
+from pickle import dumps, loads
+
+from django.db import migrations
+from train.params import decode_params, encode_params
+
+
+def pickle_to_flat(apps, schema_editor):
+    ModelParams = apps.get_model("train", "ModelParams")
+    for model_params in ModelParams.objects.iterator():
+        params = loads(model_params.params)
+        model_params.params = encode_params(params)
+        model_params.save(update_fields=["params"])
+
+
+def flat_to_pickle(apps, schema_editor):
+    ModelParams = apps.get_model("train", "ModelParams")
+    for model_params in ModelParams.objects.select_related("tflite_model").iterator():
+        # Layers come back flat, their shapes are not in the flat format.
+        params = decode_params(
+            model_params.params, model_params.tflite_model.layers_sizes
+        )
+        model_params.params = dumps([layer.copy() for layer in params])
+        model_params.save(update_fields=["params"])
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("train", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.RunPython(pickle_to_flat, flat_to_pickle),
+    ]
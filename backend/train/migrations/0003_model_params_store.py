@@ -0,0 +1,58 @@
+# Move `ModelParams.params` blobs into the content-addressed `train.store`.
+
+from django.db import migrations, models
+from train import store
+
+
+def blobs_to_store(apps, schema_editor):
+    ModelParams = apps.get_model("train", "ModelParams")
+    for model_params in ModelParams.objects.select_related("tflite_model").iterator():
+        digest, size = store.put(model_params.params)
+        model_params.digest = digest
+        model_params.size = size
+        model_params.layers_sizes = model_params.tflite_model.layers_sizes
+        model_params.save(update_fields=["digest", "size", "layers_sizes"])
+
+
+def store_to_blobs(apps, schema_editor):
+    ModelParams = apps.get_model("train", "ModelParams")
+    for model_params in ModelParams.objects.iterator():
+        model_params.params = bytes(store.get(model_params.digest))
+        model_params.save(update_fields=["params"])
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("train", "0002_flat_model_params"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="modelparams",
+            name="digest",
+            field=models.CharField(default="", editable=False, max_length=64),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name="modelparams",
+            name="size",
+            field=models.BigIntegerField(default=0, editable=False),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name="modelparams",
+            name="layers_sizes",
+            field=models.JSONField(default=list, editable=False),
+            preserve_default=False,
+        ),
+        migrations.AlterField(
+            model_name="modelparams",
+            name="params",
+            field=models.BinaryField(default=b""),
+        ),
+        migrations.RunPython(blobs_to_store, store_to_blobs),
+        migrations.RemoveField(
+            model_name="modelparams",
+            name="params",
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:32
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("train", "0003_model_params_store"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="modelparams",
+            name="depth",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="modelparams",
+            name="encoding",
+            field=models.CharField(default="full", editable=False, max_length=16),
+        ),
+        migrations.AddField(
+            model_name="modelparams",
+            name="reference",
+            field=models.ForeignKey(
+                editable=False,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="deltas",
+                to="train.modelparams",
+            ),
+        ),
+    ]
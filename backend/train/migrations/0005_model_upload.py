@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:40
+
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("train", "0004_model_params_delta"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ModelUpload",
+            fields=[
+                (
+                    "id",
+                    models.UUIDField(
+                        default=uuid.uuid4,
+                        editable=False,
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                ("name", models.CharField(editable=False, max_length=64)),
+                ("file_name", models.CharField(editable=False, max_length=64)),
+                ("layers_sizes", models.JSONField(editable=False)),
+                ("data_type", models.CharField(editable=False, max_length=256)),
+                ("size", models.BigIntegerField(editable=False)),
+                ("sha256", models.CharField(editable=False, max_length=64)),
+                ("start_time", models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
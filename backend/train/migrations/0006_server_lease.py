@@ -0,0 +1,52 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("telemetry", "0004_session_rollup"),
+        ("train", "0005_model_upload"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ServerLease",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("port", models.PositiveIntegerField(editable=False, unique=True)),
+                ("start_fresh", models.BooleanField(editable=False)),
+                ("owner", models.CharField(editable=False, max_length=128)),
+                ("pid", models.IntegerField(editable=False, null=True)),
+                ("expires", models.DateTimeField(editable=False)),
+                (
+                    "session",
+                    models.OneToOneField(
+                        editable=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="server_lease",
+                        to="telemetry.trainingsession",
+                    ),
+                ),
+                (
+                    "tflite_model",
+                    models.OneToOneField(
+                        editable=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="server_lease",
+                        to="train.tflitemodel",
+                    ),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Identify `ModelParams` by the content hash of their flat parameters.
+
+from django.db import migrations, models
+from train import store
+from train.checkpoint import decode_delta
+from train.params import decode_params, encode_params, params_version
+
+FULL = "full"
+
+
+def set_versions(apps, schema_editor):
+    ModelParams = apps.get_model("train", "ModelParams")
+    # Deltas reference the previous params of the same model.
+    last = {}
+    for model_params in ModelParams.objects.order_by("id").iterator():
+        blob = store.get(model_params.digest)
+        if model_params.encoding == FULL:
+            params = decode_params(blob, model_params.layers_sizes)
+        else:
+            reference_id, reference = last[model_params.tflite_model_id]
+            assert reference_id == model_params.reference_id
+            params = decode_delta(blob, reference, model_params.encoding)
+        last[model_params.tflite_model_id] = (model_params.id, params)
+        model_params.version = params_version([encode_params(params)])
+        model_params.save(update_fields=["version"])
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("train", "0006_server_lease"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="modelparams",
+            name="version",
+            field=models.CharField(
+                db_index=True, default="", editable=False, max_length=64
+            ),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name="serverlease",
+            name="params_version",
+            field=models.CharField(editable=False, max_length=64, null=True),
+        ),
+        migrations.RunPython(set_versions, migrations.RunPython.noop),
+    ]
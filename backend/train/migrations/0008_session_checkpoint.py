@@ -0,0 +1,55 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("telemetry", "0006_session_end_reason"),
+        ("train", "0007_params_version"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SessionCheckpoint",
+            fields=[
+                (
+                    "session",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="checkpoint",
+                        serialize=False,
+                        to="telemetry.trainingsession",
+                    ),
+                ),
+                (
+                    "server_round",
+                    models.PositiveIntegerField(default=0, editable=False),
+                ),
+                ("start_fresh", models.BooleanField(editable=False)),
+                ("updated", models.DateTimeField(auto_now=True)),
+                (
+                    "params",
+                    models.ForeignKey(
+                        editable=False,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="checkpoints",
+                        to="train.modelparams",
+                    ),
+                ),
+                (
+                    "tflite_model",
+                    models.ForeignKey(
+                        editable=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="checkpoints",
+                        to="train.tflitemodel",
+                    ),
+                ),
+            ],
+        ),
+    ]
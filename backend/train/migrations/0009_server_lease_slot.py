@@ -0,0 +1,30 @@
+# Bound running servers by a unique slot per `ServerLease`.
+
+from django.db import migrations, models
+
+
+def number_slots(apps, schema_editor):
+    ServerLease = apps.get_model("train", "ServerLease")
+    for slot, lease in enumerate(ServerLease.objects.order_by("port")):
+        lease.slot = slot
+        lease.save(update_fields=["slot"])
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("train", "0008_session_checkpoint"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="serverlease",
+            name="slot",
+            field=models.PositiveIntegerField(null=True, editable=False),
+        ),
+        migrations.RunPython(number_slots, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="serverlease",
+            name="slot",
+            field=models.PositiveIntegerField(editable=False, unique=True),
+        ),
+    ]
@@ -1,10 +1,23 @@
-from pickle import dumps, loads
+from pathlib import Path
+from uuid import uuid4
 
 from django.db import models
 from numpy.typing import NDArray
+from train import store
+from train.checkpoint import decode_delta, encode_delta, max_error
+from train.params import check_layout, decode_params, encode_params, params_version
+
+from backend.settings import (
+    PARAMS_BASE_EVERY,
+    PARAMS_DELTA_ENCODING,
+    PARAMS_DELTA_TOLERANCE,
+    UPLOADS_DIR,
+)
 
 cfg = {"null": False, "editable": False}
 
+FULL = "full"
+
 
 class TrainingDataType(models.Model):
     name = models.CharField(max_length=256, unique=True, **cfg)
@@ -24,20 +37,179 @@ class TFLiteModel(models.Model):
         return f"TFLiteModel {self.name} for {self.data_type.name} at {self.file_path}, {len(self.layers_sizes)} layers"
 
 
+class ServerLease(models.Model):
+    """A running Flower server, visible to every backend worker.
+    The worker running it renews `expires` and deletes the lease when the
+    server exits; an expired lease was left behind by a dead worker."""
+
+    tflite_model = models.OneToOneField(
+        TFLiteModel, on_delete=models.CASCADE, related_name="server_lease", **cfg
+    )
+    session = models.OneToOneField(
+        "telemetry.TrainingSession",
+        on_delete=models.CASCADE,
+        related_name="server_lease",
+        **cfg,
+    )
+    port = models.PositiveIntegerField(unique=True, **cfg)
+    slot = models.PositiveIntegerField(unique=True, **cfg)
+    """One of `FLOWER_SERVER_CAPACITY` slots, so the database rejects leases
+    beyond capacity whatever its transaction isolation."""
+    start_fresh = models.BooleanField(**cfg)
+    params_version = models.CharField(max_length=64, null=True, editable=False)
+    """Version of the parameters the session started from, `None` if fresh."""
+    owner = models.CharField(max_length=128, **cfg)
+    """`host:pid` of the worker running the server."""
+    pid = models.IntegerField(null=True, editable=False)
+    """Process id of the Flower server."""
+    expires = models.DateTimeField(**cfg)
+
+    def __str__(self) -> str:
+        return f"Server on port {self.port} for session {self.session_id} owned by {self.owner} until {self.expires}"  # type: ignore
+
+
+class SessionCheckpoint(models.Model):
+    """Progress of a training session whose Flower server has not ended,
+    updated with each saved round, to resume it in a new server after the
+    backend worker running it exits or dies, see `train.scheduler.ServerPool.resume`.
+    Deleted once the session ends."""
+
+    session = models.OneToOneField(
+        "telemetry.TrainingSession",
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="checkpoint",
+    )
+    tflite_model = models.ForeignKey(
+        TFLiteModel, on_delete=models.CASCADE, related_name="checkpoints", **cfg
+    )
+    server_round = models.PositiveIntegerField(default=0, editable=False)
+    """Last round whose params were saved, 0 before the first."""
+    params = models.ForeignKey(
+        "ModelParams",
+        on_delete=models.SET_NULL,
+        null=True,
+        editable=False,
+        related_name="checkpoints",
+    )
+    """Global weights after `server_round`, or the params the session started
+    from; `None` if it started fresh."""
+    start_fresh = models.BooleanField(**cfg)
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self) -> str:
+        return f"Checkpoint of session {self.session_id} at round {self.server_round}"  # type: ignore
+
+
+# Always change together with `StartUploadDataSerializer`.
+class ModelUpload(models.Model):
+    """A chunked model file upload in progress, see `train.views.upload_chunk`.
+    Received bytes are in `part_path` until the upload completes."""
+
+    id = models.UUIDField(primary_key=True, default=uuid4, editable=False)
+    name = models.CharField(max_length=64, **cfg)
+    file_name = models.CharField(max_length=64, **cfg)
+    layers_sizes = models.JSONField(**cfg)
+    data_type = models.CharField(max_length=256, **cfg)
+    size = models.BigIntegerField(**cfg)
+    """Size of the whole file in bytes."""
+    sha256 = models.CharField(max_length=64, **cfg)
+    """Expected SHA-256 hex digest of the whole file."""
+    start_time = models.DateTimeField(auto_now_add=True)
+
+    def part_path(self) -> Path:
+        return UPLOADS_DIR / f"{self.id}.part"
+
+
 class ModelParams(models.Model):
-    """Do not initialize this class directly, use `make_model_params` instead."""
+    """Do not initialize this class directly, use `make_model_params` instead.
+    The flat parameters, see `train.params`, are kept in `train.store`,
+    either in full or delta-encoded against `reference`, see `train.checkpoint`."""
 
-    params = models.BinaryField(**cfg)
+    digest = models.CharField(max_length=64, **cfg)
+    """SHA-256 hex digest of the stored snapshot in `train.store`."""
+    size = models.BigIntegerField(**cfg)
+    """Size of the stored snapshot in bytes."""
+    layers_sizes = models.JSONField(**cfg)
+    """Layout of the parameters, `tflite_model.layers_sizes` when saved."""
+    encoding = models.CharField(max_length=16, default=FULL, **cfg)
+    """`FULL` or a delta encoding in `train.checkpoint.ENCODINGS`."""
+    reference = models.ForeignKey(
+        "self",
+        on_delete=models.CASCADE,
+        related_name="deltas",
+        null=True,
+        editable=False,
+    )
+    """Parameters a delta is encoded against, `None` for `FULL`."""
+    depth = models.PositiveIntegerField(default=0, **cfg)
+    """Number of deltas since the last full snapshot."""
+    version = models.CharField(max_length=64, db_index=True, **cfg)
+    """`train.params.params_version` of the flat parameters."""
     tflite_model = models.ForeignKey(
         TFLiteModel, on_delete=models.CASCADE, related_name="params", **cfg
     )
 
+    def buffer(self):
+        """Flat parameters, memory-mapped if stored in full."""
+        if self.encoding == FULL:
+            return store.get(self.digest)
+        return encode_params(self.decode_params())
+
     def decode_params(self) -> list[NDArray]:
-        return loads(self.params)
+        if self.encoding == FULL:
+            return decode_params(self.buffer(), self.layers_sizes)
+        chain = [self]
+        while chain[-1].encoding != FULL:
+            chain.append(chain[-1].reference)  # type: ignore
+        params = chain.pop().decode_params()
+        for delta in reversed(chain):
+            params = decode_delta(store.get(delta.digest), params, delta.encoding)
+        return params
 
     def __str__(self) -> str:
         return f"ModelParams for {self.tflite_model.name}: {self.decode_params()}"
 
 
 def make_model_params(params: list[NDArray], tflite_model: TFLiteModel) -> ModelParams:
-    return ModelParams(params=dumps(params), tflite_model=tflite_model)
+    return store_model_params(encode_params(params), tflite_model)
+
+
+def store_model_params(buffer, tflite_model: TFLiteModel) -> ModelParams:
+    """Put flat parameters `buffer` in `train.store` and reference them.
+    Encode them as a delta against the model's last parameters unless
+    `PARAMS_BASE_EVERY` rounds passed since the last full snapshot
+    or the delta would exceed `PARAMS_DELTA_TOLERANCE`."""
+    layers_sizes = tflite_model.layers_sizes
+    check_layout(buffer, layers_sizes)
+    version = params_version([buffer])
+    previous: ModelParams | None = tflite_model.params.last()  # type: ignore
+    if (
+        previous is not None
+        and previous.depth + 1 < PARAMS_BASE_EVERY
+        and previous.layers_sizes == layers_sizes
+    ):
+        params = decode_params(buffer, layers_sizes)
+        reference = previous.decode_params()
+        blob = encode_delta(params, reference, PARAMS_DELTA_ENCODING)
+        decoded = decode_delta(blob, reference, PARAMS_DELTA_ENCODING)
+        if max_error(params, decoded) <= PARAMS_DELTA_TOLERANCE:
+            digest, size = store.put(blob)
+            return ModelParams(
+                digest=digest,
+                size=size,
+                layers_sizes=layers_sizes,
+                encoding=PARAMS_DELTA_ENCODING,
+                reference=previous,
+                depth=previous.depth + 1,
+                version=version,
+                tflite_model=tflite_model,
+            )
+    digest, size = store.put(buffer)
+    return ModelParams(
+        digest=digest,
+        size=size,
+        layers_sizes=layers_sizes,
+        version=version,
+        tflite_model=tflite_model,
+    )
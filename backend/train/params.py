@@ -0,0 +1,70 @@
+"""Flat binary format for model parameters.
+
+Parameters are stored as every layer's raw `float32` bytes concatenated in
+order, without any header.
+The layout is `TFLiteModel.layers_sizes`, the size of each layer in bytes,
+so per-layer arrays are `np.frombuffer` views into the buffer, without copy.
+Each layer's bytes are exactly one tensor in flwr `Parameters.tensors`."""
+from hashlib import sha256
+from typing import Iterable
+
+import numpy as np
+from flwr.common import NDArrays, Parameters
+
+DTYPE = np.float32
+
+TENSOR_TYPE = "numpy.ndarray"
+
+
+def check_layout(buffer, layers_sizes: list[int]):
+    size = memoryview(buffer).nbytes
+    if size != sum(layers_sizes):
+        raise ValueError(
+            f"Parameters of {size} bytes do not match layers sizes {layers_sizes}."
+        )
+
+
+def encode_params(params: NDArrays) -> bytes:
+    """Concatenate the raw bytes of `params` into one buffer."""
+    return b"".join(
+        memoryview(np.ascontiguousarray(layer, dtype=DTYPE)).cast("B")
+        for layer in params
+    )
+
+
+def decode_params(buffer, layers_sizes: list[int]) -> NDArrays:
+    """Read-only per-layer views into `buffer` laid out as `layers_sizes`."""
+    check_layout(buffer, layers_sizes)
+    params = []
+    offset = 0
+    for size in layers_sizes:
+        count = size // DTYPE().itemsize
+        params.append(np.frombuffer(buffer, DTYPE, count=count, offset=offset))
+        offset += size
+    return params
+
+
+def params_to_tensors(buffer, layers_sizes: list[int]) -> Parameters:
+    """Split `buffer` into flwr `Parameters` with one tensor per layer."""
+    check_layout(buffer, layers_sizes)
+    view = memoryview(buffer).cast("B")
+    tensors = []
+    offset = 0
+    for size in layers_sizes:
+        tensors.append(view[offset : offset + size].tobytes())
+        offset += size
+    return Parameters(tensors, tensor_type=TENSOR_TYPE)
+
+
+def tensors_to_params(tensors: Iterable[bytes]) -> bytes:
+    """Concatenate flwr `Parameters.tensors` into one buffer."""
+    return b"".join(tensors)
+
+
+def params_version(tensors: Iterable) -> str:
+    """SHA-256 hex digest of the flat parameters made of `tensors`, buffers
+    concatenated in order, which identifies their content across sessions."""
+    digest = sha256()
+    for tensor in tensors:
+        digest.update(tensor)
+    return digest.hexdigest()
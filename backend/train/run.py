@@ -1,22 +1,107 @@
-"""`fig_config` and code in `server` are copied from Flower Android example."""
-import pickle
+"""Code in `flwr_server` is initially copied from Flower Android example."""
+import os
+import signal
+from concurrent.futures import ThreadPoolExecutor
 from logging import getLogger
+from multiprocessing import parent_process
+from multiprocessing.connection import Connection
+from multiprocessing.queues import Queue
+from queue import Full
+from threading import Event, Thread
+from time import perf_counter, time
 
+import numpy as np
 import requests
-from flwr.common import FitRes, Parameters, Scalar
+from flwr.common import (
+    Code,
+    EvaluateIns,
+    EvaluateRes,
+    FitIns,
+    FitRes,
+    GetPropertiesIns,
+    NDArrays,
+    Parameters,
+    Scalar,
+)
 from flwr.server import ServerConfig, start_server
+from flwr.server.client_manager import ClientManager, SimpleClientManager
 from flwr.server.client_proxy import ClientProxy
 from flwr.server.strategy import FedAvgAndroid
-from flwr.server.strategy.aggregate import aggregate
-from numpy import isnan
 from numpy.typing import NDArray
+from train.aggregate import (
+    AGGREGATORS,
+    MAX_NORM_RATIO,
+    LayerPool,
+    RunningWeightedAverage,
+    screen_norms,
+    squared_norms,
+)
+from train.compression import bytes_saved, decode
+from train.data import Heartbeat, TrainingConfig
+from train.fedbuff import AsyncServer
+from train.params import encode_params, params_version
 
-PORT = 8080
+from backend.settings import AGGREGATION_WORKERS, FLOWER_HEARTBEAT_INTERVAL
 
 logger = getLogger(__name__)
 
+UNCHANGED_PARAMETERS = Parameters([], "unchanged")
+"""Sent instead of parameters the client confirmed it holds, by returning
+their "params_version" in `EvaluateRes.metrics`, or in `GetPropertiesRes`
+when they connect holding parameters synced through `train.views.latest_params`."""
+
+PROPERTIES_TIMEOUT = 10.0
+"""Seconds a connecting client has to report the parameters version it holds."""
+
 
 class FedAvgAndroidSave(FedAvgAndroid):
+    def __init__(
+        self,
+        *args,
+        session_id: int,
+        params_queue: Queue | None = None,
+        aggregator: str = "fedavg",
+        aggregator_options: dict | None = None,
+        max_norm_ratio: float | None = MAX_NORM_RATIO,
+        aggregation_workers: int = 1,
+        first_round: int = 0,
+        **kwargs,
+    ):
+        super().__init__(*args, **kwargs)
+        self.session_id = session_id
+        self.first_round = first_round
+        """Rounds of the session finished before this server started, when
+        resumed from a `train.models.SessionCheckpoint`. Added to the round
+        numbers of the Flower server, which always counts from 1."""
+        self.params_queue = params_queue
+        """Queue to hand aggregated params to `train.scheduler.Server`."""
+        if aggregator != "fedavg" and aggregator not in AGGREGATORS:
+            raise ValueError(f"Unknown aggregator `{aggregator}`.")
+        self.aggregator = aggregator
+        """"fedavg" for weighted average or a key of `AGGREGATORS`."""
+        self.aggregator_options = aggregator_options or {}
+        self.max_norm_ratio = max_norm_ratio
+        """Discard clients whose norm exceeds this multiple of the median."""
+        self.layer_pool = LayerPool(aggregation_workers)
+        """Threads aggregating shards of layers, see `train.aggregate`."""
+        self.timings: dict[str, float] = {}
+        """Seconds spent in each phase of the last round, see
+        `telemetry.metrics.ROUND_PHASES`."""
+        self.counts: dict[str, int] = {}
+        """Clients of the last round by outcome, see
+        `telemetry.metrics.ROUND_OUTCOMES`."""
+        self.fit_configured_at: float | None = None
+        self.global_weights: NDArrays | None = (
+            None
+            if self.initial_parameters is None
+            else self.parameters_to_ndarrays(self.initial_parameters)
+        )
+        self.held_versions: dict[str, str] = {}
+        """Parameters version each client confirmed it holds, by `cid`."""
+        self.asked: set[str] = set()
+        """Clients asked for the version they connected with, by `cid`."""
+        self.evaluate_version: str | None = None
+
     def aggregate_fit(
         self,
         server_round: int,
@@ -26,71 +111,325 @@ class FedAvgAndroidSave(FedAvgAndroid):
         """Aggregate fit results using weighted average."""
         # This method is initially copied from `server/strategy/fedavg_android.py`
         # in the `flwr` repository.
+        server_round += self.first_round
         if not results:
             return None, {}
         # Do not aggregate if there are failures and failures are not accepted
         if not self.accept_failures and failures:
             return None, {}
-        # Convert results
-        weights_results = []
+        start = perf_counter()
+        self.counts = {"results": len(results), "failures": len(failures)}
+        # Weighted average adds clients one by one, so their decoded weights
+        # are only held for robust aggregators, which need all clients at once.
+        # Raw float32 layers decode to views into `fit_res`, without copy.
+        hold = self.aggregator != "fedavg"
+        decoded_results = []
+        clients_weights = []
+        squares = []
+        saved = 0
         for client, fit_res in results:
-            weights = self.parameters_to_ndarrays(fit_res.parameters)
-            if any(isnan(weight).any() for weight in weights):
+            weights = self.decode_fit_res(client, fit_res)
+            if weights is None:
+                continue
+            decoded_results.append((client, fit_res))
+            squares.append(squared_norms(weights))
+            saved += bytes_saved(fit_res.parameters, weights)
+            if hold:
+                clients_weights.append(weights)
+        received = sum(
+            len(tensor)
+            for _, fit_res in results
+            for tensor in fit_res.parameters.tensors
+        )
+        if saved:
+            logger.info(
+                f"aggregate_fit: round {server_round} received {received} bytes, "
+                f"compression saved {saved} bytes."
+            )
+        decoded_at = perf_counter()
+        if not decoded_results:
+            raise RuntimeError(
+                "aggregate_fit: No valid weights so cannot continue training."
+            )
+        _, reasons = screen_norms(
+            np.array(squares).reshape(len(squares), -1), self.max_norm_ratio
+        )
+        screened_at = perf_counter()
+        self.counts["discarded"] = len(results) - reasons.count(None)
+        valid = []
+        for index, ((client, fit_res), reason) in enumerate(
+            zip(decoded_results, reasons)
+        ):
+            if reason is None:
+                valid.append(index)
+            else:
                 logger.error(
-                    f"aggregate_fit: disgarding weights with NaN from {client}: {weights}."
+                    f"aggregate_fit: discarding weights from {client.cid}: {reason}."
                 )
-            else:
-                weights_results.append((weights, fit_res.num_examples))
-        if weights_results.__len__() == 0:
+        if valid.__len__() == 0:
             raise RuntimeError(
                 "aggregate_fit: No valid weights so cannot continue training."
             )
-        aggregated = aggregate(weights_results)
-        self.signal_save_params(aggregated)
-        return self.ndarrays_to_parameters(aggregated), {}
+        if self.aggregator == "fedavg":
+            # Decoded again, one client at a time.
+            average = RunningWeightedAverage(self.layer_pool)
+            for index in valid:
+                client, fit_res = decoded_results[index]
+                weights = self.decode_fit_res(client, fit_res)
+                assert weights is not None
+                average.add(weights, fit_res.num_examples)
+            aggregated = average.result()
+        else:
+            aggregate = AGGREGATORS[self.aggregator]
+            aggregated = aggregate(
+                [
+                    (clients_weights[index], decoded_results[index][1].num_examples)
+                    for index in valid
+                ],
+                self.global_weights,
+                pool=self.layer_pool,
+                **self.aggregator_options,
+            )
+        self.global_weights = aggregated
+        self.timings = {
+            "decode": decoded_at - start,
+            "screen": screened_at - decoded_at,
+            "aggregate": perf_counter() - screened_at,
+        }
+        if self.fit_configured_at is not None:
+            self.timings["wait"] = start - self.fit_configured_at
+        self.signal_save_params(aggregated, server_round)
+        metrics: dict[str, Scalar] = {
+            "bytes_received": received,
+            "bytes_saved": saved,
+            **{f"{phase}_seconds": value for phase, value in self.timings.items()},
+            **self.counts,
+        }
+        return self.ndarrays_to_parameters(aggregated), metrics
+
+    def configure_fit(
+        self, server_round: int, parameters: Parameters, client_manager: ClientManager
+    ) -> list[tuple[ClientProxy, FitIns]]:
+        server_round += self.first_round
+        if self.global_weights is None:
+            # Weights of a client when started fresh.
+            self.global_weights = self.parameters_to_ndarrays(parameters)
+        instructions = super().configure_fit(server_round, parameters, client_manager)
+        self.fit_configured_at = perf_counter()
+        # Training replaces the weights clients hold.
+        return self.deduplicate(instructions, FitIns, release=True)
 
-    def signal_save_params(self, params: list[NDArray]):
+    def configure_evaluate(
+        self, server_round: int, parameters: Parameters, client_manager: ClientManager
+    ) -> list[tuple[ClientProxy, EvaluateIns]]:
+        server_round += self.first_round
+        instructions = super().configure_evaluate(
+            server_round, parameters, client_manager
+        )
+        if instructions:
+            self.evaluate_version = params_version(parameters.tensors)
+        return self.deduplicate(instructions, EvaluateIns, release=False)
+
+    def deduplicate(self, instructions: list, ins_class, release: bool) -> list:
+        """Tag each instruction with the version of its parameters, and
+        replace the parameters by `UNCHANGED_PARAMETERS` for clients that hold them.
+        Forget what the clients hold if `release`."""
+        if not instructions:
+            return instructions
+        self.ask_held_versions([client for client, _ in instructions])
+        parameters = instructions[0][1].parameters
+        version = params_version(parameters.tensors)
+        size = sum(len(tensor) for tensor in parameters.tensors)
+        deduplicated = []
+        unchanged = 0
+        for client, ins in instructions:
+            held = (
+                self.held_versions.pop(client.cid, None)
+                if release
+                else self.held_versions.get(client.cid)
+            )
+            config = {**ins.config, "params_version": version}
+            if held == version:
+                unchanged += 1
+                deduplicated.append((client, ins_class(UNCHANGED_PARAMETERS, config)))
+            else:
+                deduplicated.append((client, ins_class(ins.parameters, config)))
+        if unchanged:
+            logger.info(
+                f"{unchanged} clients hold version {version[:8]}, "
+                f"saved {unchanged * size} bytes."
+            )
+        return deduplicated
+
+    def ask_held_versions(self, clients: list[ClientProxy]):
+        """Ask clients not asked yet for the parameters version they hold,
+        all at once."""
+        new = [client for client in clients if client.cid not in self.asked]
+        if not new:
+            return
+        self.asked.update(client.cid for client in new)
+        with ThreadPoolExecutor(len(new)) as executor:
+            for client, version in zip(new, executor.map(reported_version, new)):
+                if version is not None:
+                    self.held_versions[client.cid] = version
+
+    def aggregate_evaluate(
+        self,
+        server_round: int,
+        results: list[tuple[ClientProxy, EvaluateRes]],
+        failures: list[tuple[ClientProxy, EvaluateRes] | BaseException],
+    ) -> tuple[float | None, dict[str, Scalar]]:
+        server_round += self.first_round
+        for client, evaluate_res in results:
+            version = evaluate_res.metrics.get("params_version")
+            if version is not None and version == self.evaluate_version:
+                self.held_versions[client.cid] = version
+        return super().aggregate_evaluate(server_round, results, failures)
+
+    def decode_fit_res(
+        self,
+        client: ClientProxy,
+        fit_res: FitRes,
+        reference: NDArrays | None = None,
+    ) -> NDArrays | None:
+        """Weights from `fit_res`, decompressed against `reference`,
+        by default the global weights, or `None` if they do not decode."""
+        if reference is None:
+            reference = self.global_weights
+        try:
+            return decode(fit_res.parameters, reference)
+        except ValueError as err:
+            logger.error(
+                f"decode_fit_res: discarding weights from {client.cid}: {err}."
+            )
+
+    def signal_save_params(self, params: list[NDArray], server_round: int):
+        """Hand `params` to the backend through `params_queue` without waiting
+        for them to be saved, or POST them if the queue is unavailable."""
+        start = perf_counter()
+        buffer = encode_params(params)
+        self.timings["serialize"] = perf_counter() - start
+        if self.params_queue is not None:
+            try:
+                message = (buffer, server_round, time(), self.timings, self.counts)
+                return self.params_queue.put_nowait(message)
+            except (Full, ValueError) as err:
+                logger.error(f"signal_save_params: {err}, falling back to HTTP.")
         # TODO: Port resolution.
         url = "http://localhost:8000/train/params"
-        files = {"file": pickle.dumps(params)}
-        return requests.post(url, files=files)
+        files = {"file": buffer}
+        data = {"session_id": self.session_id}
+        return requests.post(url, data=data, files=files)
 
 
-def fit_config(server_round: int):
-    """Return training configuration dict for each round.
+def reported_version(client: ClientProxy) -> str | None:
+    """The "params_version" property of `client`, `None` if it holds none or
+    does not answer within `PROPERTIES_TIMEOUT`."""
+    ins = GetPropertiesIns({"params_version": ""})
+    try:
+        res = client.get_properties(ins, PROPERTIES_TIMEOUT, None)
+    except Exception as err:
+        logger.warning(f"reported_version: {client.cid} did not answer: {err}.")
+        return
+    version = res.properties.get("params_version")
+    if res.status.code == Code.OK and version:
+        return str(version)
 
-    Keep batch size fixed at 32, perform two rounds of training with one
-    local epoch, increase to two local epochs afterwards.
-    """
-    config = {
-        "batch_size": 32,
-        "local_epochs": 2,
-    }
-    return config
 
+def send_heartbeats(client_manager: ClientManager, params_queue: Queue, stop: Event):
+    """Put a `Heartbeat` on `params_queue` every `FLOWER_HEARTBEAT_INTERVAL`
+    seconds until `stop` is set. Shut the Flower server down once the backend
+    worker running it is gone, so that another worker can resume the session
+    from its checkpoint on the freed port."""
+    parent = parent_process()
+    while True:
+        if parent is not None and not parent.is_alive():
+            logger.error("Backend worker is gone, stopping Flower server.")
+            # Handled by `start_server`, which stops gRPC and exits.
+            os.kill(os.getpid(), signal.SIGTERM)
+            return
+        try:
+            params_queue.put_nowait(Heartbeat(client_manager.num_available()))
+        except (Full, ValueError):
+            pass
+        if stop.wait(FLOWER_HEARTBEAT_INTERVAL):
+            return
 
-def flwr_server(initial_parameters: Parameters | None):
-    # TODO: Make configurable.
+
+def flwr_server(
+    initial_parameters: Parameters | None,
+    port: int,
+    session_id: int,
+    params_queue: Queue | None = None,
+    config: TrainingConfig | None = None,
+    first_round: int = 0,
+):
+    """Run a Flower server on `port` configured by `config`,
+    for the rounds after `first_round`."""
+    config = config or TrainingConfig()
     strategy = FedAvgAndroidSave(
-        fraction_fit=1.0,
-        fraction_evaluate=1.0,
-        min_fit_clients=1,
-        min_evaluate_clients=1,
-        min_available_clients=1,
+        fraction_fit=config.fraction_fit,
+        fraction_evaluate=config.fraction_evaluate,
+        min_fit_clients=config.min_fit_clients,
+        min_evaluate_clients=config.min_evaluate_clients,
+        min_available_clients=config.min_available_clients,
         evaluate_fn=None,
-        on_fit_config_fn=fit_config,
+        on_fit_config_fn=config.fit_config,
         initial_parameters=initial_parameters,
+        session_id=session_id,
+        params_queue=params_queue,
+        aggregator=config.aggregator,
+        aggregator_options=config.aggregator_options,
+        max_norm_ratio=config.max_norm_ratio,
+        aggregation_workers=AGGREGATION_WORKERS,
+        first_round=first_round,
     )
+    client_manager = SimpleClientManager()
+    server = None
+    if config.buffer_size is not None:
+        server = AsyncServer(
+            client_manager=client_manager,
+            strategy=strategy,
+            buffer_size=config.buffer_size,
+        )
+
+    stop_heartbeats = Event()
+    if params_queue is not None:
+        Thread(
+            target=send_heartbeats,
+            args=(client_manager, params_queue, stop_heartbeats),
+            daemon=True,
+        ).start()
 
     logger.warning("Starting Flower server.")
     try:
-        # Start Flower server for 3 rounds of federated learning
         start_server(
-            server_address=f"0.0.0.0:{PORT}",
-            config=ServerConfig(num_rounds=3),
+            server_address=f"0.0.0.0:{port}",
+            server=server,
+            config=ServerConfig(num_rounds=config.num_rounds - first_round),
             strategy=strategy,
+            client_manager=client_manager,
         )
     except KeyboardInterrupt:
         return
     except RuntimeError as err:
         logger.error(err)
+    finally:
+        stop_heartbeats.set()
+        strategy.layer_pool.shutdown()
+        if params_queue is not None:
+            params_queue.put(None)
+
+
+def warm_server(jobs: Connection, params_queue: Queue):
+    """Wait in a process started ahead of its session for the `flwr_server`
+    arguments but `params_queue` on `jobs`, then run it.
+    Exit on `None` or once the backend worker is gone."""
+    try:
+        job = jobs.recv()
+    except (EOFError, OSError):
+        return
+    if job is None:
+        return
+    initial_parameters, port, session_id, config, first_round = job
+    flwr_server(initial_parameters, port, session_id, params_queue, config, first_round)
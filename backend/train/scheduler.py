@@ -1,73 +1,583 @@
+import os
+import socket
+from dataclasses import asdict
+from datetime import timedelta
 from logging import getLogger
-from multiprocessing import Process
-from threading import Thread
+from multiprocessing import get_context
+from multiprocessing.util import Finalize
+from queue import Empty
+from threading import Event, Lock, Thread
+from time import monotonic, sleep, time
 
-from flwr.common import Parameters
+from django.db import DatabaseError, IntegrityError, connection, transaction
+from django.utils.timezone import now
+
+from telemetry.metrics import record_round, sessions_ended
 from telemetry.models import TrainingSession
-from train.data import ServerData
+from train.data import Heartbeat, ServerData, TrainingConfig
 from train.models import *
-from train.run import PORT, flwr_server
+from train.params import params_to_tensors, params_version
+from train.run import warm_server
+
+from backend.settings import (
+    FLOWER_HEARTBEAT_INTERVAL,
+    FLOWER_IDLE_TIMEOUT,
+    FLOWER_LEASE_SECONDS,
+    FLOWER_MAX_SESSION_SECONDS,
+    FLOWER_PORTS,
+    FLOWER_READY_TIMEOUT,
+    FLOWER_ROUND_TIMEOUT,
+    FLOWER_SERVER_CAPACITY,
+    FLOWER_START_METHOD,
+    FLOWER_WARM_SERVERS,
+)
 
 logger = getLogger(__name__)
 
+context = get_context(FLOWER_START_METHOD)
+if FLOWER_START_METHOD == "forkserver":
+    context.set_forkserver_preload(["train.run"])
 
-def model_params(model: TFLiteModel):
+
+def params_tensors(params: ModelParams | None):
+    if params is None:
+        return
     try:
-        params: ModelParams = model.params.last()  # type: ignore
-        if params is None:
-            return
-        tensors = [param.tobytes() for param in params.decode_params()]
-        return Parameters(tensors, tensor_type="numpy.ndarray")
-    except RuntimeError as err:
+        return params_to_tensors(params.buffer(), params.layers_sizes)
+    except (RuntimeError, ValueError, OSError) as err:
         logger.warning(err)
 
 
-TWELVE_HOURS = 12 * 60 * 60
+def model_params(model: TFLiteModel):
+    return params_tensors(model.params.last())  # type: ignore
+
+
+QUEUE_POLL_INTERVAL = 1.0
+
+MISSED_HEARTBEATS = 6
+"""A server missing this many heartbeats in a row is "unresponsive"."""
+
+STOP_TIMEOUT = 5.0
+"""Seconds a terminated server has to shut down before it is killed."""
+
+READY_POLL_INTERVAL = 0.01
+
+
+def port_available(port: int) -> bool:
+    """Whether `port` can be bound, i.e., no other process listens on it."""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            sock.bind(("0.0.0.0", port))
+            return True
+        except OSError:
+            return False
+
+
+def port_listening(port: int) -> bool:
+    """Whether a server accepts connections on `port` of this host."""
+    try:
+        with socket.create_connection(("127.0.0.1", port), timeout=0.1):
+            return True
+    except OSError:
+        return False
+
+
+def owner_id() -> str:
+    """Identify this backend worker process in `ServerLease.owner`."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def lease_expiry():
+    return now() + timedelta(seconds=FLOWER_LEASE_SECONDS)
+
+
+def live_leases():
+    return ServerLease.objects.filter(expires__gt=now())
+
+
+def lease_status(lease: ServerLease, start_fresh: bool) -> ServerData:
+    if start_fresh and not lease.start_fresh:
+        return ServerData("started_non_fresh", lease.session_id, None)  # type: ignore
+    return ServerData("started", lease.session_id, lease.port, lease.params_version)  # type: ignore
+
+
+def running(model_id: int, start_fresh: bool) -> ServerData | None:
+    """Status of the server running for model `model_id` in any worker,
+    with one query by the unique `tflite_model` index."""
+    lease = live_leases().filter(tflite_model_id=model_id).first()
+    if lease is not None:
+        return lease_status(lease, start_fresh)
+
+
+def save_params(model: TFLiteModel, session_id: int, buffer) -> ModelParams:
+    """Save flat params `buffer` for `model` in training session `session_id`.
+    Raise `ValueError` if `buffer` does not fit the model's layout."""
+    params = store_model_params(buffer, model)
+    params.save()
+    TrainingSession.objects.filter(id=session_id).update(end_time=now())
+    return params
+
+
+def end_session(session_id: int, reason: str):
+    """Record why training session `session_id` ended and drop its checkpoint."""
+    TrainingSession.objects.filter(id=session_id).update(
+        end_time=now(), end_reason=reason
+    )
+    SessionCheckpoint.objects.filter(session_id=session_id).delete()
+    sessions_ended.inc(reason=reason)
+
+
+class WarmProcess:
+    """A Flower server process started ahead of its session, with flwr
+    imported, waiting in `train.run.warm_server` to be `hand`ed its job."""
+
+    def __init__(self) -> None:
+        self.params_queue = context.Queue()
+        self.jobs, jobs = context.Pipe()
+        self.process = context.Process(
+            target=warm_server, args=(jobs, self.params_queue)
+        )
+        self.process.start()
+        jobs.close()
+
+    def hand(self, *job):
+        """Run `flwr_server` with arguments `job`, but `params_queue`."""
+        self.jobs.send(job)
+        self.jobs.close()
+
+    def stop(self):
+        try:
+            self.jobs.send(None)
+        except OSError:
+            pass
+        self.jobs.close()
+
+
+class WarmPool:
+    """Keep `size` idle `WarmProcess`es, refilled in the background."""
+
+    def __init__(self, size: int) -> None:
+        self.size = size
+        self.idle: list[WarmProcess] = []
+        self.lock = Lock()
+        self.refiller: Thread | None = None
+        # Unlike `atexit`, also at exit of multiprocessing children such as
+        # uvicorn workers, before they wait for their own children.
+        Finalize(self, self.stop, exitpriority=0)
+
+    def take(self) -> WarmProcess:
+        """An idle process, or a new one if none is left."""
+        with self.lock:
+            idle = [warm for warm in self.idle if warm.process.is_alive()]
+            warm = idle.pop(0) if idle else None
+            self.idle = idle
+        self.refill()
+        return warm or WarmProcess()
+
+    def refill(self):
+        with self.lock:
+            if self.size == 0 or (self.refiller and self.refiller.is_alive()):
+                return
+            self.refiller = Thread(target=self.fill, daemon=True)
+            self.refiller.start()
+
+    def fill(self):
+        while True:
+            with self.lock:
+                if len(self.idle) >= self.size:
+                    return
+            warm = WarmProcess()
+            with self.lock:
+                self.idle.append(warm)
+
+    def stop(self):
+        self.size = 0
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for warm in idle:
+            warm.stop()
 
 
 class Server:
-    """Spawn a new background Flower server process and monitor it."""
+    """Run a Flower server process and supervise it,
+    renewing its `ServerLease` while it runs and stopping it once it is
+    idle or stuck, see `end_reason`."""
 
-    def __init__(self, model: TFLiteModel, start_fresh: bool) -> None:
+    def __init__(
+        self,
+        model: TFLiteModel,
+        start_fresh: bool,
+        port: int,
+        config: TrainingConfig,
+        checkpoint: SessionCheckpoint | None = None,
+    ) -> None:
+        """Save the training session, or continue that of `checkpoint`;
+        `start` the server once leased."""
         self.model = model
         self.start_fresh = start_fresh
-        params = None if start_fresh else model_params(model)
-        self.session = TrainingSession(tflite_model=model)
-        self.process = Process(target=flwr_server, args=(params,))
-        self.process.start()
-        self.timeout = Thread(target=Process.join, args=(self.process, TWELVE_HOURS))
-        self.timeout.start()
-        self.update_session_end_time()
-        logger.warning(f"Started flower server for model {model}")
+        self.port = port
+        self.config = config
+        if checkpoint is None:
+            self.session = TrainingSession(tflite_model=model, config=asdict(config))
+            self.session.save()
+            checkpoint = SessionCheckpoint(
+                session=self.session,
+                tflite_model=model,
+                params=None if start_fresh else model.params.last(),  # type: ignore
+                start_fresh=start_fresh,
+            )
+        else:
+            self.session = checkpoint.session
+        self.checkpoint = checkpoint
+        """Saved with the lease, see `ServerPool.start`."""
+        elapsed = (now() - self.session.start_time).total_seconds()
+        self.expires_at = monotonic() + FLOWER_MAX_SESSION_SECONDS - elapsed
+        """When the session expires, counted from its start in the first
+        server, whatever servers resumed it since."""
+        params = checkpoint.params
+        if params is None and checkpoint.server_round:
+            # Deleted since; the model's latest params are the closest.
+            params = model.params.last()  # type: ignore
+        self.params = params_tensors(params)
+        self.params_version = (
+            None if self.params is None else params_version(self.params.tensors)
+        )
+        self.suspending = Event()
+        self.save_latencies: dict[int, float] = {}
+        """Seconds from aggregation to saved params for each round."""
+        self.round_timings: dict[int, dict[str, float]] = {}
+        """Time aggregation finished, as "aggregated_at", and seconds of each
+        phase of `FedAvgAndroidSave.aggregate_fit` and of "save", by round."""
+
+    def start(self, warm: WarmProcess):
+        """Run the server in `warm`."""
+        self.process = warm.process
+        self.params_queue = warm.params_queue
+        warm.hand(
+            self.params,
+            self.port,
+            self.session.id,
+            self.config,
+            self.checkpoint.server_round,
+        )
+        ServerLease.objects.filter(session_id=self.session.id).update(
+            pid=self.process.pid
+        )
+        self.heartbeat_at = self.progress_at = self.clients_at = monotonic()
+        self.supervisor = Thread(target=self.supervise, daemon=True)
+        self.supervisor.start()
+        logger.warning(
+            f"Started flower server on port {self.port} for model {self.model}"
+        )
 
-    def update_session_end_time(self):
-        self.session.save()
+    def wait_ready(self, timeout: float) -> bool:
+        """Wait until the server accepts connections, for up to `timeout`
+        seconds. Return whether it does."""
+        deadline = monotonic() + timeout
+        while not port_listening(self.port):
+            if not self.process.is_alive() or monotonic() > deadline:
+                return False
+            sleep(READY_POLL_INTERVAL)
+        return True
+
+    def save_params(
+        self,
+        buffer,
+        server_round: int | None = None,
+        sent_at: float | None = None,
+        timings: dict[str, float] | None = None,
+        counts: dict[str, int] | None = None,
+    ):
+        params = save_params(self.model, self.session.id, buffer)
+        if server_round is not None:
+            SessionCheckpoint.objects.filter(session_id=self.session.id).update(
+                server_round=server_round, params=params, updated=now()
+            )
+        if server_round is not None and sent_at is not None:
+            latency = time() - sent_at
+            self.save_latencies[server_round] = latency
+            timings = {**(timings or {}), "save": latency}
+            self.round_timings[server_round] = {"aggregated_at": sent_at, **timings}
+            record_round(self.session.id, server_round, timings, counts or {})
+            logger.info(f"Saved params of round {server_round} in {latency:.3f}s.")
+
+    def renew_lease(self):
+        renewed = ServerLease.objects.filter(session_id=self.session.id).update(
+            expires=lease_expiry()
+        )
+        if not renewed:
+            logger.error(f"Lease of server on port {self.port} is gone.")
+
+    def handle(self, message):
+        """Save params or note a `Heartbeat` from `params_queue`."""
+        if isinstance(message, Heartbeat):
+            self.heartbeat_at = monotonic()
+            if message.clients:
+                self.clients_at = self.heartbeat_at
+            return
+        try:
+            self.save_params(*message)
+        except ValueError as err:
+            logger.error(err)
+        self.progress_at = monotonic()
 
+    def end_reason(self) -> str | None:
+        """Why the server should stop, or `None` while it runs and progresses:
+        "finished" or "failed" once it exited,
+        "expired" `FLOWER_MAX_SESSION_SECONDS` after the session started,
+        "unresponsive" after `MISSED_HEARTBEATS`,
+        "idle" with no client for `FLOWER_IDLE_TIMEOUT`,
+        or "stuck" with no round for `FLOWER_ROUND_TIMEOUT`."""
+        if not self.process.is_alive():
+            return "finished" if self.process.exitcode == 0 else "failed"
+        at = monotonic()
+        if at > self.expires_at:
+            return "expired"
+        if at - self.heartbeat_at > FLOWER_HEARTBEAT_INTERVAL * MISSED_HEARTBEATS:
+            return "unresponsive"
+        if at - self.clients_at > FLOWER_IDLE_TIMEOUT:
+            return "idle"
+        if at - self.progress_at > FLOWER_ROUND_TIMEOUT:
+            return "stuck"
 
-task: Server | None = None
+    def supervise(self):
+        """Save params from `params_queue` and renew the lease until the
+        Flower server exits, has an `end_reason` or is suspended, then `stop` it."""
+        renewed = monotonic()
+        reason = None
+        while reason is None and not self.suspending.is_set():
+            if monotonic() - renewed > FLOWER_LEASE_SECONDS / 3:
+                self.renew_lease()
+                renewed = monotonic()
+            try:
+                message = self.params_queue.get(timeout=QUEUE_POLL_INTERVAL)
+            except Empty:
+                reason = self.end_reason()
+                continue
+            if message is None:
+                self.process.join(STOP_TIMEOUT)
+                reason = "finished"
+            else:
+                self.handle(message)
+                reason = self.end_reason()
+        self.stop(reason)
 
+    def save_queued_params(self):
+        """Save the params already queued, without waiting for more."""
+        while True:
+            try:
+                message = self.params_queue.get_nowait()
+            except Empty:
+                return
+            if message is not None:
+                self.handle(message)
 
-def cleanup_task():
-    global task
-    if task is not None and not task.process.is_alive():
-        task = None
+    def stop(self, reason: str | None):
+        """Save the latest params, terminate the server if still
+        running, end the session for `reason` unless `None` to resume it
+        later, and release the lease."""
+        self.save_queued_params()
+        if self.process.is_alive():
+            logger.warning(
+                f"Stopping {reason or 'suspended'} server on port {self.port}."
+            )
+            self.process.terminate()
+            self.process.join(STOP_TIMEOUT)
+            if self.process.is_alive():
+                self.process.kill()
+                self.process.join()
+            self.save_queued_params()
+        if reason is not None:
+            end_session(self.session.id, reason)
+        ServerLease.objects.filter(session_id=self.session.id).delete()
+        connection.close()
 
+    def suspend(self):
+        """Stop the server without ending its session, for another worker to
+        resume it from its checkpoint."""
+        self.suspending.set()
+        self.supervisor.join(QUEUE_POLL_INTERVAL + 2 * STOP_TIMEOUT)
 
-def server(model: TFLiteModel, start_fresh: bool) -> ServerData:
-    """Request a Flower server. Return `(status, port)`.
+
+class ServerPool:
+    """Keep up to `capacity` concurrent Flower servers across all backend
+    workers, at most one per model, tracked as `ServerLease` rows.
+    Each server listens on its own port taken from `ports`."""
+
+    def __init__(self, capacity: int, ports: range) -> None:
+        self.capacity = capacity
+        self.ports = ports
+        self.servers: dict[int, Server] = {}
+        """Servers run by this worker keyed by `TrainingSession.id`."""
+        self.lock = Lock()
+        self.warm = WarmPool(FLOWER_WARM_SERVERS)
+        self.exiting = Event()
+        Finalize(self, self.suspend, exitpriority=1)
+
+    def reap(self):
+        """Forget exited servers of this worker and drop expired leases of
+        any worker, freeing their models and ports."""
+        for session_id, task in list(self.servers.items()):
+            if not task.process.is_alive():
+                del self.servers[session_id]
+        expired = ServerLease.objects.filter(expires__lte=now())
+        for lease in expired:
+            logger.warning(f"Reaped expired lease: {lease}.")
+        expired.delete()
+
+    def free_port(self, used: set[int]) -> int | None:
+        for port in self.ports:
+            if port not in used and port_available(port):
+                return port
+
+    def request(
+        self, model: TFLiteModel, start_fresh: bool, config: TrainingConfig
+    ) -> ServerData:
+        """`config` only applies if a new server is started.
+        Answer for a new server once it accepts connections."""
+        status = running(model.id, start_fresh)  # type: ignore
+        if status is not None:
+            return status
+        task = self.start(model, start_fresh, config)
+        if not isinstance(task, Server):
+            return task
+        if not task.wait_ready(FLOWER_READY_TIMEOUT):
+            logger.error(f"Server on port {task.port} is not accepting connections.")
+        return ServerData("new", task.session.id, task.port, task.params_version)
+
+    def start(
+        self,
+        model: TFLiteModel,
+        start_fresh: bool,
+        config: TrainingConfig,
+        checkpoint: SessionCheckpoint | None = None,
+    ) -> "Server | ServerData":
+        """Lease and start a new server, for a new session or to resume that
+        of `checkpoint`, or say why not."""
+        with self.lock:
+            self.reap()
+            leases = list(ServerLease.objects.values_list("slot", "port"))
+            used_slots = {slot for slot, _ in leases}
+            slot = next(
+                (slot for slot in range(self.capacity) if slot not in used_slots),
+                None,
+            )
+            if slot is None or len(leases) >= self.capacity:
+                return ServerData("occupied", None, None)
+            port = self.free_port({port for _, port in leases})
+            if port is None:
+                logger.error(f"No free port in {self.ports} for a new server.")
+                return ServerData("occupied", None, None)
+            task = Server(model, start_fresh, port, config, checkpoint)
+            try:
+                with transaction.atomic():
+                    task.checkpoint.save()
+                    ServerLease.objects.create(
+                        tflite_model=model,
+                        session=task.session,
+                        port=port,
+                        slot=slot,
+                        start_fresh=start_fresh,
+                        params_version=task.params_version,
+                        owner=owner_id(),
+                        expires=lease_expiry(),
+                    )
+            except IntegrityError as err:
+                # Another worker took the model, the port or the slot.
+                logger.warning(f"Lost the race to start a server: {err}")
+                if checkpoint is None:
+                    task.session.delete()
+                status = running(model.id, start_fresh)  # type: ignore
+                return status or ServerData("occupied", None, None)
+            task.start(self.warm.take())
+            self.servers[task.session.id] = task
+            return task
+
+    def resume(self) -> list[int]:
+        """Start servers again for the sessions left by workers that exited
+        or died before they ended, from their `SessionCheckpoint`s,
+        at the round after the last saved. Return their session ids."""
+        with self.lock:
+            self.reap()
+        checkpoints = SessionCheckpoint.objects.filter(
+            session__server_lease=None, session__end_reason=None
+        ).select_related("session", "tflite_model", "params")
+        resumed = []
+        for checkpoint in checkpoints:
+            session_id = checkpoint.session.id
+            config = TrainingConfig(**checkpoint.session.config)
+            if checkpoint.server_round >= config.num_rounds:
+                end_session(session_id, "finished")
+                continue
+            model = checkpoint.tflite_model
+            if running(model.id, start_fresh=False) is not None:  # type: ignore
+                # A new session of the model started meanwhile.
+                end_session(session_id, "superseded")
+                continue
+            task = self.start(model, checkpoint.start_fresh, config, checkpoint)
+            if isinstance(task, Server):
+                logger.warning(
+                    f"Resumed session {session_id} after round "
+                    f"{checkpoint.server_round} on port {task.port}."
+                )
+                resumed.append(session_id)
+        return resumed
+
+    def watch(self):
+        """`resume` every `FLOWER_LEASE_SECONDS` until the worker exits,
+        taking sessions over from dead workers once their leases expire."""
+        while not self.exiting.is_set():
+            try:
+                self.resume()
+            except DatabaseError as err:
+                logger.error(f"Cannot resume sessions: {err}")
+            connection.close()
+            self.exiting.wait(FLOWER_LEASE_SECONDS)
+
+    def suspend(self):
+        """Stop this worker's servers without ending their sessions, so that
+        the next worker resumes them."""
+        self.exiting.set()
+        for task in list(self.servers.values()):
+            task.suspend()
+
+    def find(self, session_id: int) -> ServerLease | None:
+        """Look up the lease of the server running training session
+        `session_id` in any worker."""
+        return (
+            live_leases()
+            .filter(session_id=session_id)
+            .select_related("tflite_model")
+            .first()
+        )
+
+    def utilisation(self) -> dict:
+        leases = live_leases().select_related("tflite_model").order_by("port")
+        return {
+            "capacity": self.capacity,
+            "running": len(leases),
+            "servers": [
+                {
+                    "model": lease.tflite_model.name,
+                    "session_id": lease.session_id,  # type: ignore
+                    "port": lease.port,
+                    "owner": lease.owner,
+                }
+                for lease in leases
+            ],
+        }
+
+
+pool = ServerPool(FLOWER_SERVER_CAPACITY, FLOWER_PORTS)
+
+
+def server(
+    model: TFLiteModel, start_fresh: bool, config: TrainingConfig | None = None
+) -> ServerData:
+    """Request a Flower server, configured by `config` if newly started.
+    Return `(status, port)`.
     `status` is "started" if the server is already running,
     "new" if newly started,
-    or "occupied" if the background process is unavailable."""
-    global task
-    cleanup_task()
-    if task:
-        if task.model == model:
-            if start_fresh and not task.start_fresh:
-                return ServerData("started_non_fresh", task.session.id, None)
-            return ServerData("started", task.session.id, PORT)
-        else:
-            return ServerData("occupied", None, None)
-    else:
-        # Start new server.
-        task = Server(model, start_fresh)
-        return ServerData("new", task.session.id, PORT)
+    or "occupied" if the pool is at capacity or out of ports."""
+    return pool.request(model, start_fresh, config or TrainingConfig())
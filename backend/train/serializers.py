@@ -1,6 +1,11 @@
 from rest_framework import serializers
+from train.aggregate import AGGREGATORS
+from train.compression import COMPRESSIONS
+from train.data import TrainingConfig
 from train.models import TFLiteModel
 
+SCHEDULABLE = ("batch_size", "local_epochs")
+
 
 class TFLiteModelSerializer(serializers.Serializer):
     id = serializers.IntegerField()
@@ -13,10 +18,144 @@ class TFLiteModelSerializer(serializers.Serializer):
         fields = ["id", "name", "file_path", "layers_sizes"]
 
 
+# Always change together with `train.aggregate.trimmed_mean`.
+class TrimmedMeanOptionsSerializer(serializers.Serializer):
+    trim = serializers.FloatField(min_value=0.0, required=False)
+
+    def validate_trim(self, trim: float):
+        if trim >= 0.5:
+            raise serializers.ValidationError("Ensure this value is less than 0.5.")
+        return trim
+
+
+# Always change together with `train.aggregate.clipped_average`.
+class ClippedAverageOptionsSerializer(serializers.Serializer):
+    max_norm = serializers.FloatField(required=False)
+
+    def validate_max_norm(self, max_norm: float):
+        if max_norm <= 0:
+            raise serializers.ValidationError("Ensure this value is greater than 0.")
+        return max_norm
+
+
+# Always change together with `train.aggregate.AGGREGATORS`.
+AGGREGATOR_OPTIONS: dict[str, type[serializers.Serializer]] = {
+    "fedavg": serializers.Serializer,
+    "median": serializers.Serializer,
+    "trimmed_mean": TrimmedMeanOptionsSerializer,
+    "clip": ClippedAverageOptionsSerializer,
+}
+"""Serializer of the `aggregator_options` each aggregator accepts, by name."""
+
+
+# Always change together with `train.data.TrainingConfig`.
+class TrainingConfigSerializer(serializers.Serializer):
+    num_rounds = serializers.IntegerField(
+        min_value=1, default=TrainingConfig.num_rounds
+    )
+    fraction_fit = serializers.FloatField(
+        min_value=0.0, max_value=1.0, default=TrainingConfig.fraction_fit
+    )
+    fraction_evaluate = serializers.FloatField(
+        min_value=0.0, max_value=1.0, default=TrainingConfig.fraction_evaluate
+    )
+    min_fit_clients = serializers.IntegerField(
+        min_value=1, default=TrainingConfig.min_fit_clients
+    )
+    min_evaluate_clients = serializers.IntegerField(
+        min_value=0, default=TrainingConfig.min_evaluate_clients
+    )
+    min_available_clients = serializers.IntegerField(
+        min_value=1, default=TrainingConfig.min_available_clients
+    )
+    batch_size = serializers.IntegerField(
+        min_value=1, default=TrainingConfig.batch_size
+    )
+    local_epochs = serializers.IntegerField(
+        min_value=1, default=TrainingConfig.local_epochs
+    )
+    schedule = serializers.DictField(
+        child=serializers.ListField(
+            child=serializers.ListField(
+                child=serializers.IntegerField(min_value=1), min_length=2, max_length=2
+            )
+        ),
+        default=dict,
+    )
+    aggregator = serializers.ChoiceField(
+        choices=["fedavg", *AGGREGATORS], default=TrainingConfig.aggregator
+    )
+    aggregator_options = serializers.DictField(default=dict)
+    max_norm_ratio = serializers.FloatField(
+        min_value=1.0, allow_null=True, default=TrainingConfig.max_norm_ratio
+    )
+    buffer_size = serializers.IntegerField(
+        min_value=1, allow_null=True, default=TrainingConfig.buffer_size
+    )
+    compression = serializers.ChoiceField(
+        choices=COMPRESSIONS, allow_null=True, default=TrainingConfig.compression
+    )
+    topk_ratio = serializers.FloatField(
+        min_value=0.0, max_value=1.0, default=TrainingConfig.topk_ratio
+    )
+    error_feedback = serializers.BooleanField(default=TrainingConfig.error_feedback)
+
+    def validate_schedule(self, schedule: dict):
+        for key in schedule:
+            if key not in SCHEDULABLE:
+                raise serializers.ValidationError(
+                    f"Cannot schedule `{key}`, only {SCHEDULABLE}."
+                )
+        return schedule
+
+    def validate(self, attrs):
+        if attrs["min_fit_clients"] > attrs["min_available_clients"]:
+            raise serializers.ValidationError(
+                "min_fit_clients exceeds min_available_clients."
+            )
+        if attrs["min_evaluate_clients"] > attrs["min_available_clients"]:
+            raise serializers.ValidationError(
+                "min_evaluate_clients exceeds min_available_clients."
+            )
+        if attrs["buffer_size"] is not None and attrs["aggregator"] != "fedavg":
+            raise serializers.ValidationError(
+                {"aggregator": "Buffered aggregation only averages, use `fedavg`."}
+            )
+        attrs["aggregator_options"] = self.validated_aggregator_options(
+            attrs["aggregator"], attrs["aggregator_options"]
+        )
+        return attrs
+
+    def validated_aggregator_options(self, aggregator: str, options: dict) -> dict:
+        """Options checked against what `aggregator` accepts, since they are
+        passed to it as keyword arguments only once the server runs."""
+        options_serializer = AGGREGATOR_OPTIONS[aggregator](data=options)
+        unknown = set(options) - set(options_serializer.fields)
+        if unknown:
+            raise serializers.ValidationError(
+                {
+                    "aggregator_options": f"Unknown options {sorted(unknown)} "
+                    f"for aggregator `{aggregator}`."
+                }
+            )
+        if not options_serializer.is_valid():
+            raise serializers.ValidationError(
+                {"aggregator_options": options_serializer.errors}
+            )
+        return dict(options_serializer.validated_data)
+
+
 # Always change together with Android `HttpClient.PostServerData`.
 class PostServerDataSerializer(serializers.Serializer):
     id = serializers.IntegerField()
     start_fresh = serializers.BooleanField(required=False, default=False)  # type: ignore
+    config = TrainingConfigSerializer(required=False)
+    """Training configuration for a newly started server, defaults if omitted."""
+
+
+# Always change together with `FedAvgAndroidSave.signal_save_params` in `train.run`.
+class PostParamsDataSerializer(serializers.Serializer):
+    session_id = serializers.IntegerField()
 
 
 # Always change together with `upload` in `fed_kit.py`.
@@ -24,3 +163,11 @@ class UploadDataSerializer(serializers.Serializer):
     name = serializers.CharField(max_length=256)
     layers_sizes = serializers.ListField(child=serializers.IntegerField(min_value=0))
     data_type = serializers.CharField(max_length=256)
+
+
+# Always change together with `upload` in `fed_kit.py` and `train.models.ModelUpload`.
+class StartUploadDataSerializer(UploadDataSerializer):
+    name = serializers.CharField(max_length=64)
+    file_name = serializers.RegexField(r"^[\w.-]+$", max_length=64)
+    size = serializers.IntegerField(min_value=0)
+    sha256 = serializers.RegexField(r"^[0-9a-f]{64}$")
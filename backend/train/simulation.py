@@ -0,0 +1,255 @@
+"""In-process simulated Flower clients to exercise servers without devices.
+
+A `SimulatedClientProxy` stands in for a phone connected over gRPC:
+`fit` sleeps for its latency and then moves the given weights towards its own
+`target`, as if training on local data whose optimum is `target`,
+and compresses the result if the fit config asks to. Like the Android client,
+it confirms the version of the parameters it evaluated, reports it when asked
+for its properties, and reuses them when the server sends
+`train.run.UNCHANGED_PARAMETERS`.
+
+`run_client` connects the same behavior to a real Flower server over gRPC as
+a `SimulatedClient`, recording what each instruction cost it, see
+`benchmarks.simulation`."""
+from dataclasses import dataclass
+from multiprocessing.queues import Queue
+from time import perf_counter, sleep, time
+
+import numpy as np
+from flwr.client import Client, start_client
+from flwr.common import (
+    Code,
+    DisconnectRes,
+    EvaluateIns,
+    EvaluateRes,
+    FitIns,
+    FitRes,
+    GetParametersIns,
+    GetParametersRes,
+    GetPropertiesIns,
+    GetPropertiesRes,
+    NDArrays,
+    Parameters,
+    ReconnectIns,
+    Status,
+)
+from flwr.server.client_manager import SimpleClientManager
+from flwr.server.client_proxy import ClientProxy
+from train.compression import TOPK_RATIO, decode, encode
+from train.params import TENSOR_TYPE
+from train.run import UNCHANGED_PARAMETERS
+
+OK = Status(Code.OK, "")
+
+
+def to_parameters(weights: NDArrays) -> Parameters:
+    """Encode like the Android client, raw `float32` bytes per layer."""
+    return Parameters(
+        [layer.astype(np.float32).tobytes() for layer in weights], TENSOR_TYPE
+    )
+
+
+def from_parameters(parameters: Parameters) -> NDArrays:
+    return [np.frombuffer(tensor, np.float32) for tensor in parameters.tensors]
+
+
+def synthetic_weights(layers_sizes: list[int], seed: int = 0) -> NDArrays:
+    """Random `float32` weights laid out as `TFLiteModel.layers_sizes`."""
+    rng = np.random.default_rng(seed)
+    return [
+        rng.standard_normal(size // 4, dtype=np.float32) * 0.1 for size in layers_sizes
+    ]
+
+
+class SimulatedClientProxy(ClientProxy):
+    def __init__(
+        self,
+        cid: str,
+        target: NDArrays,
+        latency: float = 0.0,
+        num_examples: int = 100,
+        learning_rate: float = 0.5,
+    ):
+        super().__init__(cid)
+        self.target = target
+        self.latency = latency
+        """Seconds each `fit` or `evaluate` takes."""
+        self.num_examples = num_examples
+        self.learning_rate = learning_rate
+        self.fit_count = 0
+        self.residual: NDArrays | None = None
+        """What compression lost, for error feedback."""
+        self.held: tuple[str, NDArrays] | None = None
+        """Version and weights confirmed after the last evaluation."""
+        self.bytes_received = 0
+
+    def get_properties(
+        self, ins: GetPropertiesIns, timeout: float | None, group_id: int | None
+    ) -> GetPropertiesRes:
+        if self.held is None:
+            return GetPropertiesRes(OK, {})
+        return GetPropertiesRes(OK, {"params_version": self.held[0]})
+
+    def get_parameters(
+        self, ins: GetParametersIns, timeout: float | None, group_id: int | None
+    ) -> GetParametersRes:
+        return GetParametersRes(OK, to_parameters(self.target))
+
+    def fit(self, ins: FitIns, timeout: float | None, group_id: int | None) -> FitRes:
+        sleep(self.latency)
+        weights = self.received(ins.parameters)
+        # Training changes the weights held.
+        self.held = None
+        trained = [
+            layer + self.learning_rate * (target - layer)
+            for layer, target in zip(weights, self.target, strict=True)
+        ]
+        self.fit_count += 1
+        return FitRes(OK, self.compress(trained, weights, ins), self.num_examples, {})
+
+    def compress(self, trained: NDArrays, weights: NDArrays, ins: FitIns):
+        """Encode `trained` with the compression offered in `ins.config`,
+        as the Android client does."""
+        compression = ins.config.get("compression")
+        if compression is None:
+            return to_parameters(trained)
+        ratio = float(ins.config.get("topk_ratio", TOPK_RATIO))
+        if not ins.config.get("error_feedback"):
+            return encode(trained, str(compression), weights, ratio)
+        if self.residual is not None:
+            trained = [layer + error for layer, error in zip(trained, self.residual)]
+        parameters = encode(trained, str(compression), weights, ratio)
+        decoded = decode(parameters, weights)
+        self.residual = [layer - sent for layer, sent in zip(trained, decoded)]
+        return parameters
+
+    def evaluate(
+        self, ins: EvaluateIns, timeout: float | None, group_id: int | None
+    ) -> EvaluateRes:
+        sleep(self.latency)
+        weights = self.received(ins.parameters)
+        loss = sum(
+            float(np.square(layer - target).sum())
+            for layer, target in zip(weights, self.target, strict=True)
+        )
+        version = ins.config.get("params_version")
+        if version is None:
+            return EvaluateRes(OK, loss, self.num_examples, {})
+        self.held = (str(version), weights)
+        return EvaluateRes(OK, loss, self.num_examples, {"params_version": version})
+
+    def received(self, parameters: Parameters) -> NDArrays:
+        """Weights in `parameters`, or those held if unchanged."""
+        self.bytes_received += sum(len(tensor) for tensor in parameters.tensors)
+        if parameters.tensor_type == UNCHANGED_PARAMETERS.tensor_type:
+            if self.held is None:
+                raise ValueError("Unchanged parameters but none held.")
+            return self.held[1]
+        return from_parameters(parameters)
+
+    def reconnect(
+        self, ins: ReconnectIns, timeout: float | None, group_id: int | None
+    ) -> DisconnectRes:
+        return DisconnectRes("")
+
+
+def simulated_proxies(
+    layers_sizes: list[int], latencies: list[float], spread: float = 0.01
+) -> list[SimulatedClientProxy]:
+    """One `SimulatedClientProxy` per latency.
+    Targets scatter by `spread` around common weights."""
+    center = synthetic_weights(layers_sizes)
+    proxies = []
+    for index, latency in enumerate(latencies):
+        rng = np.random.default_rng(index + 1)
+        target = [
+            layer + rng.standard_normal(layer.size, dtype=np.float32) * spread
+            for layer in center
+        ]
+        proxies.append(SimulatedClientProxy(str(index), target, latency))
+    return proxies
+
+
+def simulated_clients(
+    layers_sizes: list[int], latencies: list[float], spread: float = 0.01
+) -> SimpleClientManager:
+    """Client manager with the `simulated_proxies` registered."""
+    client_manager = SimpleClientManager()
+    for proxy in simulated_proxies(layers_sizes, latencies, spread):
+        client_manager.register(proxy)
+    return client_manager
+
+
+@dataclass
+class Phase:
+    """One instruction a `SimulatedClient` handled."""
+
+    kind: str
+    """"fit", "evaluate" or "get_parameters"."""
+    received_at: float
+    """Wall clock time the instruction arrived."""
+    seconds: float
+    """Time the client spent on it."""
+    bytes_received: int
+    bytes_sent: int
+
+
+def parameters_size(parameters: Parameters) -> int:
+    return sum(len(tensor) for tensor in parameters.tensors)
+
+
+class SimulatedClient(Client):
+    """A `SimulatedClientProxy` served to a Flower server over gRPC."""
+
+    def __init__(self, proxy: SimulatedClientProxy) -> None:
+        self.proxy = proxy
+        self.phases: list[Phase] = []
+
+    def record(self, kind: str, call, ins, received: Parameters | None):
+        received_at, start = time(), perf_counter()
+        res = call(ins, None, None)
+        self.phases.append(
+            Phase(
+                kind,
+                received_at,
+                perf_counter() - start,
+                0 if received is None else parameters_size(received),
+                parameters_size(res.parameters) if hasattr(res, "parameters") else 0,
+            )
+        )
+        return res
+
+    def get_properties(self, ins: GetPropertiesIns) -> GetPropertiesRes:
+        return self.proxy.get_properties(ins, None, None)
+
+    def get_parameters(self, ins: GetParametersIns) -> GetParametersRes:
+        return self.record("get_parameters", self.proxy.get_parameters, ins, None)
+
+    def fit(self, ins: FitIns) -> FitRes:
+        return self.record("fit", self.proxy.fit, ins, ins.parameters)
+
+    def evaluate(self, ins: EvaluateIns) -> EvaluateRes:
+        return self.record("evaluate", self.proxy.evaluate, ins, ins.parameters)
+
+
+def run_client(
+    address: str,
+    proxy: SimulatedClientProxy,
+    phases_queue: Queue | None = None,
+):
+    """Serve `proxy` to the Flower server at `address` until it finishes
+    training, then put `(proxy.cid, phases)` into `phases_queue`.
+    Meant as the target of a client `multiprocessing.Process`."""
+    client = SimulatedClient(proxy)
+    try:
+        start_client(
+            server_address=address,
+            client=client,
+            insecure=True,
+            transport="grpc-bidi",
+            max_retries=50,
+            max_wait_time=30.0,
+        )
+    finally:
+        if phases_queue is not None:
+            phases_queue.put((proxy.cid, client.phases))
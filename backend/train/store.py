@@ -0,0 +1,44 @@
+"""Content-addressed on-disk store for flat model parameters.
+
+Each snapshot is written once to `PARAMS_STORE_DIR` under its SHA-256 hex
+digest, so identical snapshots share one file. Files no `ModelParams` row
+refers to are deleted by the `prune_params` management command.
+Snapshots are read back through read-only memory maps so that
+`train.params.decode_params` views the file directly without copying it into
+Python `bytes`."""
+import mmap
+import os
+from hashlib import sha256
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+
+from backend.settings import PARAMS_STORE_DIR
+
+
+def path_for(digest: str) -> Path:
+    return PARAMS_STORE_DIR / digest[:2] / digest
+
+
+def put(buffer) -> tuple[str, int]:
+    """Store `buffer` unless already stored. Return its `(digest, size)`."""
+    view = memoryview(buffer).cast("B")
+    digest = sha256(view).hexdigest()
+    path = path_for(digest)
+    try:
+        # Mark as recent for `prune_params`, which deletes old unreferenced files.
+        os.utime(path)
+    except FileNotFoundError:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Write to a temporary file and rename so readers never see partial files.
+        with NamedTemporaryFile(dir=path.parent, delete=False) as tmp:
+            tmp.write(view)
+        os.replace(tmp.name, path)
+    return digest, view.nbytes
+
+
+def get(digest: str):
+    """Read-only buffer of the snapshot with `digest`, memory-mapped."""
+    with open(path_for(digest), "rb") as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            return b""
+        return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
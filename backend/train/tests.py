@@ -1,3 +1,315 @@
-from django.test import TestCase
+import asyncio
+import json
+import tempfile
+from datetime import timedelta
+from hashlib import sha256
+from pathlib import Path
+from threading import Event
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from asgiref.sync import sync_to_async
+from django.test import RequestFactory, SimpleTestCase, TestCase
+from django.utils.timezone import now
+from flwr.server.strategy.aggregate import aggregate
+from telemetry.models import TrainingSession
+from train.aggregate import (
+    SHARD_SIZE,
+    LayerPool,
+    RunningWeightedAverage,
+    screen,
+    weighted_average,
+)
+from train.async_views import request_server
+from train.checkpoint import ENCODINGS, LOSSLESS, decode_delta, encode_delta, max_error
+from train.data import TrainingConfig
+from train.fedbuff import AsyncServer
+from train.models import (
+    ModelUpload,
+    ServerLease,
+    SessionCheckpoint,
+    TFLiteModel,
+    TrainingDataType,
+)
+from train.run import FedAvgAndroidSave
+from train.scheduler import Server, ServerData, ServerPool, WarmPool
+from train.serializers import TrainingConfigSerializer
+from train.simulation import simulated_clients, simulated_proxies, to_parameters
+
+from backend.settings import FLOWER_MAX_SESSION_SECONDS, PARAMS_DELTA_TOLERANCE
+
+
+def random_results(shapes: list[tuple[int, ...]], n_clients: int):
+    rng = np.random.default_rng(0)
+    return [
+        (
+            [rng.standard_normal(shape, dtype=np.float32) for shape in shapes],
+            int(rng.integers(1, 100)),
+        )
+        for _ in range(n_clients)
+    ]
+
+
+class ScreenTest(SimpleTestCase):
+    def test_multi_dimensional_layers(self):
+        weights = [np.ones((3, 4), np.float32), np.ones(5, np.float32)]
+        norms, reasons = screen([weights] * 3)
+        np.testing.assert_allclose(norms, np.sqrt(17.0))
+        self.assertEqual(reasons, [None, None, None])
+
+    def test_non_finite_and_outliers(self):
+        clients = [[np.full((2, 2), value, np.float32)] for value in (1, 1, 1, 100)]
+        clients.append([np.array([[np.nan, 0], [0, 0]], np.float32)])
+        _, reasons = screen(clients)
+        self.assertEqual(reasons[:3], [None, None, None])
+        self.assertIn("median", reasons[3])
+        self.assertEqual(reasons[4], "NaN or Inf in layers [0]")
+
+
+class RunningWeightedAverageTest(SimpleTestCase):
+    def average(self, results, pool: LayerPool = LayerPool()):
+        average = RunningWeightedAverage(pool)
+        for weights, num_examples in results:
+            average.add(weights, num_examples)
+        return average.result()
+
+    def test_equals_flwr_aggregate(self):
+        results = random_results([(3, 4), (5,)], 6)
+        for layer, expected in zip(
+            self.average(results), aggregate(results), strict=True
+        ):
+            self.assertEqual(layer.shape, expected.shape)
+            self.assertEqual(layer.dtype, np.float32)
+            np.testing.assert_allclose(layer, expected, rtol=1e-5, atol=1e-6)
+
+    def test_bit_for_bit_weighted_average_on_threads(self):
+        results = random_results([(SHARD_SIZE + 3,), (7,)], 5)
+        pool = LayerPool(2)
+        self.addCleanup(pool.shutdown)
+        for layer, expected in zip(
+            self.average(results, pool), weighted_average(results), strict=True
+        ):
+            self.assertEqual(layer.tobytes(), expected.tobytes())
+
+    def test_rejects_other_layout(self):
+        average = RunningWeightedAverage()
+        average.add([np.ones(3, np.float32)], 1)
+        with self.assertRaises(ValueError):
+            average.add([np.ones(4, np.float32)], 1)
+
+
+class DeltaEncodingTest(SimpleTestCase):
+    def test_round_trip(self):
+        rng = np.random.default_rng(0)
+        reference = [rng.standard_normal(size, dtype=np.float32) for size in (12, 5)]
+        params = [
+            layer + rng.standard_normal(layer.size, dtype=np.float32) * 1e-3
+            for layer in reference
+        ]
+        for encoding in ENCODINGS:
+            with self.subTest(encoding=encoding):
+                blob = encode_delta(params, reference, encoding)
+                decoded = decode_delta(blob, reference, encoding)
+                error = max_error(params, decoded)
+                if encoding in LOSSLESS:
+                    self.assertEqual(error, 0.0)
+                else:
+                    self.assertLessEqual(error, PARAMS_DELTA_TOLERANCE)
+
+
+class TrainingConfigSerializerTest(SimpleTestCase):
+    def errors(self, data: dict) -> dict:
+        serializer = TrainingConfigSerializer(data=data)
+        serializer.is_valid()
+        return serializer.errors
+
+    def test_aggregator_options(self):
+        self.assertEqual(
+            self.errors(
+                {"aggregator": "trimmed_mean", "aggregator_options": {"trim": 0.2}}
+            ),
+            {},
+        )
+        self.assertIn(
+            "aggregator_options",
+            self.errors(
+                {"aggregator": "trimmed_mean", "aggregator_options": {"trim": 0.7}}
+            ),
+        )
+        self.assertIn(
+            "aggregator_options",
+            self.errors({"aggregator": "median", "aggregator_options": {"trim": 0.1}}),
+        )
+
+    def test_buffered_aggregation_only_averages(self):
+        self.assertEqual(self.errors({"buffer_size": 3}), {})
+        self.assertIn(
+            "aggregator", self.errors({"buffer_size": 3, "aggregator": "median"})
+        )
+
+
+class FedAvgNoSave(FedAvgAndroidSave):
+    def signal_save_params(self, params, server_round: int):
+        pass
+
+
+class AsyncServerTest(SimpleTestCase):
+    LAYERS_SIZES = [64, 32]
+    LATENCIES = [0.0, 0.01, 0.02, 0.05]
+
+    def test_fit_towards_client_targets(self):
+        targets = [
+            proxy.target
+            for proxy in simulated_proxies(self.LAYERS_SIZES, self.LATENCIES)
+        ]
+        center = [np.mean(layers, axis=0) for layers in zip(*targets)]
+        initial = [np.zeros_like(layer) for layer in center]
+        strategy = FedAvgNoSave(
+            fraction_evaluate=0.0,
+            min_available_clients=len(self.LATENCIES),
+            on_fit_config_fn=TrainingConfig().fit_config,
+            initial_parameters=to_parameters(initial),
+            session_id=0,
+            max_norm_ratio=None,
+        )
+        server = AsyncServer(
+            client_manager=simulated_clients(self.LAYERS_SIZES, self.LATENCIES),
+            strategy=strategy,
+            buffer_size=2,
+        )
+        history, _ = server.fit(4, timeout=None)
+        self.assertEqual(len(history.metrics_distributed_fit["staleness"]), 4)
+        weights = strategy.parameters_to_ndarrays(server.parameters)
+
+        def distance(layers):
+            return sum(
+                float(np.square(layer - target).sum())
+                for layer, target in zip(layers, center, strict=True)
+            )
+
+        self.assertLess(distance(weights), distance(initial) / 4)
+
+
+class IdleServer(Server):
+    """`Server` whose Flower process never starts."""
+
+    def start(self, warm):
+        self.process = mock.Mock(**{"is_alive.return_value": True})
+
+    def suspend(self):
+        pass
+
+
+@mock.patch("train.scheduler.Server", IdleServer)
+@mock.patch("train.scheduler.port_available", lambda port: True)
+@mock.patch.object(WarmPool, "take", lambda self: None)
+class ServerPoolTest(TestCase):
+    def setUp(self):
+        data_type = TrainingDataType.objects.create(name="test")
+        self.models = [
+            TFLiteModel.objects.create(
+                name=f"model{index}",
+                file_path=f"/model{index}.tflite",
+                layers_sizes=[4],
+                data_type=data_type,
+            )
+            for index in range(3)
+        ]
+        self.pool = ServerPool(2, range(8080, 8090))
+
+    def test_capacity(self):
+        for model in self.models[:2]:
+            self.assertIsInstance(
+                self.pool.start(model, False, TrainingConfig()), IdleServer
+            )
+        self.assertEqual(
+            self.pool.start(self.models[2], False, TrainingConfig()),
+            ServerData("occupied", None, None),
+        )
+        self.assertEqual(
+            sorted(ServerLease.objects.values_list("slot", flat=True)), [0, 1]
+        )
+
+    def test_resumed_session_expires_from_its_start(self):
+        session = TrainingSession.objects.create(tflite_model=self.models[0])
+        TrainingSession.objects.filter(id=session.id).update(
+            start_time=now() - timedelta(seconds=FLOWER_MAX_SESSION_SECONDS + 1)
+        )
+        checkpoint = SessionCheckpoint.objects.create(
+            session=TrainingSession.objects.get(id=session.id),
+            tflite_model=self.models[0],
+            server_round=3,
+            start_fresh=True,
+        )
+        task = self.pool.start(self.models[0], True, TrainingConfig(), checkpoint)
+        self.assertIsInstance(task, IdleServer)
+        self.assertEqual(task.end_reason(), "expired")
+
+    def test_slot_taken_concurrently(self):
+        self.pool.start(self.models[0], False, TrainingConfig())
+        sessions = TrainingSession.objects.count()
+        # Another worker read the leases before the first one was inserted.
+        with mock.patch.object(ServerLease.objects, "values_list", return_value=[]):
+            status = self.pool.start(self.models[1], False, TrainingConfig())
+        self.assertEqual(status, ServerData("occupied", None, None))
+        self.assertEqual(ServerLease.objects.count(), 1)
+        self.assertEqual(TrainingSession.objects.count(), sessions)
+
+
+class AsyncRequestServerTest(TestCase):
+    async def test_starting_server_leaves_sync_thread_free(self):
+        data_type = await TrainingDataType.objects.acreate(name="test")
+        model = await TFLiteModel.objects.acreate(
+            name="model",
+            file_path="/model.tflite",
+            layers_sizes=[4],
+            data_type=data_type,
+        )
+        started, ready = Event(), Event()
+
+        def server(*args):
+            started.set()
+            # Set below through the thread-sensitive sync thread, like the ORM.
+            return ServerData("new" if ready.wait(5) else "occupied", 1, 8080)
+
+        request = RequestFactory().post(
+            "/train/server", {"id": model.id}, content_type="application/json"
+        )
+        with mock.patch("train.async_views.server", server):
+            response = asyncio.ensure_future(request_server(request))
+            while not started.is_set():
+                await asyncio.sleep(0.01)
+            await sync_to_async(ready.set)()
+            self.assertEqual(json.loads((await response).content)["status"], "new")
+
+
+class CompleteUploadTest(TestCase):
+    def setUp(self):
+        self.dir = Path(self.enterContext(tempfile.TemporaryDirectory()))
+        self.enterContext(mock.patch("train.models.UPLOADS_DIR", self.dir))
+        self.enterContext(mock.patch("train.views.MODEL_FILES_DIR", self.dir))
+
+    def upload(self, content: bytes) -> ModelUpload:
+        upload = ModelUpload.objects.create(
+            name="model",
+            file_name="model.tflite",
+            layers_sizes=[4],
+            data_type="test",
+            size=len(content),
+            sha256=sha256(content).hexdigest(),
+        )
+        upload.part_path().write_bytes(content)
+        return upload
+
+    def complete(self, upload: ModelUpload):
+        return self.client.post(f"/train/upload/chunked/{upload.id}/complete")
+
+    def test_same_name_completed_concurrently(self):
+        first, second = self.upload(b"first"), self.upload(b"second")
+        self.assertEqual(self.complete(first).status_code, 200)
+        # The second completion checked the name before the first saved it.
+        unused = mock.Mock(**{"exists.return_value": False})
+        with mock.patch.object(TFLiteModel.objects, "filter", return_value=unused):
+            self.assertEqual(self.complete(second).status_code, 409)
+        self.assertEqual(TFLiteModel.objects.count(), 1)
+        self.assertEqual((self.dir / "model--model.tflite").read_bytes(), b"first")
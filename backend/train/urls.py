@@ -1,9 +1,19 @@
 from django.urls import path
 from train.views import *
 
+from backend.settings import ASYNC_VIEWS
+
+if ASYNC_VIEWS:
+    from train.async_views import advertise_model, request_server
+
 urlpatterns = [
     path("advertised", advertise_model),
     path("server", request_server),
+    path("servers", server_utilisation),
     path("upload", upload_file),
+    path("upload/chunked", start_upload),
+    path("upload/chunked/<uuid:upload_id>", upload_chunk),
+    path("upload/chunked/<uuid:upload_id>/complete", complete_upload),
     path("params", store_params),
+    path("params/<int:model_id>", latest_params),
 ]
@@ -1,22 +1,46 @@
 import logging
+import os
+from hashlib import file_digest
 from typing import OrderedDict
 
+from django.core.cache import cache
 from django.core.files.uploadedfile import UploadedFile
+from django.db import IntegrityError, transaction
+from django.http import Http404, HttpRequest, HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags
+from django.views.decorators.http import require_GET
 from rest_framework import permissions
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.request import MultiValueDict
 from rest_framework.response import Response
-from rest_framework.status import HTTP_400_BAD_REQUEST, HTTP_404_NOT_FOUND
+from rest_framework.status import (
+    HTTP_400_BAD_REQUEST,
+    HTTP_404_NOT_FOUND,
+    HTTP_409_CONFLICT,
+)
 from rest_framework.views import Request
 from train import scheduler
+from train.checkpoint import encode_delta
+from train.data import TrainingConfig
+from train.files import resolve, serve_file
 from train.models import *
+from train.params import encode_params
 from train.scheduler import server
 from train.serializers import *
 
-from backend.settings import BASE_DIR
+from backend.settings import ADVERTISED_CACHE_TIMEOUT, MODEL_FILES_DIR, UPLOADS_DIR
 
 logger = logging.getLogger(__name__)
 
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+PARAMS_DELTA_ENCODING = "xor"
+"""Lossless, so that clients end up with exactly the latest version."""
+
+
+def advertised_cache_key(data_type: str) -> str:
+    return f"advertised:{data_type}"
+
 
 def model_for_data_type(data_type):
     if not type(data_type) == str:
@@ -36,13 +60,27 @@ def model_for_data_type(data_type):
 @permission_classes((permissions.AllowAny,))
 def advertise_model(request):
     data_type = request.data.get("data_type")
+    if type(data_type) == str:
+        advertised = cache.get(advertised_cache_key(data_type))
+        if advertised is not None:
+            return Response(advertised)
     model = model_for_data_type(data_type)
     if model is None:
         return Response("No model corresponding to data_type", HTTP_404_NOT_FOUND)
     serializer = TFLiteModelSerializer(model)
+    cache.set(
+        advertised_cache_key(data_type), serializer.data, ADVERTISED_CACHE_TIMEOUT
+    )
     return Response(serializer.data)
 
 
+def model_file(request: HttpRequest, name: str):
+    path = resolve(MODEL_FILES_DIR, name)
+    if path is None:
+        raise Http404(f"No model file `{name}`.")
+    return serve_file(request, path)
+
+
 @api_view(["POST"])
 @permission_classes((permissions.AllowAny,))
 def request_server(request: Request):
@@ -51,12 +89,16 @@ def request_server(request: Request):
         logger.error(serializer.errors)
         return Response(serializer.errors, HTTP_400_BAD_REQUEST)
     data: OrderedDict = serializer.validated_data  # type: ignore
+    running = scheduler.running(data["id"], data["start_fresh"])
+    if running is not None:
+        return Response(running.__dict__)
     try:
         model = TFLiteModel.objects.get(pk=data["id"])
     except TFLiteModel.DoesNotExist:
         logger.error(f"Model with id {data['id']} not found.")
         return Response("Model not found", HTTP_404_NOT_FOUND)
-    response = server(model, data["start_fresh"])
+    config = TrainingConfig(**data.get("config", {}))
+    response = server(model, data["start_fresh"], config)
     return Response(response.__dict__)
 
 
@@ -89,6 +131,19 @@ def upload_file(request: Request):
     file = file_in_request(request)
     if file is None:
         return Response("No file in request.", HTTP_400_BAD_REQUEST)
+    # Save model file.
+    file_name = f"{name}--{file.name}"  # Guaranteed unique.
+    with open(MODEL_FILES_DIR / file_name, "wb") as fd:
+        for chunk in file.chunks():
+            fd.write(chunk)
+    register_model(name, file_name, data["layers_sizes"], data_type_name)
+    return Response("ok")
+
+
+def register_model(
+    name: str, file_name: str, layers_sizes: list[int], data_type_name: str
+) -> TFLiteModel:
+    """Save the model whose file `file_name` is in `MODEL_FILES_DIR`."""
     # Get `data_type`.
     try:
         data_type = TrainingDataType.objects.get(name=data_type_name)
@@ -96,34 +151,179 @@ def upload_file(request: Request):
         logger.warn(f"upload: Creating new data_type `{data_type_name}`.")
         data_type = TrainingDataType(name=data_type_name)
         data_type.save()
-    # Save model file.
-    path = f"static/{name}--{file.name}"  # Guaranteed unique.
-    with open(BASE_DIR / path, "wb") as fd:
-        fd.write(file.file.read())
     # Save model.
     model = TFLiteModel(
         name=name,
-        file_path=f"/{path}",
-        layers_sizes=data["layers_sizes"],
+        file_path=f"/static/{file_name}",
+        layers_sizes=layers_sizes,
         data_type=data_type,
     )
     model.save()
+    cache.delete(advertised_cache_key(data_type_name))
+    return model
+
+
+@api_view(["POST"])
+@permission_classes((permissions.AllowAny,))
+def start_upload(request: Request):
+    """Start a chunked upload, see `upload_chunk`. Respond with its `id`."""
+    serializer = StartUploadDataSerializer(data=request.data)  # type: ignore
+    if not serializer.is_valid():
+        logger.error(serializer.errors)
+        return Response(serializer.errors, HTTP_400_BAD_REQUEST)
+    data: OrderedDict = serializer.validated_data  # type: ignore
+    if TFLiteModel.objects.filter(name=data["name"]).exists():
+        return Response("Model name used", HTTP_400_BAD_REQUEST)
+    upload = ModelUpload(**data)
+    upload.save()
+    UPLOADS_DIR.mkdir(parents=True, exist_ok=True)
+    upload.part_path().touch()
+    return Response({"id": upload.id, "offset": 0})
+
+
+def lookup_upload(upload_id) -> ModelUpload | None:
+    try:
+        return ModelUpload.objects.get(pk=upload_id)
+    except ModelUpload.DoesNotExist:
+        logger.error(f"upload: No upload `{upload_id}`.")
+
+
+@api_view(["GET", "PUT"])
+@permission_classes((permissions.AllowAny,))
+def upload_chunk(request: Request, upload_id):
+    """`GET` the number of bytes received so far as `offset`.
+    `PUT` the raw bytes of a chunk starting at query parameter `offset`,
+    streamed to disk; chunks may overlap received bytes but not leave gaps."""
+    upload = lookup_upload(upload_id)
+    if upload is None:
+        return Response("Upload not found", HTTP_404_NOT_FOUND)
+    path = upload.part_path()
+    received = path.stat().st_size
+    if request.method == "GET":
+        return Response({"id": upload.id, "offset": received})
+    try:
+        offset = int(request.query_params["offset"])
+    except (KeyError, ValueError):
+        return Response("Query parameter `offset` required.", HTTP_400_BAD_REQUEST)
+    if not 0 <= offset <= received:
+        return Response({"id": upload.id, "offset": received}, HTTP_409_CONFLICT)
+    stream = request.stream
+    with open(path, "r+b") as fd:
+        fd.seek(offset)
+        while stream is not None and (chunk := stream.read(UPLOAD_CHUNK_SIZE)):
+            if fd.tell() + len(chunk) > upload.size:
+                return Response("Chunk exceeds declared size.", HTTP_400_BAD_REQUEST)
+            fd.write(chunk)
+    return Response({"id": upload.id, "offset": path.stat().st_size})
+
 
+@api_view(["POST"])
+@permission_classes((permissions.AllowAny,))
+def complete_upload(request: Request, upload_id):
+    """Verify the size and SHA-256 of a chunked upload and save the model."""
+    upload = lookup_upload(upload_id)
+    if upload is None:
+        return Response("Upload not found", HTTP_404_NOT_FOUND)
+    path = upload.part_path()
+    received = path.stat().st_size
+    if received != upload.size:
+        return Response({"id": upload.id, "offset": received}, HTTP_409_CONFLICT)
+    with open(path, "rb") as fd:
+        digest = file_digest(fd, "sha256").hexdigest()
+    if digest != upload.sha256:
+        logger.error(f"upload: SHA-256 mismatch for `{upload.name}`, restarting.")
+        path.write_bytes(b"")
+        return Response("SHA-256 mismatch, upload restarted.", HTTP_409_CONFLICT)
+    if TFLiteModel.objects.filter(name=upload.name).exists():
+        return Response("Model name used", HTTP_400_BAD_REQUEST)
+    file_name = f"{upload.name}--{upload.file_name}"  # Unique with the name.
+    try:
+        # Save the row first so that a concurrent completion of the same name
+        # cannot overwrite the file of the model that won.
+        with transaction.atomic():
+            register_model(
+                upload.name, file_name, upload.layers_sizes, upload.data_type
+            )
+            os.replace(path, MODEL_FILES_DIR / file_name)
+    except IntegrityError:
+        return Response("Model name used", HTTP_409_CONFLICT)
+    upload.delete()
     return Response("ok")
 
 
+@api_view(["GET"])
+@permission_classes((permissions.AllowAny,))
+def server_utilisation(_: Request):
+    return Response(scheduler.pool.utilisation())
+
+
 @api_view(["POST"])
 @permission_classes((permissions.AllowAny,))
 def store_params(request: Request):
-    server = scheduler.task
-    if server is None:
-        logger.error("No server running but got params to store.")
+    serializer = PostParamsDataSerializer(data=request.data)  # type: ignore
+    if not serializer.is_valid():
+        logger.error(serializer.errors)
+        return Response(serializer.errors, HTTP_400_BAD_REQUEST)
+    session_id = serializer.validated_data["session_id"]  # type: ignore
+    lease = scheduler.pool.find(session_id)
+    if lease is None:
+        logger.error(f"No server running for session {session_id} but got params.")
         return Response("No server running.", HTTP_400_BAD_REQUEST)
     file = file_in_request(request)
     if file is None:
         return Response("No file in request.", HTTP_400_BAD_REQUEST)
-    params = file.file.read()
-    to_save = ModelParams(params=params, tflite_model=server.model)
-    to_save.save()
-    server.update_session_end_time()
+    try:
+        scheduler.save_params(lease.tflite_model, session_id, file.file.read())
+    except ValueError as err:
+        logger.error(err)
+        return Response(str(err), HTTP_400_BAD_REQUEST)
     return Response("ok")
+
+
+def held_params(model_id: int, latest: ModelParams, if_none_match: str):
+    """Earlier parameters of model `model_id` among the versions in
+    `if_none_match` with the layout of `latest`, if any."""
+    versions = [etag.strip('"') for etag in parse_etags(if_none_match)]
+    return (
+        ModelParams.objects.filter(tflite_model_id=model_id, version__in=versions[:8])
+        .exclude(id=latest.id)
+        .last()
+    )
+
+
+@require_GET
+def latest_params(request: HttpRequest, model_id: int):
+    """Latest flat parameters of model `model_id`, with their version as ETag.
+    A client sends the version it holds in `If-None-Match`, and gets 304 if
+    unchanged, a delta against it if it is an earlier version of the model,
+    or else the full parameters; see `X-Params-Encoding`."""
+    latest: ModelParams | None = ModelParams.objects.filter(
+        tflite_model_id=model_id
+    ).last()
+    if latest is None:
+        raise Http404(f"No params for model {model_id}.")
+    etag = f'"{latest.version}"'
+    if_none_match = request.headers.get("If-None-Match")
+    held = None
+    if if_none_match is not None:
+        if etag in parse_etags(if_none_match):
+            response = HttpResponseNotModified()
+            response.headers["ETag"] = etag
+            return response
+        held = held_params(model_id, latest, if_none_match)
+    params = latest.decode_params()
+    content, encoding = encode_params(params), "full"
+    if held is not None and held.layers_sizes == latest.layers_sizes:
+        delta = encode_delta(params, held.decode_params(), PARAMS_DELTA_ENCODING)
+        if len(delta) < len(content):
+            content, encoding = delta, PARAMS_DELTA_ENCODING
+    response = HttpResponse(content, content_type="application/octet-stream")
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Params-Encoding"] = encoding
+    if encoding != "full":
+        response.headers["X-Params-Base"] = held.version  # type: ignore
+    logger.info(
+        f"latest_params: {len(content)} bytes of {encoding} params for model {model_id}."
+    )
+    return response
@@ -0,0 +1,152 @@
+package org.eu.fedcampus.train
+
+import com.google.protobuf.ByteString
+import flwr.android_client.Scalar
+import java.nio.ByteBuffer
+import java.nio.ByteOrder
+import kotlin.math.abs
+import kotlin.math.max
+import kotlin.math.min
+import kotlin.math.roundToInt
+
+/**
+ * Compress fit results as the server offers in the fit config.
+ *
+ * Always change together with `train.compression` in the backend.
+ * @param encoding "float16", "int8" or "topk", also sent as the tensor type.
+ * @param topkRatio Fraction of each layer's update entries sent for "topk".
+ */
+class Compression(val encoding: String, val topkRatio: Double) {
+    /**
+     * Compress [weights] of each layer into a tensor, given the [reference] weights received.
+     * @param residual If not null, added to [weights] before compression,
+     * then replaced by what compression lost, for error feedback.
+     */
+    fun encode(
+        weights: List<FloatArray>, reference: List<FloatArray>, residual: MutableList<FloatArray>?
+    ): List<ByteString> = weights.mapIndexed { index, layer ->
+        val intended = residual?.get(index)?.let { add(layer, it) } ?: layer
+        val bytes = encodeLayer(intended, reference[index])
+        residual?.set(index, subtract(intended, decodeLayer(bytes, reference[index])))
+        ByteString.copyFrom(bytes.array())
+    }
+
+    private fun encodeLayer(layer: FloatArray, reference: FloatArray): ByteBuffer = when (encoding) {
+        "float16" -> littleEndian(layer.size * 2).apply {
+            layer.forEach { putShort(floatToHalf(it)) }
+        }
+
+        "int8" -> {
+            val minimum = layer.minOrNull() ?: 0f
+            val scale = ((layer.maxOrNull() ?: 0f) - minimum) / 255
+            littleEndian(8 + layer.size).apply {
+                putFloat(minimum)
+                putFloat(scale)
+                layer.forEach {
+                    val code = if (scale > 0) ((it - minimum) / scale).roundToInt() else 0
+                    put(code.coerceIn(0, 255).toByte())
+                }
+            }
+        }
+
+        "topk" -> {
+            val update = subtract(layer, reference)
+            val k = min(max(1, (update.size * topkRatio).toInt()), update.size)
+            val indices = update.indices.sortedByDescending { abs(update[it]) }.take(k)
+            littleEndian(k * 8).apply {
+                indices.forEach { putInt(it) }
+                indices.forEach { putFloat(update[it]) }
+            }
+        }
+
+        else -> throw IllegalArgumentException("Unknown compression $encoding.")
+    }
+
+    private fun decodeLayer(buffer: ByteBuffer, reference: FloatArray): FloatArray {
+        buffer.rewind()
+        return when (encoding) {
+            "float16" -> FloatArray(reference.size) { halfToFloat(buffer.getShort()) }
+            "int8" -> {
+                val minimum = buffer.getFloat()
+                val scale = buffer.getFloat()
+                FloatArray(reference.size) { minimum + (buffer.get().toInt() and 0xff) * scale }
+            }
+
+            else -> {
+                val k = buffer.capacity() / 8
+                val indices = IntArray(k) { buffer.getInt() }
+                reference.copyOf().also { weights ->
+                    indices.forEach { weights[it] += buffer.getFloat() }
+                }
+            }
+        }
+    }
+
+    companion object {
+        /**
+         * The compression offered in fit [config], if any.
+         */
+        fun fromConfig(config: Map<String, Scalar>): Compression? {
+            val encoding = config["compression"]?.string ?: return null
+            val topkRatio = config["topk_ratio"]?.double ?: 0.01
+            return Compression(encoding, topkRatio)
+        }
+
+        /**
+         * Whether the server asks for residual error feedback in fit [config].
+         */
+        fun errorFeedback(config: Map<String, Scalar>) = config["error_feedback"]?.bool ?: false
+    }
+}
+
+fun floatsOf(buffer: ByteBuffer): FloatArray {
+    val floats = buffer.duplicate().order(ByteOrder.LITTLE_ENDIAN).apply { rewind() }.asFloatBuffer()
+    return FloatArray(floats.remaining()).also { floats.get(it) }
+}
+
+private fun littleEndian(size: Int) = ByteBuffer.allocate(size).order(ByteOrder.LITTLE_ENDIAN)
+
+private fun add(a: FloatArray, b: FloatArray) = FloatArray(a.size) { a[it] + b[it] }
+
+private fun subtract(a: FloatArray, b: FloatArray) = FloatArray(a.size) { a[it] - b[it] }
+
+/**
+ * IEEE 754 half precision bits of [value], rounding to nearest even.
+ * `android.util.Half` needs API 26.
+ */
+fun floatToHalf(value: Float): Short {
+    val bits = java.lang.Float.floatToRawIntBits(value)
+    val sign = (bits ushr 16) and 0x8000
+    val exponent = ((bits ushr 23) and 0xff) - 127 + 15
+    val mantissa = bits and 0x7fffff
+    if ((bits ushr 23) and 0xff == 0xff) {
+        return (sign or 0x7c00 or (if (mantissa != 0) 0x200 else 0)).toShort()
+    }
+    if (exponent >= 0x1f) return (sign or 0x7c00).toShort()
+    if (exponent <= 0) {
+        if (exponent < -10) return sign.toShort()
+        val shift = 14 - exponent
+        val full = mantissa or 0x800000
+        return (sign or roundShift(full, shift)).toShort()
+    }
+    return (sign or roundShift((exponent shl 23) or mantissa, 13)).toShort()
+}
+
+private fun roundShift(value: Int, shift: Int): Int {
+    val shifted = value ushr shift
+    val rest = value and ((1 shl shift) - 1)
+    val half = 1 shl (shift - 1)
+    return if (rest > half || (rest == half && shifted and 1 == 1)) shifted + 1 else shifted
+}
+
+fun halfToFloat(half: Short): Float {
+    val bits = half.toInt() and 0xffff
+    val sign = (bits and 0x8000) shl 16
+    val exponent = (bits ushr 10) and 0x1f
+    val mantissa = bits and 0x3ff
+    return when (exponent) {
+        0 -> (if (sign != 0) -1f else 1f) * mantissa * 5.9604645e-8f
+        0x1f -> java.lang.Float.intBitsToFloat(sign or 0x7f800000 or (mantissa shl 13))
+        else -> java.lang.Float.intBitsToFloat(sign or ((exponent + 112) shl 23) or (mantissa shl 13))
+    }
+}
@@ -41,6 +41,18 @@ class FlowerServiceRunnable<X : Any, Y : Any> @Throws constructor(
     val finishLatch = CountDownLatch(1)
     val jobs = mutableListOf<Job>()
 
+    /**
+     * What compression lost in the last fit results, when the server asks for error feedback.
+     */
+    private var residual: MutableList<FloatArray>? = null
+
+    /**
+     * Version of the global parameters the client holds, reported to the server when it connects
+     * and confirmed after evaluation.
+     * The server then sends "unchanged" instead of these parameters.
+     */
+    private var heldVersion: String? = train.paramsVersion
+
     val asyncStub = FlowerServiceGrpc.newStub(flowerServerChannel)!!
     val requestObserver = asyncStub.join(object : StreamObserver<ServerMessage> {
         override fun onNext(msg: ServerMessage) = try {
@@ -61,7 +73,9 @@ class FlowerServiceRunnable<X : Any, Y : Any> @Throws constructor(
 
     @Throws
     fun handleMessage(message: ServerMessage) {
-        val clientMessage = if (message.hasGetParametersIns()) {
+        val clientMessage = if (message.hasGetPropertiesIns()) {
+            propertiesResAsProto(heldVersion)
+        } else if (message.hasGetParametersIns()) {
             handleGetParamsIns()
         } else if (message.hasFitIns()) {
             handleFitIns(message)
@@ -88,13 +102,15 @@ class FlowerServiceRunnable<X : Any, Y : Any> @Throws constructor(
         Log.d(TAG, "Handling FitIns")
         callback("Handling Fit request from the server.")
         val start = if (train.telemetry) System.currentTimeMillis() else null
-        val layers = message.fitIns.parameters.tensorsList
-        assertIntsEqual(layers.size, model.layers_sizes.size)
+        val newWeights = receivedWeights(message.fitIns.parameters)
+        // Training changes the weights held.
+        heldVersion = null
         val epochConfig = message.fitIns.configMap.getOrDefault(
             "local_epochs", Scalar.newBuilder().setSint64(1).build()
         )!!
         val epochs = epochConfig.sint64.toInt()
-        val newWeights = weightsFromLayers(layers)
+        val compression = Compression.fromConfig(message.fitIns.configMap)
+        val reference = compression?.let { newWeights.map(::floatsOf) }
         flowerClient.updateParameters(newWeights.toTypedArray())
         flowerClient.fit(epochs, lossCallback = { callback("Average loss: ${it.average()}.") })
         if (start != null) {
@@ -103,7 +119,23 @@ class FlowerServiceRunnable<X : Any, Y : Any> @Throws constructor(
             cleanUpJobs()
             jobs.add(job)
         }
-        return fitResAsProto(weightsByteBuffers(), sampleSize)
+        if (compression == null) {
+            return fitResAsProto(weightsByteBuffers(), sampleSize)
+        }
+        val weights = weightsByteBuffers().map(::floatsOf)
+        val residual = if (Compression.errorFeedback(message.fitIns.configMap)) {
+            residualFor(weights)
+        } else null
+        val tensors = compression.encode(weights, reference!!, residual)
+        return fitResAsProto(tensors, compression.encoding, sampleSize)
+    }
+
+    private fun residualFor(weights: List<FloatArray>): MutableList<FloatArray> {
+        val sizes = residual?.map { it.size }
+        if (sizes != weights.map { it.size }) {
+            residual = weights.map { FloatArray(it.size) }.toMutableList()
+        }
+        return residual!!
     }
 
     @Throws
@@ -111,10 +143,14 @@ class FlowerServiceRunnable<X : Any, Y : Any> @Throws constructor(
         Log.d(TAG, "Handling EvaluateIns")
         callback("Handling Evaluate request from the server")
         val start = if (train.telemetry) System.currentTimeMillis() else null
-        val layers = message.evaluateIns.parameters.tensorsList
-        assertIntsEqual(layers.size, model.layers_sizes.size)
-        val newWeights = weightsFromLayers(layers)
+        val newWeights = receivedWeights(message.evaluateIns.parameters)
         flowerClient.updateParameters(newWeights.toTypedArray())
+        heldVersion = message.evaluateIns.configMap["params_version"]?.string
+        heldVersion?.takeIf { it != train.paramsVersion }?.let { version ->
+            // To sync from when reconnecting, see `Train.syncParams`.
+            val params = flatParams(newWeights)
+            launchJob { withContext(Dispatchers.IO) { train.saveParams(model, version, params) } }
+        }
         val (loss, accuracy) = flowerClient.evaluate()
         callback("Test Accuracy after this round = $accuracy")
         if (start != null) {
@@ -124,7 +160,20 @@ class FlowerServiceRunnable<X : Any, Y : Any> @Throws constructor(
             cleanUpJobs()
             jobs.add(job)
         }
-        return evaluateResAsProto(loss, sampleSize)
+        return evaluateResAsProto(loss, sampleSize, heldVersion)
+    }
+
+    /**
+     * Weights in [parameters], or those held if the server sent "unchanged".
+     */
+    private fun receivedWeights(parameters: Parameters): List<ByteBuffer> {
+        if (parameters.tensorType == UNCHANGED) {
+            if (heldVersion == null) throw Error("Server sent unchanged parameters but none are held.")
+            return weightsByteBuffers().toList()
+        }
+        val layers = parameters.tensorsList
+        assertIntsEqual(layers.size, model.layers_sizes.size)
+        return weightsFromLayers(layers)
     }
 
     private fun weightsByteBuffers() = flowerClient.getParameters()
@@ -161,6 +210,12 @@ class FlowerServiceRunnable<X : Any, Y : Any> @Throws constructor(
 
     companion object {
         private const val TAG = "Flower Service Runnable"
+
+        /**
+         * Tensor type of parameters the server knows the client holds.
+         * Always change together with `train.run.UNCHANGED_PARAMETERS` in the backend.
+         */
+        const val UNCHANGED = "unchanged"
     }
 }
 
@@ -183,9 +238,37 @@ fun fitResAsProto(weights: Array<ByteBuffer>, training_size: Int): ClientMessage
     return ClientMessage.newBuilder().setFitRes(res).build()
 }
 
-fun evaluateResAsProto(accuracy: Float, testing_size: Int): ClientMessage {
-    val res = ClientMessage.EvaluateRes.newBuilder().setLoss(accuracy)
-        .setNumExamples(testing_size.toLong()).build()
+fun fitResAsProto(tensors: List<ByteString>, tensorType: String, training_size: Int): ClientMessage {
+    val p = Parameters.newBuilder().addAllTensors(tensors).setTensorType(tensorType).build()
+    val res =
+        ClientMessage.FitRes.newBuilder().setParameters(p).setNumExamples(training_size.toLong())
+            .build()
+    return ClientMessage.newBuilder().setFitRes(res).build()
+}
+
+/**
+ * @param paramsVersion Version of the parameters held, if any.
+ */
+fun propertiesResAsProto(paramsVersion: String?): ClientMessage {
+    val builder = ClientMessage.GetPropertiesRes.newBuilder()
+    if (paramsVersion != null) {
+        builder.putProperties("params_version", Scalar.newBuilder().setString(paramsVersion).build())
+    }
+    return ClientMessage.newBuilder().setGetPropertiesRes(builder.build()).build()
+}
+
+/**
+ * @param paramsVersion Version of the parameters evaluated, confirmed as held to the server.
+ */
+fun evaluateResAsProto(
+    accuracy: Float, testing_size: Int, paramsVersion: String? = null
+): ClientMessage {
+    val builder = ClientMessage.EvaluateRes.newBuilder().setLoss(accuracy)
+        .setNumExamples(testing_size.toLong())
+    if (paramsVersion != null) {
+        builder.putMetrics("params_version", Scalar.newBuilder().setString(paramsVersion).build())
+    }
+    val res = builder.build()
     return ClientMessage.newBuilder().setEvaluateRes(res).build()
 }
 
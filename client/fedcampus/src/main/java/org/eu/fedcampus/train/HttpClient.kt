@@ -2,11 +2,13 @@ package org.eu.fedcampus.train
 
 import okhttp3.ResponseBody
 import org.eu.fedcampus.train.db.TFLiteModel
+import retrofit2.Response
 import retrofit2.Retrofit
 import retrofit2.converter.gson.GsonConverterFactory
 import retrofit2.create
 import retrofit2.http.*
 import java.io.File
+import java.util.zip.Inflater
 
 class HttpClient constructor(url: String) {
     private val retrofit = Retrofit.Builder()
@@ -59,6 +61,35 @@ class HttpClient constructor(url: String) {
         return postServer.postServer(body)
     }
 
+    interface GetParams {
+        @GET("train/params/{modelId}")
+        suspend fun getParams(
+            @Path("modelId") modelId: Long, @Header("If-None-Match") ifNoneMatch: String?
+        ): Response<ResponseBody>
+    }
+
+    /**
+     * Latest flat parameters of [model], or `null` if they are [heldVersion].
+     * @param held Flat parameters of version [heldVersion], if any,
+     * which the backend may send a delta against.
+     */
+    @Throws
+    suspend fun latestParams(
+        model: TFLiteModel, heldVersion: String?, held: ByteArray?
+    ): Pair<String, ByteArray>? {
+        val ifNoneMatch = if (held != null) heldVersion?.let { "\"$it\"" } else null
+        val response = retrofit.create<GetParams>().getParams(model.id, ifNoneMatch)
+        if (response.code() == 304) return null
+        if (!response.isSuccessful) throw Error("Getting params failed: ${response.code()}.")
+        val version = response.headers()["ETag"]!!.trim('"')
+        val body = response.body()!!.bytes()
+        val params = when (response.headers()["X-Params-Encoding"]) {
+            "xor" -> xorDelta(body, held!!)
+            else -> body
+        }
+        return version to params
+    }
+
     interface FitInsTelemetry {
         @POST("telemetry/fit_ins")
         suspend fun fitInsTelemetry(@Body body: FitInsTelemetryData)
@@ -85,7 +116,9 @@ class HttpClient constructor(url: String) {
 data class PostAdvertisedData(val data_type: String)
 
 // Always change together with Python `train.data.ServerData`.
-data class ServerData(val status: String, val session_id: Int?, val port: Int?)
+data class ServerData(
+    val status: String, val session_id: Int?, val port: Int?, val params_version: String?
+)
 
 data class PostServerData(val id: Long, val start_fresh: Boolean)
 
@@ -107,3 +140,25 @@ data class EvaluateInsTelemetryData(
     val accuracy: Float,
     val test_size: Int
 )
+
+/**
+ * Apply the "xor" delta [blob] from the backend to the flat parameters [held].
+ * Always change together with Python `train.checkpoint.decode_delta`.
+ */
+fun xorDelta(blob: ByteArray, held: ByteArray): ByteArray {
+    val inflater = Inflater()
+    inflater.setInput(blob)
+    val shuffled = ByteArray(held.size)
+    var read = 0
+    while (read < shuffled.size && !inflater.finished()) {
+        read += inflater.inflate(shuffled, read, shuffled.size - read)
+    }
+    inflater.end()
+    if (read != held.size) throw Error("Delta of $read bytes for ${held.size} bytes of params.")
+    val count = held.size / 4
+    // The n-th byte of every float is grouped together.
+    return ByteArray(held.size) { index ->
+        val byte = shuffled[(index % 4) * count + index / 4]
+        (held[index].toInt() xor byte.toInt()).toByte()
+    }
+}
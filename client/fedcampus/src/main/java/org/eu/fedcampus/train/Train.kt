@@ -7,6 +7,7 @@ import kotlinx.coroutines.*
 import org.eu.fedcampus.train.db.TFLiteModel
 import retrofit2.http.*
 import java.io.File
+import java.nio.ByteBuffer
 import java.nio.MappedByteBuffer
 import kotlin.properties.Delegates
 
@@ -16,6 +17,14 @@ class Train<X : Any, Y : Any> constructor(
     val sampleSpec: SampleSpec<X, Y>,
 ) {
     var sessionId: Int? = null
+    var serverData: ServerData? = null
+        private set
+
+    /**
+     * Version of the flat parameters saved for the model, see [syncParams].
+     */
+    var paramsVersion: String? = null
+        private set
     var telemetry = false
         private set
     var deviceId by Delegates.notNull<Long>()
@@ -92,6 +101,7 @@ class Train<X : Any, Y : Any> constructor(
     private suspend fun doGetServerInfo(model: TFLiteModel, start_fresh: Boolean): ServerData {
         val serverData = client.postServer(model, start_fresh)
         sessionId = serverData.session_id
+        this.serverData = serverData
         Log.i(TAG, "Server data: $serverData")
         return serverData
     }
@@ -131,6 +141,14 @@ class Train<X : Any, Y : Any> constructor(
         model: TFLiteModel
     ): FlowerClient<X, Y> {
         val flowerClient = FlowerClient(buffer, model, sampleSpec)
+        if (serverData?.params_version != null) {
+            // Not fresh: start from the latest parameters rather than download them over gRPC.
+            try {
+                syncParams(flowerClient, model)
+            } catch (err: Throwable) {
+                Log.w(TAG, "Syncing parameters failed: $err.")
+            }
+        }
         val channel = withContext(Dispatchers.IO) {
             createChannel(address, useTLS)
         }
@@ -138,6 +156,39 @@ class Train<X : Any, Y : Any> constructor(
         return flowerClient
     }
 
+    /**
+     * Load the latest parameters of [model] into [flowerClient] from the backend,
+     * as a delta against the parameters saved by [saveParams] if any, or not at all if unchanged.
+     * The Flower server then does not send them again, see [FlowerServiceRunnable].
+     */
+    @Throws
+    suspend fun syncParams(flowerClient: FlowerClient<X, Y>, model: TFLiteModel) =
+        withContext(Dispatchers.IO) {
+            val paramsFile = File(model.getModelDir(context), PARAMS_FILE)
+            val versionFile = File(model.getModelDir(context), PARAMS_VERSION_FILE)
+            val saved = if (paramsFile.exists() && versionFile.exists()) {
+                versionFile.readText() to paramsFile.readBytes()
+            } else null
+            val (version, params) =
+                client.latestParams(model, saved?.first, saved?.second) ?: saved!!
+            flowerClient.updateParameters(layersOf(params, model.layers_sizes))
+            if (version != saved?.first) {
+                saveParams(model, version, params)
+            }
+            paramsVersion = version
+            Log.i(TAG, "Synced parameters version $version.")
+        }
+
+    /**
+     * Save flat parameters [params] of [model] confirmed by the server as [version].
+     */
+    @Throws
+    fun saveParams(model: TFLiteModel, version: String, params: ByteArray) {
+        File(model.getModelDir(context), PARAMS_FILE).writeBytes(params)
+        File(model.getModelDir(context), PARAMS_VERSION_FILE).writeText(version)
+        paramsVersion = version
+    }
+
     /**
      * Only call this after loading training data into the Flower Client.
      */
@@ -206,5 +257,27 @@ class Train<X : Any, Y : Any> constructor(
     companion object {
         const val TAG = "Train"
         const val downloadModelFileTag = "Download TFLite model"
+        const val PARAMS_FILE = "params.bin"
+        const val PARAMS_VERSION_FILE = "params_version"
+    }
+}
+
+/**
+ * Split flat parameters [params] into layers of [layersSizes] bytes.
+ */
+fun layersOf(params: ByteArray, layersSizes: IntArray): Array<ByteBuffer> {
+    var offset = 0
+    return Array(layersSizes.size) { index ->
+        val size = layersSizes[index]
+        ByteBuffer.wrap(params.copyOfRange(offset, offset + size)).also { offset += size }
     }
 }
+
+/**
+ * Concatenate [layers] into flat parameters, as the backend stores them.
+ */
+fun flatParams(layers: List<ByteBuffer>): ByteArray {
+    val flat = ByteBuffer.allocate(layers.sumOf { it.remaining() })
+    layers.forEach { flat.put(it.duplicate()) }
+    return flat.array()
+}
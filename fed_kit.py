@@ -8,26 +8,113 @@ response = fed_kit.upload("test.tflite", "test_model", [100, 200, 300], "test_ty
 print(response)
 print(response.text)
 ```
+
+Uploads are sent in chunks and resumed after failures.
+To resume an upload interrupted in an earlier session, pass its `upload_id`
+(printed by the default progress callback) to `upload`.
 """
+import os
+from hashlib import sha256
+from time import sleep
+from typing import Callable
+
 import requests
 
 DEFAULT_URL = "http://localhost:8000/"
 
+CHUNK_SIZE = 8 * 1024 * 1024
+
+RETRIES = 5
+
+RETRY_BACKOFF = 1.0
+"""Seconds to wait after the first failure, doubled after each failure in a row."""
+
+MAX_RETRY_BACKOFF = 60.0
+
+
+def print_progress(upload_id: str, sent: int, total: int):
+    print(f"Upload {upload_id}: {sent}/{total} bytes.")
+
+
+def file_sha256(file: str) -> str:
+    digest = sha256()
+    with open(file, "rb") as fd:
+        while chunk := fd.read(CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# Always change together with `StartUploadDataSerializer` in `train.serializers`.
+def upload_offset(chunk_url: str) -> int:
+    """Bytes of the upload at `chunk_url` the backend holds."""
+    response = requests.get(chunk_url)
+    if response.status_code == 404:
+        raise ValueError(f"No upload at {chunk_url}, unknown or expired.")
+    response.raise_for_status()
+    return response.json()["offset"]
+
 
-# Always change together with `UploadDataSerializer` in `train.serializers`.
 def upload(
     file: str,
     name: str,
     layers_sizes: list[int],
     data_type: str,
     base: str = DEFAULT_URL,
+    chunk_size: int = CHUNK_SIZE,
+    progress: Callable[[str, int, int], None] | None = print_progress,
+    upload_id: str | None = None,
+    retries: int = RETRIES,
 ):
-    """Upload model `file` and store it as `name` on the backend."""
-    url = base + "/train/upload"
-    files = {"file": open(file, "rb")}
-    data = {
-        "name": name,
-        "layers_sizes": layers_sizes,
-        "data_type": data_type,
-    }
-    return requests.post(url, data=data, files=files)
+    """Upload model `file` and store it as `name` on the backend.
+    Send it in chunks of `chunk_size` bytes, calling `progress` with the
+    upload id, bytes sent and total bytes after each chunk.
+    Resume from the offset the backend reports after a failed request,
+    up to `retries` times in a row with exponential backoff,
+    or resume upload `upload_id`; raise `ValueError` if it is unknown."""
+    url = base + "/train/upload/chunked"
+    size = os.path.getsize(file)
+    if upload_id is None:
+        data = {
+            "name": name,
+            "layers_sizes": layers_sizes,
+            "data_type": data_type,
+            "file_name": os.path.basename(file),
+            "size": size,
+            "sha256": file_sha256(file),
+        }
+        response = requests.post(url, json=data)
+        if not response.ok:
+            return response
+        upload_id = response.json()["id"]
+    chunk_url = f"{url}/{upload_id}"
+    # Asked from the backend at first and after each failure.
+    offset: int | None = None
+    failures = 0
+    with open(file, "rb") as fd:
+        while offset is None or offset < size:
+            try:
+                if offset is None:
+                    offset = upload_offset(chunk_url)
+                    continue
+                fd.seek(offset)
+                chunk = fd.read(chunk_size)
+                response = requests.put(
+                    chunk_url,
+                    params={"offset": offset},
+                    data=chunk,
+                    headers={"Content-Type": "application/octet-stream"},
+                )
+                if response.status_code not in (200, 409):
+                    return response
+                offset = response.json()["offset"]
+                failures = 0
+            except requests.RequestException:
+                failures += 1
+                if failures > retries:
+                    raise
+                sleep(min(RETRY_BACKOFF * 2 ** (failures - 1), MAX_RETRY_BACKOFF))
+                offset = None
+                continue
+            if progress is not None:
+                progress(upload_id, offset, size)  # type: ignore
+    return requests.post(f"{chunk_url}/complete")